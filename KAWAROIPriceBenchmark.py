@@ -0,0 +1,277 @@
+import sys
+import os
+import json
+import random
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+import platform
+
+import KAWAROIPriceCalculator as calc
+
+# size of the synthetic universe at scale 1, roughly the real one
+BASE_MATERIAL_COUNT = 350
+BASE_BUILDING_COUNT = 90
+BASE_PLANET_COUNT = 2000
+TIER_COUNT = 6
+
+# materials the calculator refers to by ticker: building materials, planet specific materials and consumables
+BUILDING_MATERIALS = ['BBH', 'BDE', 'BSE', 'BTA', 'LBH', 'LDE', 'LSE', 'LTA', 'TRU', 'PSL']
+PLANET_MATERIALS = ['MCG', 'AEF', 'SEA', 'INS', 'HSE', 'TSH', 'BL', 'MGC']
+CONSUMABLES = sorted(set(item['mat'] for basket in calc.WORKFORCE_BASKETS.values() for item in basket))
+HABITATION_BUILDINGS = [('HB1', 10), ('HB2', 10), ('HB3', 10), ('HB4', 10), ('HB5', 10), ('HBB', 14), ('HBC', 14), ('HBM', 14), ('HBL', 14), ('CM', 0)]
+POPULATION_FIELDS = ['Pioneers', 'Settlers', 'Technicians', 'Engineers', 'Scientists']
+
+def format_recipe_name(building_ticker, inputs, outputs):
+    return '{}:{}=>{}'.format(building_ticker, '-'.join('{}x{}'.format(item['Amount'], item['Ticker']) for item in inputs), '-'.join('{}x{}'.format(item['Amount'], item['Ticker']) for item in outputs))
+
+def generate_building(ticker, rng, populations, area_cost, building_materials):
+    building = {'Ticker': ticker, 'Name': ticker.lower(), 'AreaCost': area_cost, 'Expertise': None}
+    for field, population in zip(POPULATION_FIELDS, populations):
+        building[field] = population
+    building['BuildingCosts'] = [{'CommodityTicker': ticker, 'CommodityName': ticker.lower(), 'Amount': rng.randint(1, 4)} for ticker in building_materials]
+    return building
+
+def generate_universe(scale = 1, seed = 1):
+    # Synthetic buildings, recipes, materials and planets in the schema of query_FNAR_REST_list (keyed the same way),
+    # plus recipe selections for them.  Materials are produced in tiers from lower tiers only, so apart from the
+    # building and planet materials feeding back through repair and profit costs the cost system is acyclic like the
+    # real one.
+    rng = random.Random(seed)
+    material_count = max(BASE_MATERIAL_COUNT*scale, len(BUILDING_MATERIALS) + len(PLANET_MATERIALS) + len(CONSUMABLES) + 40)
+    building_count = max(int(BASE_BUILDING_COUNT*scale), 10)
+    planet_count = max(int(BASE_PLANET_COUNT*scale), 10)
+
+    special = BUILDING_MATERIALS + PLANET_MATERIALS + CONSUMABLES
+    tickers = special + ['M{}'.format(n) for n in range(int(material_count) - len(special))]
+    generic = tickers[len(special):]
+    rng.shuffle(generic)
+    raw_count = max(len(generic)//7, 8)
+    raw = generic[:raw_count]
+    tiers = [raw] + [[] for tier in range(TIER_COUNT - 1)]
+    for ticker in generic[raw_count:]:
+        tiers[rng.randint(1, TIER_COUNT - 1)].append(ticker)
+    for ticker in BUILDING_MATERIALS + PLANET_MATERIALS:
+        tiers[rng.randint(2, 3)].append(ticker)
+    for ticker in CONSUMABLES:
+        tiers[rng.randint(1, 3)].append(ticker)
+
+    materials = {}
+    for ticker in tickers:
+        materials[ticker] = {'Ticker': ticker, 'MaterialId': 'id-{}'.format(ticker), 'Name': ticker.lower(), 'CategoryName': 'synthetic', 'Weight': round(rng.uniform(0.01, 2), 3), 'Volume': round(rng.uniform(0.01, 2), 3)}
+
+    buildings = {}
+    production = []
+    for n in range(building_count):
+        ticker = 'P{}'.format(n)
+        populations = [0]*5
+        level = rng.choice([0, 0, 0, 1, 1, 2, 3, 4])
+        populations[level] = rng.choice([10, 20, 30, 40])
+        if level < 4 and rng.random() < 0.4:
+            populations[level + 1] = rng.choice([5, 10, 20])
+        buildings[ticker] = generate_building(ticker, rng, populations, rng.randint(10, 40), rng.sample(BUILDING_MATERIALS, rng.randint(2, 4)))
+        production.append(ticker)
+    for ticker, level in [('COL', 0), ('EXT', 0), ('RIG', 0)]:
+        buildings[ticker] = generate_building(ticker, rng, [rng.choice([30, 40, 50]), 0, 0, 0, 0], rng.randint(15, 25), rng.sample(BUILDING_MATERIALS, 3))
+    for ticker, area_cost in HABITATION_BUILDINGS:
+        buildings[ticker] = generate_building(ticker, rng, [0]*5, area_cost, ['LBH', 'LSE'])
+
+    recipes = {}
+    for ticker in ['COL', 'EXT', 'RIG']:
+        name = format_recipe_name(ticker, [], [])
+        recipes[name] = {'BuildingTicker': ticker, 'RecipeName': name, 'StandardRecipeName': name, 'Inputs': [], 'Outputs': [], 'TimeMs': 4*60*60*1000}
+    recipe_options = {}
+    for tier in range(1, TIER_COUNT):
+        lower = [ticker for lower_tier in tiers[:tier] for ticker in lower_tier]
+        for ticker in tiers[tier]:
+            for option in range(rng.choice([1, 1, 1, 2, 3])):
+                output_amount = rng.randint(1, 4)
+                input_tickers = rng.sample(lower, min(len(lower), rng.randint(1, 3)))
+                inputs = [{'Ticker': input_ticker, 'Amount': max(1, int(rng.uniform(0.2, 1.2)*output_amount/len(input_tickers) + 0.5))} for input_ticker in input_tickers]
+                outputs = [{'Ticker': ticker, 'Amount': output_amount}]
+                building_ticker = rng.choice(production)
+                name = format_recipe_name(building_ticker, inputs, outputs)
+                if name in recipes:
+                    continue
+                recipes[name] = {'BuildingTicker': building_ticker, 'RecipeName': name, 'StandardRecipeName': name, 'Inputs': inputs, 'Outputs': outputs, 'TimeMs': rng.randint(2, 24)*60*1000}
+                recipe_options.setdefault(ticker, []).append(name)
+
+    resource_types = {ticker: rng.choice(['MINERAL', 'MINERAL', 'GASEOUS', 'LIQUID']) for ticker in raw}
+    planets = {}
+    best_planet = {}
+    for n in range(planet_count):
+        planet_id = '{}-{:03d}{}'.format(''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for letter in range(2)), n % 1000, 'abcdefghij'[(n//1000) % 10]) + ('' if n < 10000 else str(n//10000))
+        resources = []
+        for ticker in rng.sample(raw, min(len(raw), rng.randint(1, 5))):
+            factor = rng.uniform(0.05, 0.5)
+            resources.append({'MaterialId': materials[ticker]['MaterialId'], 'ResourceType': resource_types[ticker], 'Factor': factor})
+            if ticker not in best_planet or factor > best_planet[ticker][1]:
+                best_planet[ticker] = (planet_id, factor)
+        requirements = [{'MaterialTicker': ticker, 'MaterialAmount': 1} for ticker in ['LSE', 'LTA', 'LDE']]
+        requirements.append({'MaterialTicker': 'MCG' if rng.random() < 0.5 else rng.choice(['AEF', 'SEA', 'INS']), 'MaterialAmount': 1})
+        if rng.random() < 0.3:
+            requirements.append({'MaterialTicker': rng.choice(['HSE', 'TSH', 'BL', 'MGC']), 'MaterialAmount': 1})
+        planets[planet_id] = {'PlanetNaturalId': planet_id, 'PlanetName': planet_id, 'Resources': resources, 'BuildRequirements': requirements}
+    # every raw material needs at least one planet
+    planet_ids = list(planets.keys())
+    for ticker in raw:
+        if ticker not in best_planet:
+            planet_id = rng.choice(planet_ids)
+            planets[planet_id]['Resources'].append({'MaterialId': materials[ticker]['MaterialId'], 'ResourceType': resource_types[ticker], 'Factor': 0.3})
+            best_planet[ticker] = (planet_id, 0.3)
+
+    recipe_selections = {}
+    for ticker in tickers:
+        if ticker in best_planet:
+            recipe_selections[ticker] = best_planet[ticker][0]
+        else:
+            recipe_selections[ticker] = recipe_options[ticker][0]
+            recipe_selections[ticker + '_options'] = ','.join(recipe_options[ticker])
+    return buildings, recipes, materials, planets, recipe_selections
+
+def time_call(function, repeat):
+    # min and median wall time of repeated calls, and the result of the last one
+    times = []
+    result = None
+    for n in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start_time)
+    return {'min': min(times), 'median': statistics.median(times), 'repeat': repeat}, result
+
+def benchmark_population_cost(count = 100000):
+    costs = [calc.PopulationCost(n, 2*n, 3*n, 4*n, 5*n) for n in range(100)]
+    def run():
+        total = calc.PopulationCost()
+        for n in range(count):
+            total = total + costs[n % 100]*0.5 - costs[(n + 1) % 100]/4
+        return total
+    return run
+
+def benchmark_total_cost(material_costs, material_info, buildings, base_setups, input_costs, repair_costs, desired_profit):
+    quantity_table = calc.BuildQuantityTable(buildings, base_setups)
+    def run():
+        for material, info in material_info.items():
+            recipe = info['recipe']
+            quantities = quantity_table.get(recipe['BuildingTicker'], info['planet_mats'])
+            calc.calculate_total_cost(material, info['output'], recipe['Inputs'], quantities, recipe['TimeMs'], material_costs, input_costs, repair_costs, desired_profit, material_costs[material])
+    return run
+
+def benchmark_base_setups(buildings):
+    def run():
+        for ticker in buildings.keys():
+            calc.calculate_single_building_base_setup(ticker, buildings, calc.BASE_AREA_LIMIT, {})
+    return run
+
+def run_benchmarks(scale, solvers, repeat, seed = 1):
+    results = {}
+    start_time = time.perf_counter()
+    buildings, recipes, materials, planets, recipe_selections = generate_universe(scale, seed)
+    results['generate'] = {'min': time.perf_counter() - start_time, 'median': time.perf_counter() - start_time, 'repeat': 1}
+    sizes = {'buildings': len(buildings), 'recipes': len(recipes), 'materials': len(materials), 'planets': len(planets), 'resources': sum(len(planet['Resources']) for planet in planets.values())}
+    print('Synthetic universe at scale {}: {}'.format(scale, sizes))
+
+    materials_byID = calc.index_materials(recipes, materials, planets)
+    results['base setups'], base_setups = time_call(lambda: calc.calculate_base_setups(buildings, calc.BASE_AREA_LIMIT, {}), repeat)
+    results['initialize material costs'], (material_costs, material_info) = time_call(lambda: calc.initialize_material_costs(materials, recipes, planets, buildings, materials_byID, recipe_selections), repeat)
+
+    # micro benchmarks
+    results['PopulationCost arithmetic (100k)'], result = time_call(benchmark_population_cost(), repeat)
+    results['calculate_single_building_base_setup (all buildings)'], result = time_call(benchmark_base_setups(buildings), repeat)
+
+    # end to end: material solve with every requested solver, then the output stages on the last solution
+    solved = None
+    for solver in solvers:
+        if solver == 'direct':
+            solve = lambda: calc.solve_material_costs_direct(material_costs, material_info, buildings, base_setups)
+        elif solver == 'scc':
+            solve = lambda: calc.solve_material_costs_scc(material_costs, material_info, buildings, base_setups)
+        elif solver in ['jacobi', 'colored']:
+            solve = lambda: calc.solve_material_costs_jacobi(material_costs, material_info, buildings, base_setups, solver)
+        else:
+            def solve():
+                zero = lambda: {material: calc.PopulationCost() for material in material_costs.keys()}
+                return calc.solve_material_costs_iterative(material_costs, material_info, buildings, base_setups, zero(), zero(), zero(), zero())
+        results['material solve ({})'.format(solver)], solution = time_call(solve, repeat)
+        results['material solve ({})'.format(solver)]['residual'] = solution[4]['residual']
+        results['material solve ({})'.format(solver)]['iterations'] = solution[4]['iterations']
+        solved = solution
+    input_costs, repair_costs, desired_profit, total_costs = [table.to_dict() if isinstance(table, calc.PopulationCostTable) else table for table in solved[:4]]
+
+    results['calculate_total_cost (all materials)'], result = time_call(benchmark_total_cost(material_costs, material_info, buildings, base_setups, input_costs, repair_costs, desired_profit), repeat)
+    results['workforce costs'], workforce_costs = time_call(lambda: calc.calculate_workforce_costs(total_costs), repeat)
+    results['material rows'], material_rows = time_call(lambda: calc.calculate_material_cost_rows(material_costs, input_costs, repair_costs, desired_profit, total_costs), repeat)
+    results['recipe rows'], recipe_rows = time_call(lambda: calc.calculate_recipe_cost_rows(recipes, buildings, base_setups, material_costs, input_costs, repair_costs, desired_profit), repeat)
+    results['natural resource rows'], natural_resource_rows = time_call(lambda: calc.calculate_natural_resource_cost_rows(planets, recipes, buildings, base_setups, materials_byID, material_costs, input_costs, repair_costs, desired_profit), repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        def write():
+            with calc.create_price_writer('csv', directory) as writer:
+                calc.write_price_tables(writer, workforce_costs, material_rows.items(), recipe_rows.items(), natural_resource_rows.items())
+        results['write csv'], result = time_call(write, repeat)
+    return sizes, results
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_results(results_file):
+    if not os.path.isfile(results_file):
+        return []
+    with open(results_file, 'rt') as file:
+        return json.load(file)
+
+def find_baseline(runs, scale, commit = None):
+    # latest earlier run at the same scale, of the given commit if there is one
+    for run in reversed(runs):
+        if run['scale'] == scale and (commit is None or run['commit'] == commit):
+            return run
+    return None
+
+def print_results(results, baseline = None):
+    if baseline is not None:
+        print('Compared with commit {} from {}'.format(baseline['commit'], baseline['date']))
+    for name, result in results.items():
+        line = '{:<55} {:>10.4f} s (median {:.4f} s)'.format(name, result['min'], result['median'])
+        if baseline is not None and name in baseline['results'] and baseline['results'][name]['min'] > 0:
+            line = line + '  x{:.2f}'.format(result['min']/baseline['results'][name]['min'])
+        print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='KAWA ROI price calculator benchmarks on synthetic FNAR data')
+    parser.add_argument('--scale', type=float, default=1, help='size of the synthetic universe relative to the real one, e.g. 10 or 100')
+    parser.add_argument('--solvers', default='scc,direct,iterative', help='comma separated material solvers to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every benchmark, the fastest one counts')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the synthetic universe')
+    parser.add_argument('--results', default='benchmark_results.json', help='JSON file every run is appended to')
+    parser.add_argument('--compare', default=None, metavar='COMMIT', help='compare with the latest saved run of this commit (default: the latest saved run)')
+    parser.add_argument('--no-save', action='store_true', help='do not append this run to the results file')
+    parser.add_argument('--generate', default=None, metavar='DIRECTORY', help='only write the synthetic data as buildings/recipes/materials/planets JSON lists and material_selections.json')
+    args = parser.parse_args()
+
+    if args.generate:
+        buildings, recipes, materials, planets, recipe_selections = generate_universe(args.scale, args.seed)
+        os.makedirs(args.generate, exist_ok=True)
+        for name, items in [('buildings', buildings), ('recipes', recipes), ('materials', materials), ('planets', planets)]:
+            with open(os.path.join(args.generate, name + '.json'), 'w') as file:
+                json.dump(list(items.values()), file)
+        with open(os.path.join(args.generate, 'material_selections.json'), 'w') as file:
+            json.dump(recipe_selections, file, indent=1)
+        sys.exit()
+
+    solvers = [solver for solver in args.solvers.split(',') if solver]
+    unknown = [solver for solver in solvers if solver not in ['scc', 'direct', 'iterative', 'jacobi', 'colored']]
+    if unknown:
+        print('ERROR: unknown solvers: {}'.format(', '.join(unknown)))
+        sys.exit(1)
+    sizes, results = run_benchmarks(args.scale, solvers, args.repeat, args.seed)
+
+    runs = load_results(args.results)
+    print_results(results, find_baseline(runs, args.scale, args.compare))
+    if not args.no_save:
+        runs.append({'commit': get_commit(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(), 'scale': args.scale, 'seed': args.seed, 'sizes': sizes, 'results': results})
+        with open(args.results, 'w') as file:
+            json.dump(runs, file, indent=1)
@@ -1,25 +1,128 @@
 import sys
 import urllib
 import urllib.request
+import urllib.error
+import http.client
+import gzip
+import codecs
+import concurrent.futures
 import json
 import pickle
 import os
 import math
+import heapq
+import argparse
+import array
+import time
+import sqlite3
+import multiprocessing
+import contextlib
+import io
+import csv
+import threading
+import http.server
+import urllib.parse
+import itertools
+import atexit
+import cProfile
+import pstats
+import hashlib
+import random
 
 DAY_TIME_MS = 24*60*60*1000
 REPAIR_PERIOD_DAYS = 60
 REPAIR_PERIOD_MS = REPAIR_PERIOD_DAYS*DAY_TIME_MS
 ROI_PERIOD_DAYS = 30
 ROI_PERIOD_MS = ROI_PERIOD_DAYS*DAY_TIME_MS
+BASE_AREA_LIMIT = 500
+PIONEER_COST = 2.0e-7 # currency per pioneer per ms, anchors all workforce costs
+
+# memoized base layouts, see calculate_single_building_base_setup.  The version is part of every memo key, so
+# layouts stored by an older search are not reused.
+BASE_LAYOUT_VERSION = 2
+base_layout_cache = {}
+
+class Instrumentation:
+    # Stage timers, call counters and per-iteration convergence traces of a run, exported as JSON.
+    # Everything is off by default: stage() then only yields, and call sites check .tracing before building a trace.
+    def __init__(self):
+        self.enabled = False
+        self.print_traces = False
+        self.tracing = False
+        self.stages = []
+        self.counters = {}
+        self.traces = {}
+        self.results = {}
+
+    def configure(self, enabled = False, print_traces = False, count_calls = False):
+        self.enabled = enabled
+        self.print_traces = print_traces
+        self.tracing = enabled or print_traces
+        if count_calls:
+            self.count_calls()
+
+    def count_calls(self):
+        # Wrap calculate_total_cost and PopulationCost.__init__ with counters.  Done only on request, so the
+        # uninstrumented hot path stays untouched.
+        module = sys.modules[__name__]
+        counters = self.counters
+        counters.setdefault('calculate_total_cost', 0)
+        counters.setdefault('PopulationCost', 0)
+        total_cost_function = module.calculate_total_cost
+        population_cost_init = PopulationCost.__init__
+
+        def counted_calculate_total_cost(*args, **kwargs):
+            counters['calculate_total_cost'] += 1
+            return total_cost_function(*args, **kwargs)
+
+        def counted_population_cost_init(self, *args, **kwargs):
+            counters['PopulationCost'] += 1
+            population_cost_init(self, *args, **kwargs)
+
+        module.calculate_total_cost = counted_calculate_total_cost
+        PopulationCost.__init__ = counted_population_cost_init
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            self.stages.append({'stage': name, 'wall': time.perf_counter() - wall_start, 'cpu': time.process_time() - cpu_start})
+
+    def trace(self, name, message, **record):
+        if self.enabled:
+            self.traces.setdefault(name, []).append(record)
+        if self.print_traces:
+            print(message.format(**record))
+
+    def record(self, name, value):
+        if self.enabled:
+            self.results[name] = value
+
+    def to_dict(self):
+        return {'stages': self.stages, 'counters': self.counters, 'traces': self.traces, 'results': self.results}
+
+    def write_json(self, filename):
+        with open(filename, 'w') as file:
+            json.dump(self.to_dict(), file, indent=1, default=str)
+
+instrumentation = Instrumentation()
 
 class PopulationCost:
+    # Per material metadata (recipe, output, planet materials) lives in a separate material_info table
+    __slots__ = ('Pioneer', 'Settler', 'Technician', 'Engineer', 'Scientist')
+
     def __init__(self, pioneer = 0, settler = 0, technician = 0, engineer = 0, scientist = 0):
         self.Pioneer = pioneer
         self.Settler = settler
         self.Technician = technician
         self.Engineer = engineer
         self.Scientist = scientist
-        self.Extras = {}
     
     def __add__(self, other):
         pioneer = self.Pioneer + other.Pioneer
@@ -76,17 +179,419 @@ class PopulationCost:
     def __str__(self):
         return '({},{},{},{},{})'.format(self.Pioneer, self.Settler, self.Technician, self.Engineer, self.Scientist)
 
-def query_FNAR_REST_list(url, key_field):
+class PopulationCostTable:
+    # Population costs of many materials stored as one flat (N x 5) array of doubles
+    def __init__(self, keys, values = None):
+        self.key_list = list(keys)
+        self.index = {key: n for n, key in enumerate(self.key_list)}
+        if values is None:
+            self.values = array.array('d', bytes(8*5*len(self.key_list)))
+        else:
+            self.values = array.array('d', values)
+        if len(self.values) != 5*len(self.key_list):
+            raise Exception('Error in PopulationCostTable.  {} values given for {} keys.'.format(len(self.values), len(self.key_list)))
+
+    @classmethod
+    def from_dict(cls, costs, keys = None):
+        if keys is None:
+            keys = costs.keys()
+        table = cls(keys)
+        for n, key in enumerate(table.key_list):
+            table.set_row(n, population_cost_to_list(costs[key]))
+        return table
+
+    def to_dict(self):
+        return {key: self[key] for key in self.key_list}
+
+    def keys(self):
+        return self.key_list
+
+    def items(self):
+        return [(key, self[key]) for key in self.key_list]
+
+    def __len__(self):
+        return len(self.key_list)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def row(self, n):
+        return self.values[5*n:5*n + 5].tolist()
+
+    def reorder(self, keys):
+        # the same rows in the order of keys
+        values = self.values
+        return PopulationCostTable(keys, [value for key in keys for value in values[5*self.index[key]:5*self.index[key] + 5]])
+
+    def set_row(self, n, row):
+        self.values[5*n:5*n + 5] = array.array('d', row)
+
+    def to_currency(self, workforce_costs):
+        # One currency value per row: the (N x 5) table times the workforce cost vector
+        PIOc, SETc, TECc, ENGc, SCIc = workforce_costs
+        values = self.values
+        return array.array('d', [pio*PIOc + sett*SETc + tec*TECc + eng*ENGc + sci*SCIc for pio, sett, tec, eng, sci in zip(values[0::5], values[1::5], values[2::5], values[3::5], values[4::5])])
+
+    def __getitem__(self, key):
+        return PopulationCost(*self.row(self.index[key]))
+
+    def __setitem__(self, key, population_cost):
+        self.set_row(self.index[key], population_cost_to_list(population_cost))
+
+    def __add__(self, other):
+        return PopulationCostTable(self.key_list, [a + b for a, b in zip(self.values, other.values)])
+
+    def __sub__(self, other):
+        return PopulationCostTable(self.key_list, [a - b for a, b in zip(self.values, other.values)])
+
+    def __mul__(self, scaler):
+        return PopulationCostTable(self.key_list, [a*scaler for a in self.values])
+
+    __rmul__ = __mul__
+
+    def scale_rows(self, scalers):
+        # multiply each row by its own scaler, given as a list in row order
+        values = self.values
+        return PopulationCostTable(self.key_list, [values[n]*scalers[n//5] for n in range(len(values))])
+
+    def combine(self, coefficients, keys = None):
+        # out[i] = sum_j coefficients[i][j]*self[j] for sparse coefficient rows {key_i: {key_j: coefficient}}
+        if keys is None:
+            keys = coefficients.keys()
+        table = PopulationCostTable(keys)
+        values = self.values
+        index = self.index
+        for n, key in enumerate(table.key_list):
+            p = s = t = e = c = 0.0
+            for mat_ticker, coefficient in coefficients[key].items():
+                m = 5*index[mat_ticker]
+                p += coefficient*values[m]
+                s += coefficient*values[m + 1]
+                t += coefficient*values[m + 2]
+                e += coefficient*values[m + 3]
+                c += coefficient*values[m + 4]
+            table.set_row(n, (p, s, t, e, c))
+        return table
+
+    def max_abs(self):
+        return max((abs(a) for a in self.values), default=0)
+
+def iterate_json_array(stream, chunk_size = 1 << 16):
+    # Yield the items of a top level JSON array read from a binary stream, one chunk at a time
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = stream.read(chunk_size)
+        final = not chunk
+        buffer = buffer[position:] + text_decoder.decode(chunk, final)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position = position + 1
+            if position >= len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError('expected a JSON array')
+                started = True
+                position = position + 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break
+            if not final and (end == len(buffer) or buffer[end] not in ' \t\r\n,]'):
+                # a number cut off at the end of the buffer may continue in the next chunk
+                break
+            yield item
+            position = end
+        if final:
+            raise ValueError('unexpected end of JSON array')
+
+def fetch_FNAR_dataset(base_url, path, key_field, validators = None, timeout = 60, retries = 4, backoff_seconds = 1.0):
     # documentation: https://doc.fnar.net/
-    out_dictionary = {}
-    with urllib.request.urlopen(url) as query_response:
-        query_list = json.loads(query_response.read())
-        for item in query_list:
-            if item[key_field] in out_dictionary:
-                print('Found duplicate {} from {}: {}'.format(key_field, url, item[key_field]))
-            out_dictionary[item[key_field]] = item
+    # Download one FNAR list as {key: item}.  Sends gzip and conditional request headers, retries failed requests
+    # with exponential backoff and returns None for the items when the server reports the stored copy as current.
+    url = base_url.rstrip('/') + path
+    headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip'}
+    if validators is None:
+        validators = {'etag': None, 'last_modified': None}
+    if validators['etag']:
+        headers['If-None-Match'] = validators['etag']
+    if validators['last_modified']:
+        headers['If-Modified-Since'] = validators['last_modified']
+    for attempt in range(retries + 1):
+        try:
+            request = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(request, timeout=timeout) as query_response:
+                stream = query_response
+                if query_response.headers.get('Content-Encoding', '').lower() == 'gzip':
+                    stream = gzip.GzipFile(fileobj=query_response)
+                out_dictionary = {}
+                for item in iterate_json_array(stream):
+                    if item[key_field] in out_dictionary:
+                        print('Found duplicate {} from {}: {}'.format(key_field, url, item[key_field]))
+                    out_dictionary[item[key_field]] = item
+                return out_dictionary, query_response.headers.get('ETag'), query_response.headers.get('Last-Modified')
+        except urllib.error.HTTPError as error:
+            if error.code == 304:
+                return None, validators['etag'], validators['last_modified']
+            if (error.code < 500 and error.code != 429) or attempt == retries:
+                raise
+            reason = 'HTTP {}'.format(error.code)
+        except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError) as error:
+            if attempt == retries:
+                raise
+            reason = error
+        delay = backoff_seconds*2**attempt
+        print('Request to {} failed ({}), retrying in {} s'.format(url, reason, delay))
+        time.sleep(delay)
+
+def query_FNAR_REST_list(url, key_field):
+    out_dictionary, etag, last_modified = fetch_FNAR_dataset(url, '', key_field)
     return out_dictionary
 
+FNAR_BASE_URL = 'https://rest.fnar.net'
+
+FNAR_DATASETS = {
+    'buildings': {'path': '/building/allbuildings', 'key_field': 'Ticker'},
+    'recipes': {'path': '/recipes/allrecipes', 'key_field': 'StandardRecipeName'},
+    'materials': {'path': '/material/allmaterials', 'key_field': 'Ticker'},
+    'planets': {'path': '/planet/allplanets/full', 'key_field': 'PlanetNaturalId'},
+}
+
+# fields of each dataset read by the pricing path
+PRICING_FIELDS = {
+    'buildings': ['Ticker', 'Pioneers', 'Settlers', 'Technicians', 'Engineers', 'Scientists', 'AreaCost', 'BuildingCosts'],
+    'recipes': ['StandardRecipeName', 'BuildingTicker', 'TimeMs', 'Inputs', 'Outputs'],
+    'materials': ['Ticker', 'MaterialId'],
+    'planets': ['PlanetNaturalId', 'Resources', 'BuildRequirements'],
+}
+
+FIO_DATA_STORE_VERSION = 1
+
+class FIODataStore:
+    # Local SQLite store of FNAR datasets.  Every field of every entity is stored as its own JSON value so a
+    # run only deserializes the fields it reads.  Each dataset keeps its ETag/Last-Modified validators and fetch time.
+    def __init__(self, path = 'fio_data.sqlite'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)')
+        row = self.connection.execute("SELECT value FROM metadata WHERE key = 'schema_version'").fetchone()
+        if row is None or int(row[0]) != FIO_DATA_STORE_VERSION:
+            if row is not None:
+                print('FIO data store {} has schema version {}, rebuilding for version {}'.format(path, row[0], FIO_DATA_STORE_VERSION))
+            self.connection.execute('DROP TABLE IF EXISTS datasets')
+            self.connection.execute('DROP TABLE IF EXISTS entities')
+            self.connection.execute('DROP TABLE IF EXISTS base_layouts')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS datasets (dataset TEXT PRIMARY KEY, key_field TEXT, etag TEXT, last_modified TEXT, fetched_at REAL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS entities (dataset TEXT, entity TEXT, field TEXT, value TEXT, PRIMARY KEY (dataset, entity, field))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entities_field ON entities (dataset, field)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS base_layouts (key TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('schema_version', ?)", (str(FIO_DATA_STORE_VERSION),))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def has_dataset(self, dataset):
+        return self.connection.execute('SELECT 1 FROM datasets WHERE dataset = ?', (dataset,)).fetchone() is not None
+
+    def get_validators(self, dataset):
+        # ETag and Last-Modified of the stored copy, for conditional requests
+        row = self.connection.execute('SELECT etag, last_modified FROM datasets WHERE dataset = ?', (dataset,)).fetchone()
+        if row is None:
+            return {'etag': None, 'last_modified': None}
+        return {'etag': row[0], 'last_modified': row[1]}
+
+    def is_stale(self, dataset, max_age_seconds = None):
+        # Missing and invalidated datasets are stale whatever the max age; without a max age nothing else is
+        row = self.connection.execute('SELECT fetched_at FROM datasets WHERE dataset = ?', (dataset,)).fetchone()
+        if row is None or row[0] == 0:
+            return True
+        if max_age_seconds is None:
+            return False
+        return time.time() - row[0] > max_age_seconds
+
+    def store_dataset(self, dataset, items, key_field, etag = None, last_modified = None):
+        # Replace a dataset with a fresh download given as {entity key: record}
+        with self.connection:
+            self.connection.execute('DELETE FROM entities WHERE dataset = ?', (dataset,))
+            self.connection.executemany('INSERT INTO entities (dataset, entity, field, value) VALUES (?, ?, ?, ?)', ((dataset, key, field, json.dumps(value)) for key, item in items.items() for field, value in item.items()))
+            self.connection.execute('INSERT OR REPLACE INTO datasets (dataset, key_field, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)', (dataset, key_field, etag, last_modified, time.time()))
+
+    def touch_dataset(self, dataset):
+        # The server reported the stored copy as current
+        with self.connection:
+            self.connection.execute('UPDATE datasets SET fetched_at = ? WHERE dataset = ?', (time.time(), dataset))
+
+    def invalidate(self, dataset = None):
+        # Mark one or all datasets stale so they are fetched again; validators are dropped with them
+        with self.connection:
+            if dataset is None:
+                self.connection.execute('UPDATE datasets SET fetched_at = 0, etag = NULL, last_modified = NULL')
+            else:
+                self.connection.execute('UPDATE datasets SET fetched_at = 0, etag = NULL, last_modified = NULL WHERE dataset = ?', (dataset,))
+
+    def load_dataset(self, dataset, fields = None):
+        # {entity key: record} with only the given fields deserialized, in download order
+        query = 'SELECT entity, field, value FROM entities WHERE dataset = ?'
+        parameters = [dataset]
+        if fields is not None:
+            query = query + ' AND field IN ({})'.format(','.join('?'*len(fields)))
+            parameters.extend(fields)
+        out_dictionary = {}
+        for entity, field, value in self.connection.execute(query + ' ORDER BY rowid', parameters):
+            out_dictionary.setdefault(entity, {})[field] = json.loads(value)
+        return out_dictionary
+
+    def load_base_layouts(self):
+        # memoized calculate_single_building_base_setup results
+        return {key: json.loads(value) for key, value in self.connection.execute('SELECT key, value FROM base_layouts')}
+
+    def store_base_layouts(self, layout_cache):
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO base_layouts (key, value) VALUES (?, ?)', ((key, json.dumps(value)) for key, value in layout_cache.items()))
+
+def fetch_FNAR_data(store, datasets, base_url = FNAR_BASE_URL, max_workers = 4):
+    # Download the given datasets in parallel.  Each finished dataset is stored right away, so a failed run
+    # only has to fetch what is still missing or stale when it is started again.  Returns the datasets that changed.
+    failures = []
+    updated = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for dataset in datasets:
+            source = FNAR_DATASETS[dataset]
+            futures[executor.submit(fetch_FNAR_dataset, base_url, source['path'], source['key_field'], store.get_validators(dataset))] = dataset
+        for future in concurrent.futures.as_completed(futures):
+            dataset = futures[future]
+            try:
+                items, etag, last_modified = future.result()
+            except Exception as error:
+                print('ERROR: downloading {} failed: {}'.format(dataset, error))
+                failures.append(dataset)
+                continue
+            if items is None:
+                print('{} not modified'.format(dataset))
+                store.touch_dataset(dataset)
+            else:
+                print('downloaded {} ({} items)'.format(dataset, len(items)))
+                store.store_dataset(dataset, items, FNAR_DATASETS[dataset]['key_field'], etag, last_modified)
+                updated.append(dataset)
+    if failures:
+        raise Exception('Error in fetch_FNAR_data.  Could not download: {}'.format(', '.join(failures)))
+    return updated
+
+def load_FNAR_data(store, max_age_seconds = None, legacy_cache_file = 'cache.pickle', base_url = FNAR_BASE_URL):
+    # Load buildings, recipes, materials and planets from the local store, downloading missing or stale datasets
+    if legacy_cache_file and os.path.isfile(legacy_cache_file) and not any(store.has_dataset(dataset) for dataset in FNAR_DATASETS.keys()):
+        with open(legacy_cache_file, 'rb') as file:
+            print('importing pickle file {} into {}'.format(legacy_cache_file, store.path))
+            for dataset, items in zip(FNAR_DATASETS.keys(), pickle.load(file)):
+                store.store_dataset(dataset, items, FNAR_DATASETS[dataset]['key_field'])
+    stale = [dataset for dataset in FNAR_DATASETS.keys() if store.is_stale(dataset, max_age_seconds)]
+    if stale:
+        fetch_FNAR_data(store, stale, base_url)
+    return [store.load_dataset(dataset, PRICING_FIELDS[dataset]) for dataset in FNAR_DATASETS.keys()]
+
+# Build quantity of every planet material for a building of a given area: 'per_area' times the area, the area
+# divided by 'area_divisor' rounded up, or a 'fixed' quantity.  Repairs need the repair period share of the build
+# quantity rounded up unless a fixed 'repair' quantity is given.
+PLANET_MATERIAL_QUANTITIES = {
+    'MCG': {'per_area': 4},
+    'AEF': {'area_divisor': 3},
+    'SEA': {'per_area': 1},
+    'INS': {'per_area': 10},
+    'HSE': {'fixed': 1, 'repair': 1},
+    'TSH': {'fixed': 1, 'repair': 1},
+    'BL': {'fixed': 1, 'repair': 1},
+    'MGC': {'fixed': 1, 'repair': 1},
+}
+
+def load_planet_material_quantities(quantities_file):
+    # {"ticker": {"per_area" | "area_divisor" | "fixed": number, "repair": number}} replacing or adding planet materials
+    with open(quantities_file, 'r') as file:
+        quantities = json.load(file)
+    planet_material_quantities = dict(PLANET_MATERIAL_QUANTITIES)
+    for mat_ticker, rule in quantities.items():
+        if len([field for field in ['per_area', 'area_divisor', 'fixed'] if field in rule]) != 1:
+            raise Exception('Error in load_planet_material_quantities.  {} needs exactly one of per_area, area_divisor and fixed.'.format(mat_ticker))
+        planet_material_quantities[mat_ticker] = rule
+    return planet_material_quantities
+
+def configure_planet_material_quantities(planet_material_quantities):
+    # Change the planet material rules used by all cost calculations in this process
+    global PLANET_MATERIAL_QUANTITIES
+    PLANET_MATERIAL_QUANTITIES = planet_material_quantities
+
+def calculate_planet_material_quantities(mat_ticker, area_cost, repair_material_fraction, planet_material_quantities = None):
+    # build and repair quantity of a planet material for one building, None if the material has no rule
+    if planet_material_quantities is None:
+        planet_material_quantities = PLANET_MATERIAL_QUANTITIES
+    if mat_ticker not in planet_material_quantities:
+        print('ERROR: planet material not recognized: {}'.format(mat_ticker))
+        return None
+    rule = planet_material_quantities[mat_ticker]
+    if 'fixed' in rule:
+        mat_build_quantity = rule['fixed']
+    elif 'area_divisor' in rule:
+        mat_build_quantity = math.ceil(area_cost/rule['area_divisor'])
+    else:
+        mat_build_quantity = rule['per_area']*area_cost
+    if 'repair' in rule:
+        mat_repair_quantity = rule['repair']
+    else:
+        mat_repair_quantity = math.ceil(repair_material_fraction*mat_build_quantity)
+    return mat_build_quantity, mat_repair_quantity
+
+class BuildQuantityTable:
+    # Build and repair quantities per (building ticker, planet materials), filled on first use from BuildingCosts,
+    # AreaCost and the planet material rules.  Repair quantities use the repair period at construction.
+    def __init__(self, buildings, base_setups, planet_material_quantities = None):
+        self.buildings = buildings
+        self.base_setups = base_setups
+        self.planet_material_quantities = PLANET_MATERIAL_QUANTITIES if planet_material_quantities is None else planet_material_quantities
+        self.repair_material_fraction = REPAIR_PERIOD_DAYS/180 # fraction of repair materials needed due to repair time
+        self.planet_entries = {}
+        self.entries = {}
+
+    def get_planet_quantities(self, area_cost, planet_mats):
+        # [(ticker, build quantity, repair quantity)] of the planet materials of one building
+        key = (area_cost, planet_mats)
+        if key not in self.planet_entries:
+            quantities = []
+            for mat_ticker in planet_mats:
+                mat_quantities = calculate_planet_material_quantities(mat_ticker, area_cost, self.repair_material_fraction, self.planet_material_quantities)
+                if mat_quantities is not None:
+                    quantities.append((mat_ticker,) + mat_quantities)
+            self.planet_entries[key] = quantities
+        return self.planet_entries[key]
+
+    def get(self, building_ticker, planet_mats):
+        # 'repair': [(ticker, repair quantity)] of one building, 'build': [(ticker, build quantity)] of its whole base,
+        # in the order of the base list, and 'building_count': the number of production buildings in the base
+        key = (building_ticker, tuple(planet_mats))
+        entry = self.entries.get(key)
+        if entry is None:
+            building = self.buildings[building_ticker]
+            repair_quantities = [(building_mat['CommodityTicker'], math.ceil(self.repair_material_fraction*building_mat['Amount'])) for building_mat in building['BuildingCosts']]
+            repair_quantities.extend((mat_ticker, mat_repair_quantity) for mat_ticker, mat_build_quantity, mat_repair_quantity in self.get_planet_quantities(building['AreaCost'], key[1]))
+            base_setup = self.base_setups[building_ticker]
+            build_quantities = []
+            for base_building in base_setup['BaseList']:
+                build_quantities.extend((building_mat['CommodityTicker'], building_mat['Amount']*base_building['Count']) for building_mat in base_building['BuildingCosts'])
+                build_quantities.extend((mat_ticker, mat_build_quantity) for mat_ticker, mat_build_quantity, mat_repair_quantity in self.get_planet_quantities(base_building['AreaCost'], key[1]))
+            entry = {'repair': repair_quantities, 'build': build_quantities, 'building_count': base_setup['BuildingCount']}
+            self.entries[key] = entry
+        return entry
+
 def get_planet_build_requirements(planet):
     planet_specific_materials=[]
     for requirement in planet['BuildRequirements']:
@@ -153,91 +658,65 @@ def calculate_habitation_needs(pioneers, settlers, technicians, engineers, scien
     else:
         raise Exception('Error in calculate_habitation_needs.  No population given.')
 
-def calculate_single_building_base_setup(building_ticker, buildings):
+def calculate_base_layout(building_ticker, buildings, building_count):
+    # buildings and habitation needed for building_count copies of a building, and the area they cover
+    building = buildings[building_ticker]
+    building_list = calculate_habitation_needs(building['Pioneers']*building_count, building['Settlers']*building_count, building['Technicians']*building_count, building['Engineers']*building_count, building['Scientists']*building_count)
+    building_list.append({'Ticker': building_ticker, 'Count': building_count})
+    area = 0
+    for cur_building in building_list:
+        area = area + buildings[cur_building['Ticker']]['AreaCost']*cur_building['Count']
+    return building_list, area
+
+def calculate_single_building_base_setup(building_ticker, buildings, area_limit = BASE_AREA_LIMIT, layout_cache = None):
     # buildings to ignore
     if building_ticker in ['PAR', 'SDP', 'COG', 'CRC', 'HOS', 'UNI', 'LIB', 'PWH', 'LM', 'EMC', 'WCE', 'ART', '4DA', 'ADM', 'PSY', 'SST', 'INF', 'ACA', 'PBH', 'VRT', 'CM', 'STO', 'HB1', 'HB2', 'HB3', 'HB4', 'HB5', 'HBB', 'HBC', 'HBM', 'HBL']:
         return [], 0
-    # initialize population and number of buildings
-    building_count = 1
-    pioneers = buildings[building_ticker]['Pioneers']
-    settlers = buildings[building_ticker]['Settlers']
-    technicians = buildings[building_ticker]['Technicians']
-    engineers = buildings[building_ticker]['Engineers']
-    scientists = buildings[building_ticker]['Scientists']
-
-    # if pioneers+settlers+technicians+engineers+scientists == 0:
-    #     print('here')
-
-    while(True):
-        # calculation habitation needs for current number of buildings
-        building_list = calculate_habitation_needs(pioneers*building_count, settlers*building_count, technicians*building_count, engineers*building_count, scientists*building_count)
-        building_list.append({'Ticker': building_ticker, 'Count': building_count})
-
-        # calculate area needed for current set of buildings
-        area = 0
-        for cur_building in building_list:
-            area = area + buildings[cur_building['Ticker']]['AreaCost']*cur_building['Count']
-        
-        # Complete once area exceeds 500
-        if area > 500:
-            break
+    if layout_cache is None:
+        layout_cache = base_layout_cache
 
-        # Area has not exceeded 500.  Add another building and try again
-        building_count = building_count + 1
+    # layouts only depend on the building's population and area, the habitation areas and the area limit
+    building = buildings[building_ticker]
+    population = [building['Pioneers'], building['Settlers'], building['Technicians'], building['Engineers'], building['Scientists']]
+    habitation_areas = [buildings[ticker]['AreaCost'] if ticker in buildings else None for ticker in ['HB1', 'HB2', 'HB3', 'HB4', 'HB5', 'HBB', 'HBC', 'HBM', 'HBL']]
+    key = json.dumps([BASE_LAYOUT_VERSION, building_ticker, population, building['AreaCost'], habitation_areas, area_limit])
 
-    # Area exceeded 500 with the current building count.  Decrease the building count by 1 and return the set of bulidings
-    building_count = building_count - 1
-    building_list = calculate_habitation_needs(pioneers*building_count, settlers*building_count, technicians*building_count, engineers*building_count, scientists*building_count)
-    building_list.append({'Ticker': building_ticker, 'Count': building_count})
+    if key not in layout_cache:
+        # Step up to the first count whose base exceeds the area limit.  The area does not always grow with the
+        # count (mixed habitation can need less area for one more building), so the counts cannot be bisected.
+        building_count = 1
+        while calculate_base_layout(building_ticker, buildings, building_count)[1] <= area_limit:
+            building_count = building_count + 1
+        # Use one building less.
+        building_count = building_count - 1
+        if building_count == 0:
+            raise Exception('Error in calculate_single_building_base_setup.  A single {} does not fit in an area of {}.'.format(building_ticker, area_limit))
+        building_list, area = calculate_base_layout(building_ticker, buildings, building_count)
+        layout_cache[key] = {'BaseList': building_list, 'BuildingCount': building_count}
 
     # Add area and material costs for all the buildings to this structure
-    for building in building_list:
-        building['BuildingCosts'] = buildings[building['Ticker']]['BuildingCosts']
-        building['AreaCost'] = buildings[building['Ticker']]['AreaCost']
+    building_list = []
+    for entry in layout_cache[key]['BaseList']:
+        building_list.append({'Ticker': entry['Ticker'], 'Count': entry['Count'], 'BuildingCosts': buildings[entry['Ticker']]['BuildingCosts'], 'AreaCost': buildings[entry['Ticker']]['AreaCost']})
 
-    return building_list, building_count
+    return building_list, layout_cache[key]['BuildingCount']
 
-def calculate_desired_profit(cur_material, output_count, input_costs, repair_costs, recipe_time, planet_mats, base_cost_list, input_cost_list, repair_cost_list, desired_profit_list, base_setup, use_cur_material_costs = True):
+def calculate_desired_profit(cur_material, output_count, input_costs, repair_costs, recipe_time, quantities, base_cost_list, input_cost_list, repair_cost_list, desired_profit_list, use_cur_material_costs = True):
     # Add desired profit: ROI in this case
     recipe_time_fraction = recipe_time/ROI_PERIOD_MS # fraction of ROI needed for each recipe run
-    base_output_per_run = output_count*base_setup['BuildingCount']
+    base_output_per_run = output_count*quantities['building_count']
     desired_profit = PopulationCost()
-    for building in base_setup['BaseList']:
-        for building_mat in building['BuildingCosts']:
-            mat_ticker = building_mat['CommodityTicker']
-            mat_build_quantity = building_mat['Amount']*building['Count']
-            if use_cur_material_costs and mat_ticker == cur_material:
-                input_cost_cur = input_costs
-                repair_cost_cur = repair_costs
-                desired_profit_cur = desired_profit
-            else:
-                input_cost_cur = input_cost_list[mat_ticker]
-                repair_cost_cur = repair_cost_list[mat_ticker]
-                desired_profit_cur = desired_profit_list[mat_ticker]
-            desired_profit += recipe_time_fraction/base_output_per_run*mat_build_quantity*(base_cost_list[mat_ticker] + input_cost_cur + repair_cost_cur + desired_profit_cur)
-        # add something for MCG and any other planet based materials
-        for mat_ticker in planet_mats:
-            if mat_ticker == 'MCG':
-                mat_build_quantity = 4*building['AreaCost']
-            elif mat_ticker == 'AEF':
-                mat_build_quantity = math.ceil(building['AreaCost']/3)
-            elif mat_ticker == 'SEA':
-                mat_build_quantity = 1*building['AreaCost']
-            elif mat_ticker == 'INS':
-                mat_build_quantity = 10*building['AreaCost']
-            elif mat_ticker in ['HSE', 'TSH', 'BL', 'MGC']:
-                mat_build_quantity = 1
-            else:
-                print('ERROR: planet material not recognized: {}'.format(mat_ticker))
-            if use_cur_material_costs and mat_ticker == cur_material:
-                input_cost_cur = input_costs
-                repair_cost_cur = repair_costs
-                desired_profit_cur = desired_profit
-            else:
-                input_cost_cur = input_cost_list[mat_ticker]
-                repair_cost_cur = repair_cost_list[mat_ticker]
-                desired_profit_cur = desired_profit_list[mat_ticker]
-            desired_profit = desired_profit + recipe_time_fraction/base_output_per_run*mat_build_quantity*(base_cost_list[mat_ticker] + input_cost_cur + repair_cost_cur + desired_profit_cur)
+    # building and planet materials (MCG and others) of the whole base
+    for mat_ticker, mat_build_quantity in quantities['build']:
+        if use_cur_material_costs and mat_ticker == cur_material:
+            input_cost_cur = input_costs
+            repair_cost_cur = repair_costs
+            desired_profit_cur = desired_profit
+        else:
+            input_cost_cur = input_cost_list[mat_ticker]
+            repair_cost_cur = repair_cost_list[mat_ticker]
+            desired_profit_cur = desired_profit_list[mat_ticker]
+        desired_profit = desired_profit + recipe_time_fraction/base_output_per_run*mat_build_quantity*(base_cost_list[mat_ticker] + input_cost_cur + repair_cost_cur + desired_profit_cur)
     
     return desired_profit
 
@@ -260,41 +739,12 @@ def calculate_input_cost(cur_material, output_count, inputs, base_cost_list, inp
     
     return input_costs
 
-def calculate_repair_cost(cur_material, output_count, building_costs, input_costs, recipe_time, building_area_cost, planet_mats, base_cost_list, input_cost_list, repair_cost_list, desired_profit_list, use_cur_material_costs = True):
+def calculate_repair_cost(cur_material, output_count, quantities, input_costs, recipe_time, base_cost_list, input_cost_list, repair_cost_list, desired_profit_list, use_cur_material_costs = True):
     # Add repair costs
-    repair_material_fraction = REPAIR_PERIOD_DAYS/180 # fraction of repair materials needed due to repair time
     recipe_time_fraction = recipe_time/REPAIR_PERIOD_MS # fraction of repair materials needed for each recipe run
     repair_costs = PopulationCost()
-    for building_mat in building_costs:
-        mat_ticker = building_mat['CommodityTicker']
-        mat_build_quantity = building_mat['Amount']
-        mat_repair_quantity = math.ceil(repair_material_fraction*mat_build_quantity)
-        if use_cur_material_costs and mat_ticker == cur_material:
-            input_cost_cur = input_costs
-            repair_cost_cur = repair_costs
-        else:
-            input_cost_cur = input_cost_list[mat_ticker]
-            repair_cost_cur = repair_cost_list[mat_ticker]
-        repair_costs = repair_costs + recipe_time_fraction/output_count*mat_repair_quantity*(base_cost_list[mat_ticker] + input_cost_cur + repair_cost_cur + desired_profit_list[mat_ticker])
-    # add something for MCG and any other planet based materials
-    for mat_ticker in planet_mats:
-        if mat_ticker == 'MCG':
-            mat_build_quantity = 4*building_area_cost
-            mat_repair_quantity = math.ceil(repair_material_fraction*mat_build_quantity)
-        elif mat_ticker == 'AEF':
-            mat_build_quantity = math.ceil(building_area_cost/3)
-            mat_repair_quantity = math.ceil(repair_material_fraction*mat_build_quantity)
-        elif mat_ticker == 'SEA':
-            mat_build_quantity = 1*building_area_cost
-            mat_repair_quantity = math.ceil(repair_material_fraction*mat_build_quantity)
-        elif mat_ticker == 'INS':
-            mat_build_quantity = 10*building_area_cost
-            mat_repair_quantity = math.ceil(repair_material_fraction*mat_build_quantity)
-        elif mat_ticker in ['HSE', 'TSH', 'BL', 'MGC']:
-            mat_build_quantity = 1
-            mat_repair_quantity = 1
-        else:
-            print('ERROR: planet material not recognized: {}'.format(mat_ticker))
+    # building materials, then MCG and any other planet based materials
+    for mat_ticker, mat_repair_quantity in quantities['repair']:
         if use_cur_material_costs and mat_ticker == cur_material:
             input_cost_cur = input_costs
             repair_cost_cur = repair_costs
@@ -305,12 +755,13 @@ def calculate_repair_cost(cur_material, output_count, building_costs, input_cost
     
     return repair_costs
 
-def calculate_total_cost(cur_material, output_count, inputs, building_costs, recipe_time, building_area_cost, planet_mats, base_cost_list, input_cost_list, repair_cost_list, desired_profit_list, base_cost, base_setup, use_cur_material_costs = True):
+def calculate_total_cost(cur_material, output_count, inputs, quantities, recipe_time, base_cost_list, input_cost_list, repair_cost_list, desired_profit_list, base_cost, use_cur_material_costs = True):
+    # quantities: BuildQuantityTable entry of the recipe's building and planet materials
     input_costs = calculate_input_cost(cur_material, output_count, inputs, base_cost_list, input_cost_list, repair_cost_list, desired_profit_list, use_cur_material_costs)
     
-    repair_costs = calculate_repair_cost(cur_material, output_count, building_costs, input_costs, recipe_time, building_area_cost, planet_mats, base_cost_list, input_cost_list, repair_cost_list, desired_profit_list, use_cur_material_costs)
+    repair_costs = calculate_repair_cost(cur_material, output_count, quantities, input_costs, recipe_time, base_cost_list, input_cost_list, repair_cost_list, desired_profit_list, use_cur_material_costs)
 
-    desired_profit = calculate_desired_profit(cur_material, output_count, input_costs, repair_costs, recipe_time, planet_mats, base_cost_list, input_cost_list, repair_cost_list, desired_profit_list, base_setup, use_cur_material_costs)
+    desired_profit = calculate_desired_profit(cur_material, output_count, input_costs, repair_costs, recipe_time, quantities, base_cost_list, input_cost_list, repair_cost_list, desired_profit_list, use_cur_material_costs)
 
     # calculate total costs
     total_costs = PopulationCost()
@@ -318,27 +769,611 @@ def calculate_total_cost(cur_material, output_count, inputs, building_costs, rec
     
     return input_costs, repair_costs, desired_profit, total_costs
 
-if __name__ == '__main__':
-    # test = PopulationCost(1,0,0,0,0)
-    # print(test*1)
-    # sys.exit()
-    # args = sys.argv[1:]
-    # username = input('username:')
-    # password = getpass.getpass('password:')
-    cache_file = "cache.pickle"
-    if os.path.isfile(cache_file):
-        with open(cache_file, 'rb') as file:
-            print('reading pickle file')
-            buildings, recipes, materials, planets = pickle.load(file)
+def calculate_material_cost_coefficients(output_count, inputs, quantities, recipe_time):
+    # Linear coefficients of a material's input, repair and profit costs on the total cost of other materials.
+    # Mirrors calculate_input_cost, calculate_repair_cost and calculate_desired_profit with every material at its full total cost.
+    input_coefficients = {}
+    repair_coefficients = {}
+    profit_coefficients = {}
+
+    # input costs
+    for input_mat in inputs:
+        mat_ticker = input_mat['Ticker']
+        input_coefficients[mat_ticker] = input_coefficients.get(mat_ticker, 0) + input_mat['Amount']/output_count
+
+    # repair costs
+    recipe_time_fraction = recipe_time/REPAIR_PERIOD_MS
+    for mat_ticker, mat_repair_quantity in quantities['repair']:
+        repair_coefficients[mat_ticker] = repair_coefficients.get(mat_ticker, 0) + recipe_time_fraction/output_count*mat_repair_quantity
+
+    # desired profit
+    recipe_time_fraction = recipe_time/ROI_PERIOD_MS
+    base_output_per_run = output_count*quantities['building_count']
+    for mat_ticker, mat_build_quantity in quantities['build']:
+        profit_coefficients[mat_ticker] = profit_coefficients.get(mat_ticker, 0) + recipe_time_fraction/base_output_per_run*mat_build_quantity
+
+    return input_coefficients, repair_coefficients, profit_coefficients
+
+def build_material_cost_system(material_info, buildings, base_setups, material_list = None, quantity_table = None):
+    # Sparse linear system total = base + (input + repair + profit coefficients) * total for all selected materials
+    if material_list is None:
+        material_list = material_info.keys()
+    if quantity_table is None:
+        quantity_table = BuildQuantityTable(buildings, base_setups)
+    system = {}
+    for material in material_list:
+        recipe = material_info[material]['recipe']
+        quantities = quantity_table.get(recipe['BuildingTicker'], material_info[material]['planet_mats'])
+        input_coefficients, repair_coefficients, profit_coefficients = calculate_material_cost_coefficients(material_info[material]['output'], recipe['Inputs'], quantities, recipe['TimeMs'])
+        coefficients = {}
+        for component in [input_coefficients, repair_coefficients, profit_coefficients]:
+            for mat_ticker, coefficient in component.items():
+                if mat_ticker not in material_info:
+                    raise Exception('Error in build_material_cost_system.  {} depends on {} which has no selected recipe or planet.'.format(material, mat_ticker))
+                coefficients[mat_ticker] = coefficients.get(mat_ticker, 0) + coefficient
+        system[material] = {'input': input_coefficients, 'repair': repair_coefficients, 'profit': profit_coefficients, 'total': coefficients}
+    return system
+
+def population_cost_to_list(population_cost):
+    return [population_cost.Pioneer, population_cost.Settler, population_cost.Technician, population_cost.Engineer, population_cost.Scientist]
+
+def calculate_population_cost_table(keys, output_counts, building_list, recipe_times):
+    # Batch calculate_population_cost: one row per key from lists of output counts, buildings and recipe times
+    table = PopulationCostTable(keys)
+    for n in range(len(table)):
+        time_quant_factor = recipe_times[n]/output_counts[n]
+        building = building_list[n]
+        table.set_row(n, (building['Pioneers']*time_quant_factor, building['Settlers']*time_quant_factor, building['Technicians']*time_quant_factor, building['Engineers']*time_quant_factor, building['Scientists']*time_quant_factor))
+    return table
+
+def calculate_input_cost_table(system, total_cost_table, keys = None):
+    return total_cost_table.combine({material: system[material]['input'] for material in system.keys()}, keys)
+
+def calculate_repair_cost_table(system, total_cost_table, keys = None):
+    return total_cost_table.combine({material: system[material]['repair'] for material in system.keys()}, keys)
+
+def calculate_desired_profit_table(system, total_cost_table, keys = None):
+    return total_cost_table.combine({material: system[material]['profit'] for material in system.keys()}, keys)
+
+def calculate_total_cost_table(system, base_cost_table, total_cost_table):
+    # Batch calculate_total_cost for every material of the system with all materials at their full total cost
+    keys = base_cost_table.keys()
+    input_cost_table = calculate_input_cost_table(system, total_cost_table, keys)
+    repair_cost_table = calculate_repair_cost_table(system, total_cost_table, keys)
+    desired_profit_table = calculate_desired_profit_table(system, total_cost_table, keys)
+    total_cost_table_new = base_cost_table + input_cost_table + repair_cost_table + desired_profit_table
+    return input_cost_table, repair_cost_table, desired_profit_table, total_cost_table_new
+
+def factorize_material_cost_system(system, order):
+    # Sparse LU factorization (no pivoting) of (I - A), rows eliminated in the given order.
+    # I - A is an M-matrix whenever the fixed point iteration converges, so the diagonal pivots stay positive.
+    position = {material: n for n, material in enumerate(order)}
+    lower = []
+    upper = []
+    for n, material in enumerate(order):
+        row = {}
+        for mat_ticker, coefficient in system[material]['total'].items():
+            row[position[mat_ticker]] = row.get(position[mat_ticker], 0) - coefficient
+        row[n] = row.get(n, 0) + 1
+        lower_row = {}
+        pivot_columns = [k for k in row.keys() if k < n]
+        heapq.heapify(pivot_columns)
+        while pivot_columns:
+            k = heapq.heappop(pivot_columns)
+            factor = row.pop(k)/upper[k][k]
+            lower_row[k] = factor
+            for j, value in upper[k].items():
+                if j == k:
+                    continue
+                if j < n and j not in row:
+                    heapq.heappush(pivot_columns, j)
+                row[j] = row.get(j, 0) - factor*value
+        if row.get(n, 0) == 0:
+            raise Exception('Error in factorize_material_cost_system.  Zero pivot for {}.'.format(material))
+        lower.append(lower_row)
+        upper.append(row)
+    return lower, upper
+
+def solve_factorized_material_cost_system(lower, upper, rhs):
+    # Forward and back substitution of a PopulationCostTable right hand side in factorization order
+    count = len(upper)
+    y = [None]*count
+    for n in range(count):
+        value = rhs.row(n)
+        for k, factor in lower[n].items():
+            value = [a - factor*b for a, b in zip(value, y[k])]
+        y[n] = value
+    x = PopulationCostTable(rhs.keys())
+    for n in range(count - 1, -1, -1):
+        value = y[n]
+        for j, coefficient in upper[n].items():
+            if j > n:
+                value = [a - coefficient*b for a, b in zip(value, x.row(j))]
+        x.set_row(n, [a/upper[n][n] for a in value])
+    return x
+
+def calculate_material_cost_residual(system, base_cost_table, total_cost_table):
+    # Largest absolute violation of total = base + A*total over all materials and population types
+    total_cost_table = PopulationCostTable.from_dict(total_cost_table, base_cost_table.keys())
+    residual_table = base_cost_table + total_cost_table.combine({material: system[material]['total'] for material in system.keys()}, base_cost_table.keys()) - total_cost_table
+    residual = {'residual': 0, 'mat': '', 'table': residual_table}
+    for n, material in enumerate(residual_table.keys()):
+        diff = max(abs(a) for a in residual_table.row(n))
+        if diff > residual['residual']:
+            residual['residual'] = diff
+            residual['mat'] = material
+    return residual
+
+def solve_material_costs_direct(material_costs, material_info, buildings, base_setups, tolerance = 1e-9, max_refinements = 10):
+    # Direct solve of the material cost fixed point with iterative refinement
+    system = build_material_cost_system(material_info, buildings, base_setups)
+    order = sorted(system.keys(), key=lambda material: len(system[material]['total']))
+    lower, upper = factorize_material_cost_system(system, order)
+
+    base_cost_table = PopulationCostTable.from_dict(material_costs, order)
+    total_cost_table = solve_factorized_material_cost_system(lower, upper, base_cost_table)
+    refinements = 0
+    while True:
+        residual = calculate_material_cost_residual(system, base_cost_table, total_cost_table)
+        if residual['residual'] <= tolerance*max(total_cost_table.max_abs(), 1) or refinements >= max_refinements:
+            break
+        total_cost_table = total_cost_table + solve_factorized_material_cost_system(lower, upper, residual['table'])
+        refinements = refinements + 1
+
+    # split the totals back into their input, repair and profit parts, in material order like the other solvers
+    input_cost_table, repair_cost_table, desired_profit_table, total_cost_table = calculate_total_cost_table(system, base_cost_table, total_cost_table)
+    material_order = list(system.keys())
+    input_cost_table, repair_cost_table, desired_profit_table, total_cost_table = [table.reorder(material_order) for table in [input_cost_table, repair_cost_table, desired_profit_table, total_cost_table]]
+
+    fill = sum(len(row) for row in lower) + sum(len(row) for row in upper)
+    stats = {'solver': 'direct', 'iterations': refinements, 'residual': residual['residual'], 'nonzeros': sum(len(row['total']) for row in system.values()) + len(system), 'factor_nonzeros': fill}
+    return input_cost_table, repair_cost_table, desired_profit_table, total_cost_table, stats
+
+def solve_factorized_sparse_rows(lower, upper, rhs_rows):
+    # Forward and back substitution of many right hand sides at once, the rows of both given as sparse
+    # {column: value} dicts in factorization order
+    count = len(upper)
+    y = [None]*count
+    for n in range(count):
+        value = dict(rhs_rows[n])
+        for k, factor in lower[n].items():
+            for column, b in y[k].items():
+                value[column] = value.get(column, 0) - factor*b
+        y[n] = value
+    x = [None]*count
+    for n in range(count - 1, -1, -1):
+        value = y[n]
+        for j, coefficient in upper[n].items():
+            if j > n:
+                for column, b in x[j].items():
+                    value[column] = value.get(column, 0) - coefficient*b
+        pivot = upper[n][n]
+        x[n] = {column: a/pivot for column, a in value.items() if a != 0}
+    return x
+
+class MaterialCostSensitivity:
+    # Sensitivities of every material's total cost, from the linear system total = base + A*total.
+    # The inverse M = (I - A)^-1 is found with one factorization and one batched solve of all unit right hand sides,
+    # so that d total_i/d base_j = M_ij for every population type.  In currency, with workforce costs w:
+    #   cost_i = sum_j M_ij (w . base_j), d cost_i/d w_p = total_i,p
+    def __init__(self, system, material_costs, total_costs, workforce_costs):
+        self.system = system
+        self.workforce_costs = list(workforce_costs)
+        self.order = sorted(system.keys(), key=lambda material: len(system[material]['total']))
+        self.position = {material: n for n, material in enumerate(self.order)}
+        lower, upper = factorize_material_cost_system(system, self.order)
+        rows = solve_factorized_sparse_rows(lower, upper, [{n: 1.0} for n in range(len(self.order))])
+        self.inverse = {self.order[n]: {self.order[j]: value for j, value in row.items()} for n, row in enumerate(rows)}
+        self.inverse_columns = {}
+        for material, row in self.inverse.items():
+            for mat_ticker, value in row.items():
+                self.inverse_columns.setdefault(mat_ticker, {})[material] = value
+        self.total_costs = {material: total_costs[material] for material in self.order}
+        self.base_currency = {material: population_cost_to_currency(material_costs[material], workforce_costs) for material in self.order}
+        self.total_currency = {material: population_cost_to_currency(total_costs[material], workforce_costs) for material in self.order}
+
+    def base_cost_elasticities(self, material):
+        # Relative change of this material's cost per relative change of every material's base cost: the share of
+        # its cost coming from each material's own production (sums to 1)
+        cost = self.total_currency[material]
+        return {mat_ticker: value*self.base_currency[mat_ticker]/cost for mat_ticker, value in self.inverse[material].items() if cost}
+
+    def downstream_elasticities(self, material):
+        # Relative change of every material's cost per relative change of this material's total cost, e.g. a 1%
+        # higher FE price moves each downstream cost by this many percent
+        cost = self.total_currency[material]
+        scale = cost/self.inverse[material][material]
+        return {mat_ticker: value*scale/self.total_currency[mat_ticker] for mat_ticker, value in self.inverse_columns[material].items() if self.total_currency[mat_ticker]}
+
+    def workforce_elasticities(self, material):
+        # Relative change of this material's cost per relative change of each workforce cost (sums to 1)
+        cost = self.total_currency[material]
+        return {population: population_cost*workforce_cost/cost for population, population_cost, workforce_cost in zip(POPULATION_TYPES, population_cost_to_list(self.total_costs[material]), self.workforce_costs)}
+
+    def attribution(self, material):
+        # One level cost breakdown: own base cost plus the currency cost each direct input, repair material and
+        # building material contributes through calculate_input_cost, calculate_repair_cost and calculate_desired_profit
+        parts = [{'material': material, 'channel': 'base', 'cost': self.base_currency[material]}]
+        for channel, coefficients in [('input', self.system[material]['input']), ('repair', self.system[material]['repair']), ('profit', self.system[material]['profit'])]:
+            for mat_ticker, coefficient in coefficients.items():
+                parts.append({'material': mat_ticker, 'channel': channel, 'cost': coefficient*self.total_currency[mat_ticker]})
+        parts.sort(key=lambda part: part['cost'], reverse=True)
+        return parts
+
+    def report(self, material):
+        return {
+            'material': material,
+            'total cost': self.total_currency[material],
+            'attribution': self.attribution(material),
+            'base cost elasticities': self.base_cost_elasticities(material),
+            'downstream elasticities': self.downstream_elasticities(material),
+            'workforce elasticities': self.workforce_elasticities(material),
+            }
+
+def write_sensitivity_report(filename, sensitivity, material):
+    # Every material related to one material: its share in the material's cost and how it moves with the material
+    base_elasticities = sensitivity.base_cost_elasticities(material)
+    downstream_elasticities = sensitivity.downstream_elasticities(material)
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['material', 'share of {} cost'.format(material), '% change per 1% {} cost'.format(material)])
+        for mat_ticker in sensitivity.order:
+            if mat_ticker in base_elasticities or mat_ticker in downstream_elasticities:
+                writer.writerow([mat_ticker, base_elasticities.get(mat_ticker, 0), downstream_elasticities.get(mat_ticker, 0)])
+
+def get_recipe_dependencies(recipe, planet_mats, buildings, base_setups):
+    # materials whose cost enters a recipe's cost: inputs, building and base building materials and planet materials
+    dependencies = set()
+    for input_mat in recipe['Inputs']:
+        dependencies.add(input_mat['Ticker'])
+    for building_mat in buildings[recipe['BuildingTicker']]['BuildingCosts']:
+        dependencies.add(building_mat['CommodityTicker'])
+    for building in base_setups[recipe['BuildingTicker']]['BaseList']:
+        for building_mat in building['BuildingCosts']:
+            dependencies.add(building_mat['CommodityTicker'])
+    dependencies.update(planet_mats)
+    return dependencies
+
+def build_material_dependency_graph(material_info, buildings, base_setups):
+    # material -> set of materials its cost depends on
+    graph = {}
+    for material in material_info.keys():
+        graph[material] = get_recipe_dependencies(material_info[material]['recipe'], material_info[material]['planet_mats'], buildings, base_setups)
+    return graph
+
+def reverse_material_dependency_graph(graph):
+    # material -> set of materials whose cost depends on it
+    dependents = {}
+    for material, dependencies in graph.items():
+        for mat_ticker in dependencies:
+            dependents.setdefault(mat_ticker, set()).add(material)
+    return dependents
+
+def calculate_strongly_connected_components(graph):
+    # Tarjan's algorithm without recursion.  Components are returned dependencies first, so each
+    # component only depends on itself and on components earlier in the list.
+    index = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = []
+    counter = 0
+    for root in graph.keys():
+        if root in index:
+            continue
+        index[root] = lowlink[root] = counter
+        counter = counter + 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(sorted(graph[root])))]
+        while work:
+            node, children = work[-1]
+            descended = False
+            for child in children:
+                if child not in graph:
+                    continue
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter = counter + 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(sorted(graph[child]))))
+                    descended = True
+                    break
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            if descended:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    return components
+
+def solve_material_cost_components(system, components, material_costs, total_costs):
+    # Solve the given components in order, filling total_costs in place.  Dependencies outside a component
+    # must already be in total_costs.  Returns the size and solve time of every cycle.
+    cycle_stats = []
+    for component in components:
+        start_time = time.perf_counter()
+        if len(component) == 1 and component[0] not in system[component[0]]['total']:
+            material = component[0]
+            total = material_costs[material]
+            for mat_ticker, coefficient in system[material]['total'].items():
+                total = total + coefficient*total_costs[mat_ticker]
+            total_costs[material] = total
+            continue
+
+        # cycle: move the already solved dependencies to the right hand side and solve the block directly
+        members = set(component)
+        subsystem = {}
+        rhs = {}
+        for material in component:
+            value = material_costs[material]
+            internal_coefficients = {}
+            for mat_ticker, coefficient in system[material]['total'].items():
+                if mat_ticker in members:
+                    internal_coefficients[mat_ticker] = coefficient
+                else:
+                    value = value + coefficient*total_costs[mat_ticker]
+            subsystem[material] = {'total': internal_coefficients}
+            rhs[material] = value
+        lower, upper = factorize_material_cost_system(subsystem, component)
+        solution = solve_factorized_material_cost_system(lower, upper, PopulationCostTable.from_dict(rhs, component))
+        for material in component:
+            total_costs[material] = solution[material]
+        cycle_stats.append({'materials': sorted(component), 'size': len(component), 'time': time.perf_counter() - start_time})
+    return cycle_stats
+
+def solve_material_costs_scc(material_costs, material_info, buildings, base_setups):
+    # Solve the material cost system one strongly connected component at a time in topological order.
+    # Acyclic materials are evaluated once from their already solved dependencies; only real cycles are factorized.
+    system = build_material_cost_system(material_info, buildings, base_setups)
+    graph = build_material_dependency_graph(material_info, buildings, base_setups)
+    components = calculate_strongly_connected_components(graph)
+
+    total_costs = {}
+    cycle_stats = solve_material_cost_components(system, components, material_costs, total_costs)
+
+    base_cost_table = PopulationCostTable.from_dict(material_costs, system.keys())
+    total_cost_table = PopulationCostTable.from_dict(total_costs, system.keys())
+    input_cost_table, repair_cost_table, desired_profit_table, total_cost_table = calculate_total_cost_table(system, base_cost_table, total_cost_table)
+    residual = calculate_material_cost_residual(system, base_cost_table, total_cost_table)
+
+    cycle_stats.sort(key=lambda cycle: cycle['time'], reverse=True)
+    stats = {'solver': 'scc', 'iterations': 0, 'residual': residual['residual'], 'components': len(components), 'cycles': cycle_stats}
+    return input_cost_table, repair_cost_table, desired_profit_table, total_cost_table, stats
+
+def solve_material_costs_iterative(material_costs, material_info, buildings, base_setups, input_costs, repair_costs, desired_profit, total_costs, max_iterations = 100, tolerance = 0.001):
+    # iterate over materials to find final cost
+    quantity_table = BuildQuantityTable(buildings, base_setups)
+    iterations = max_iterations
+    for n in range(max_iterations):
+        max_diff_elem = {'diff':-1, 'mat':''}
+        for material in material_costs.keys():
+            recipe = material_info[material]['recipe']
+            quantities = quantity_table.get(recipe['BuildingTicker'], material_info[material]['planet_mats'])
+            input_costs_temp, repair_costs_temp, desired_profit_temp, total_costs_temp = calculate_total_cost(material, material_info[material]['output'], recipe['Inputs'], quantities, recipe['TimeMs'], material_costs, input_costs, repair_costs, desired_profit, material_costs[material])
+            population_diff = total_costs_temp - total_costs[material]
+            diff_sum = population_diff.Pioneer+population_diff.Settler+population_diff.Technician+population_diff.Engineer+population_diff.Scientist
+            if diff_sum > max_diff_elem['diff']:
+                max_diff_elem['diff'] = diff_sum
+                max_diff_elem['mat'] = material
+            input_costs[material] = input_costs_temp
+            repair_costs[material] = repair_costs_temp
+            desired_profit[material] = desired_profit_temp
+            total_costs[material] = total_costs_temp
+        if instrumentation.tracing:
+            instrumentation.trace('material_iteration', 'Largest difference: {material} {diff} {total_cost}', iteration=n, material=max_diff_elem['mat'], diff=max_diff_elem['diff'], total_cost=population_cost_to_list(total_costs[max_diff_elem['mat']]))
+        if max_diff_elem['diff'] < tolerance:
+            iterations = n + 1
+            break
+
+    system = build_material_cost_system(material_info, buildings, base_setups, quantity_table=quantity_table)
+    residual = calculate_material_cost_residual(system, PopulationCostTable.from_dict(material_costs), total_costs)
+    stats = {'solver': 'iterative', 'iterations': iterations, 'residual': residual['residual']}
+    return input_costs, repair_costs, desired_profit, total_costs, stats
+
+def compile_fixed_point_rows(system, order):
+    # Coefficient rows of T = B + A*T as (offset into a flat N x 5 value array, coefficient) pairs in the given order
+    position = {material: n for n, material in enumerate(order)}
+    return [[(5*position[mat_ticker], coefficient) for mat_ticker, coefficient in system[material]['total'].items()] for material in order]
+
+def evaluate_fixed_point_rows(rows, base_values, values, row_list):
+    # B + A*T for the rows in row_list, as a flat list of 5 values per row
+    result = []
+    for n in row_list:
+        m = 5*n
+        p, s, t, e, c = base_values[m:m + 5]
+        for offset, coefficient in rows[n]:
+            p += coefficient*values[offset]
+            s += coefficient*values[offset + 1]
+            t += coefficient*values[offset + 2]
+            e += coefficient*values[offset + 3]
+            c += coefficient*values[offset + 4]
+        result.extend((p, s, t, e, c))
+    return result
+
+def color_material_system(system, order):
+    # Greedy coloring: no material depends on another material of its own color, so a color can be updated at once
+    position = {material: n for n, material in enumerate(order)}
+    neighbours = [set() for material in order]
+    for n, material in enumerate(order):
+        for mat_ticker in system[material]['total'].keys():
+            if mat_ticker != material:
+                neighbours[n].add(position[mat_ticker])
+                neighbours[position[mat_ticker]].add(n)
+    colors = [None]*len(order)
+    color_lists = []
+    for n in sorted(range(len(order)), key=lambda n: len(neighbours[n]), reverse=True):
+        used = {colors[k] for k in neighbours[n]}
+        color = 0
+        while color in used:
+            color = color + 1
+        colors[n] = color
+        if color == len(color_lists):
+            color_lists.append([])
+        color_lists[color].append(n)
+    return [sorted(color_list) for color_list in color_lists]
+
+class AndersonMixer:
+    # Anderson acceleration of a fixed point iteration x -> g(x) over the last depth steps
+    def __init__(self, depth = 5):
+        self.depth = depth
+        self.steps = []
+
+    def mix(self, x, gx):
+        f = [b - a for a, b in zip(x, gx)]
+        self.steps.append((f, gx))
+        if len(self.steps) > self.depth + 1:
+            self.steps.pop(0)
+        if len(self.steps) < 2:
+            return gx
+        # least squares: min |f - dF*gamma| over the differences of the residuals, solved by its normal equations
+        df = [[b - a for a, b in zip(self.steps[k][0], self.steps[k + 1][0])] for k in range(len(self.steps) - 1)]
+        dg = [[b - a for a, b in zip(self.steps[k][1], self.steps[k + 1][1])] for k in range(len(self.steps) - 1)]
+        matrix = [[sum(a*b for a, b in zip(df_i, df_j)) for df_j in df] for df_i in df]
+        rhs = [sum(a*b for a, b in zip(df_i, f)) for df_i in df]
+        gamma = solve_linear_system(matrix, rhs)
+        if gamma is None:
+            # the differences became dependent, restart from this step
+            self.steps = self.steps[-1:]
+            return gx
+        mixed = list(gx)
+        for weight, dg_k in zip(gamma, dg):
+            for n, value in enumerate(dg_k):
+                mixed[n] -= weight*value
+        return mixed
+
+def aitken_extrapolate(x0, x1, x2):
+    # Aitken delta squared extrapolation of three successive iterates along the dominant error mode: the ratio of
+    # successive differences estimates its eigenvalue and the remaining geometric series is added at once
+    d1 = [b - a for a, b in zip(x0, x1)]
+    d2 = [c - b for b, c in zip(x1, x2)]
+    norm = sum(a*a for a in d1)
+    if norm == 0:
+        return list(x2)
+    ratio = sum(a*b for a, b in zip(d1, d2))/norm
+    if not 0 < ratio < 1:
+        return list(x2)
+    return [c + ratio/(1 - ratio)*d for c, d in zip(x2, d2)]
+
+# read only inputs of the worker processes of a pool, set once per process by init_worker
+worker_data = None
+
+def init_worker(data):
+    global worker_data
+    worker_data = data
+
+def create_worker_pool(processes, data):
+    # Process pool whose workers get data once when they start (inherited without pickling where processes are
+    # forked), so only the tasks travel with the map calls.  The task functions read it from worker_data.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
     else:
-        buildings = query_FNAR_REST_list('https://rest.fnar.net/building/allbuildings', 'Ticker')
-        recipes = query_FNAR_REST_list('https://rest.fnar.net/recipes/allrecipes', 'StandardRecipeName')
-        materials = query_FNAR_REST_list('https://rest.fnar.net/material/allmaterials', 'Ticker')
-        planets = query_FNAR_REST_list('https://rest.fnar.net/planet/allplanets/full', 'PlanetNaturalId')
-        with open(cache_file, 'wb') as file:
-            print('writing pickle file')
-            pickle.dump([buildings, recipes, materials, planets], file)
+        context = multiprocessing.get_context()
+    return context.Pool(processes, initializer=init_worker, initargs=(data,))
 
+def run_fixed_point_chunk(task):
+    chunk, values = task
+    rows, base_values = worker_data
+    return evaluate_fixed_point_rows(rows, base_values, values, chunk)
+
+def solve_material_costs_jacobi(material_costs, material_info, buildings, base_setups, mode = 'jacobi', acceleration = 'anderson', processes = None, max_iterations = 1000, tolerance = 1e-10, depth = 5):
+    # Iterative solve of T = B + A*T without in place updates.  'jacobi' evaluates all materials from the previous
+    # iterate, 'colored' updates one color of independent materials at a time from the latest values.  The rows of an
+    # update are evaluated in chunks, on a process pool when processes > 1.  Iterates are accelerated with Anderson
+    # mixing or Aitken extrapolation.  Stops when the largest change of a sweep |sweep(T) - T| is at most tolerance
+    # times the largest cost; for 'jacobi' that is the residual |B + A*T - T|.
+    start_time = time.perf_counter()
+    system = build_material_cost_system(material_info, buildings, base_setups)
+    order = list(system.keys())
+    rows = compile_fixed_point_rows(system, order)
+    base_cost_table = PopulationCostTable.from_dict(material_costs, order)
+    base_values = base_cost_table.values.tolist()
+    if mode == 'colored':
+        updates = color_material_system(system, order)
+    else:
+        updates = [list(range(len(order)))]
+
+    # every update is split into chunks, a few per process
+    chunk_count = 1 if processes is None or processes <= 1 else 4*processes
+    update_chunks = []
+    for update in updates:
+        chunk_size = max(1, math.ceil(len(update)/chunk_count))
+        update_chunks.append([update[n:n + chunk_size] for n in range(0, len(update), chunk_size)])
+
+    pool = None
+    if chunk_count > 1:
+        pool = create_worker_pool(processes, (rows, base_values))
+
+    def evaluate(chunks, values):
+        if pool is None:
+            return [evaluate_fixed_point_rows(rows, base_values, values, chunk) for chunk in chunks]
+        values = array.array('d', values)
+        return pool.map(run_fixed_point_chunk, [(chunk, values) for chunk in chunks])
+
+    def sweep(values):
+        # one Jacobi step or one pass over all colors
+        values = list(values)
+        for chunks in update_chunks:
+            for chunk, chunk_values in zip(chunks, evaluate(chunks, values)):
+                for k, n in enumerate(chunk):
+                    values[5*n:5*n + 5] = chunk_values[5*k:5*k + 5]
+        return values
+
+    mixer = AndersonMixer(depth)
+    history = []
+    values = list(base_values)
+    iterations = max_iterations
+    residual = None
+    scale = None
+    try:
+        for n in range(max_iterations):
+            # the step of the sweep is the residual, so every iteration evaluates the rows once
+            stepped = sweep(values)
+            residual = max((abs(a - b) for a, b in zip(stepped, values)), default=0)
+            scale = max((abs(a) for a in values), default=0)
+            if instrumentation.tracing:
+                instrumentation.trace('material_iteration', 'Residual: {residual} after {iteration} iterations', iteration=n, residual=residual, scale=scale)
+            if residual <= tolerance*scale:
+                iterations = n
+                break
+            if acceleration == 'anderson':
+                values = mixer.mix(values, stepped)
+            elif acceleration == 'aitken':
+                history.append(stepped)
+                if len(history) == 3:
+                    values = aitken_extrapolate(*history)
+                    history = []
+                else:
+                    values = stepped
+            else:
+                values = stepped
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if iterations == max_iterations:
+        print('ERROR: the {} solve did not converge in {} iterations, last change {} (tolerance {} of {})'.format(mode, max_iterations, residual, tolerance, scale))
+
+    total_cost_table = PopulationCostTable(order, values)
+    input_cost_table, repair_cost_table, desired_profit_table, total_cost_table = calculate_total_cost_table(system, base_cost_table, total_cost_table)
+    final_residual = calculate_material_cost_residual(system, base_cost_table, total_cost_table)
+    stats = {'solver': mode, 'acceleration': acceleration, 'iterations': iterations, 'residual': final_residual['residual'], 'colors': len(updates), 'time': time.perf_counter() - start_time}
+    return input_cost_table, repair_cost_table, desired_profit_table, total_cost_table, stats
+
+def index_materials(recipes, materials, planets):
+    # Map material IDs to tickers and list the recipes and planets producing each material
     materials_byID = {}
     for material in materials.values():
         if material['MaterialId'] in materials_byID:
@@ -365,10 +1400,1579 @@ if __name__ == '__main__':
             else:
                 print('planet: {}, resource: {}, not found in materials.'.format(planet, item))
 
+    return materials_byID
+
+def calculate_base_setups(buildings, area_limit = BASE_AREA_LIMIT, layout_cache = None):
     base_setups = {}
     for building in buildings.keys():
-        base_list, building_count = calculate_single_building_base_setup(building, buildings)
+        base_list, building_count = calculate_single_building_base_setup(building, buildings, area_limit, layout_cache)
         base_setups[building] = {'BaseList': base_list, 'BuildingCount': building_count}
+    return base_setups
+
+def initialize_material_costs(materials, recipes, planets, buildings, materials_byID, recipe_selections, material_list = None):
+    # Base population cost and selected recipe, output and planet materials of each material
+    if material_list is None:
+        material_list = materials.keys()
+    material_costs = {}
+    material_info = {}
+    for material in material_list:
+        if not recipe_selections[material]:
+            continue
+        recipe, output, planet_specific_materials = get_selection_recipe(material, recipe_selections[material], recipes, planets, materials_byID)
+
+        # print('{},{},{}'.format(material, recipe['StandardRecipeName'], output))
+        material_costs[material] = calculate_population_cost(output, buildings[recipe['BuildingTicker']], recipe['TimeMs'])
+        material_info[material] = {'recipe': recipe, 'output': output, 'planet_mats': planet_specific_materials}
+    return material_costs, material_info
+
+def get_selection_recipe(material, selection, recipes, planets, materials_byID):
+    # Recipe, output per run and planet materials of a selection: a recipe name or the planet the material is extracted on
+    planet_specific_materials = ['MCG']
+    if '=>' in selection:
+        recipe = recipes[selection]
+        output = 0
+        for cur in recipe['Outputs']:
+            if cur['Ticker'] == material:
+                output = cur['Amount']
+    else:
+        planet = planets[selection]
+        planet_specific_materials = get_planet_build_requirements(planet)
+        materialinfo = {}
+        for resource in planet['Resources']:
+            if materials_byID[resource['MaterialId']] == material:
+                materialinfo = resource
+                materialinfo['Ticker'] = material
+                break
+        if 'ResourceType' not in materialinfo:
+            print('ERROR: {} not found.'.format(material))
+
+        recipe_key, output = get_recipe_output_from_material_type(materialinfo['ResourceType'], materialinfo['Factor'])
+        recipe = recipes[recipe_key]
+    return recipe, output, planet_specific_materials
+
+POPULATION_TYPES = ['Pioneer', 'Settler', 'Technician', 'Engineer', 'Scientist']
+
+# consumable costs per day per 100 units of population
+WORKFORCE_BASKETS = {
+    'Pioneer': [{'mat':'COF','amount':0.5},{'mat':'DW','amount':4},{'mat':'RAT','amount':4},{'mat':'OVE','amount':0.5},{'mat':'PWO','amount':0.2}],
+    'Settler': [{'mat':'DW','amount':5},{'mat':'RAT','amount':6},{'mat':'KOM','amount':1},{'mat':'EXO','amount':0.5},{'mat':'REP','amount':0.2},{'mat':'PT','amount':0.5}],
+    'Technician': [{'mat':'DW','amount':7.5},{'mat':'RAT','amount':7},{'mat':'ALE','amount':1},{'mat':'MED','amount':0.5},{'mat':'SC','amount':0.1},{'mat':'HMS','amount':0.5},{'mat':'SCN','amount':0.1}],
+    'Engineer': [{'mat':'DW','amount':10},{'mat':'MED','amount':0.5},{'mat':'GIN','amount':1},{'mat':'FIM','amount':7},{'mat':'VG','amount':0.2},{'mat':'HSS','amount':0.2},{'mat':'PDA','amount':0.1}],
+    'Scientist': [{'mat':'DW','amount':10},{'mat':'MED','amount':0.5},{'mat':'WIN','amount':1},{'mat':'MEA','amount':7},{'mat':'NST','amount':0.1},{'mat':'LC','amount':0.2},{'mat':'WS','amount':0.1}],
+    }
+
+def load_workforce_baskets(baskets_file):
+    # JSON {population type: [{"mat", "amount"}, ...]}; population types left out keep their default basket
+    with open(baskets_file, 'rt') as file:
+        baskets = json.load(file)
+    unknown = [population for population in baskets.keys() if population not in WORKFORCE_BASKETS]
+    if unknown:
+        raise Exception('Error in load_workforce_baskets.  Unknown population types: {}'.format(', '.join(unknown)))
+    return dict(WORKFORCE_BASKETS, **baskets)
+
+def calculate_workforce_coefficients(total_costs, baskets = WORKFORCE_BASKETS):
+    # 5 x 5 matrix: row i is the basket of population type i, column j its cost in units of population type j,
+    # scaled to 1 unit of population per ms
+    coefficients = []
+    for population in POPULATION_TYPES:
+        basket_cost = PopulationCost()
+        for item in baskets[population]:
+            if item['mat'] not in total_costs:
+                raise Exception('Error in calculate_workforce_coefficients.  {} basket material {} has no cost.'.format(population, item['mat']))
+            basket_cost = basket_cost + total_costs[item['mat']]*item['amount']
+        coefficients.append([cost/100/DAY_TIME_MS for cost in population_cost_to_list(basket_cost)])
+    return coefficients
+
+def solve_linear_system(matrix, rhs):
+    # Gaussian elimination with partial pivoting of a small dense system; returns None if it is singular
+    size = len(matrix)
+    rows = [list(matrix[i]) + [rhs[i]] for i in range(size)]
+    scale = max([abs(value) for row in matrix for value in row] + [1.0])
+    for k in range(size):
+        pivot = max(range(k, size), key=lambda i: abs(rows[i][k]))
+        if abs(rows[pivot][k]) <= 1e-14*scale:
+            return None
+        rows[k], rows[pivot] = rows[pivot], rows[k]
+        for i in range(k + 1, size):
+            factor = rows[i][k]/rows[k][k]
+            if factor != 0:
+                for j in range(k, size + 1):
+                    rows[i][j] -= factor*rows[k][j]
+    solution = [0.0]*size
+    for k in reversed(range(size)):
+        solution[k] = (rows[k][size] - sum(rows[k][j]*solution[j] for j in range(k + 1, size)))/rows[k][k]
+    return solution
+
+def solve_workforce_costs(coefficients, pioneer_cost = PIONEER_COST):
+    # With PIOc fixed, SETc..SCIc solve the 4 x 4 system (I - A)w = PIOc*a, where A holds what the settler to
+    # scientist baskets cost in their own population types and a their pioneer parts.  The pioneer basket is not
+    # used since the anchor fixes PIOc.  A singular system or one with negative costs (the baskets cost more
+    # workforce than they support, so the old fixed point iteration diverges) is reported as an exception.
+    matrix = [[(1.0 if i == j else 0.0) - coefficients[i][j] for j in range(1, 5)] for i in range(1, 5)]
+    rhs = [coefficients[i][0]*pioneer_cost for i in range(1, 5)]
+    solution = solve_linear_system(matrix, rhs)
+    if solution is None:
+        raise Exception('Error in solve_workforce_costs.  The workforce cost system is singular.')
+    workforce_costs = [pioneer_cost] + solution
+    if not all(math.isfinite(cost) and cost >= 0 for cost in workforce_costs):
+        raise Exception('Error in solve_workforce_costs.  No non-negative solution, the consumption baskets do not converge: {}'.format(workforce_costs))
+    return workforce_costs
+
+def calculate_workforce_costs(total_costs, pioneer_cost = PIONEER_COST, baskets = WORKFORCE_BASKETS):
+    # calculate costs for workers
+    return solve_workforce_costs(calculate_workforce_coefficients(total_costs, baskets), pioneer_cost)
+
+def calculate_workforce_cost_sweep(total_costs, variants, baskets = WORKFORCE_BASKETS, pioneer_cost = PIONEER_COST):
+    # Workforce costs of many {"name", "baskets", "pioneer_cost"} variants ("baskets" overrides single population
+    # types of the given baskets).  Each basket set is solved once for a unit anchor and rescaled to every anchor
+    # using it.  Failing variants get an "error" instead of costs.
+    unit_costs = {}
+    results = []
+    for variant in variants:
+        variant_baskets = dict(baskets, **variant.get('baskets', {}))
+        basket_key = json.dumps(variant_baskets, sort_keys=True)
+        if basket_key not in unit_costs:
+            try:
+                unit_costs[basket_key] = solve_workforce_costs(calculate_workforce_coefficients(total_costs, variant_baskets), 1.0)
+            except Exception as error:
+                unit_costs[basket_key] = error
+        result = {'name': variant.get('name'), 'pioneer_cost': variant.get('pioneer_cost', pioneer_cost)}
+        if isinstance(unit_costs[basket_key], Exception):
+            result['error'] = str(unit_costs[basket_key])
+        else:
+            result['workforce_costs'] = rescale_workforce_costs(unit_costs[basket_key], result['pioneer_cost'])
+        results.append(result)
+    return results
+
+def population_cost_to_currency(population_cost, workforce_costs):
+    PIOc, SETc, TECc, ENGc, SCIc = workforce_costs
+    return population_cost.Pioneer*PIOc + population_cost.Settler*SETc + population_cost.Technician*TECc + population_cost.Engineer*ENGc + population_cost.Scientist*SCIc
+
+def population_rows_to_tables(rows):
+    # Split (key, [PopulationCost per column]) pairs into the key list and one PopulationCostTable per column
+    rows = list(rows)
+    keys = [key for key, row in rows]
+    column_count = len(rows[0][1]) if rows else 0
+    tables = [PopulationCostTable(keys) for column in range(column_count)]
+    for n, (key, row) in enumerate(rows):
+        for table, cost in zip(tables, row):
+            table.set_row(n, population_cost_to_list(cost))
+    return keys, tables
+
+def convert_population_tables(tables, workforce_costs):
+    # Currency columns of population cost tables, one matrix-vector product per table
+    return [table.to_currency(workforce_costs) for table in tables]
+
+def convert_population_rows(rows, workforce_costs):
+    # {key: [currency per column]} of {key: [PopulationCost per column]}
+    keys, tables = population_rows_to_tables(rows.items())
+    return {key: list(costs) for key, costs in zip(keys, zip(*convert_population_tables(tables, workforce_costs)))}
+
+def rescale_workforce_costs(workforce_costs, pioneer_cost):
+    # With PIOc fixed, the other workforce costs solve a homogeneous linear system, so all of them (and with
+    # them every currency cost) scale with the anchor.  No material or workforce solve is needed.
+    factor = pioneer_cost/workforce_costs[0]
+    return [cost*factor for cost in workforce_costs]
+
+def calculate_material_cost_rows(material_costs, input_costs, repair_costs, desired_profit, total_costs, material_list = None):
+    # total, repair, input, desired profit and base unit population cost of each material
+    if material_list is None:
+        material_list = total_costs.keys()
+    rows = {}
+    for material in material_list:
+        rows[material] = [total_costs[material], repair_costs[material], input_costs[material], desired_profit[material], material_costs[material]]
+    return rows
+
+class RecipeBatchPricer:
+    # Prices lists of recipes against solved material costs.  With every material at its full total cost the repair
+    # cost and desired profit of a recipe run only depend on the building and planet materials, scaled by TimeMs, so
+    # they are kept as population cost rates per ms for each (building, planet materials) and computed once.
+    def __init__(self, buildings, base_setups, material_costs, input_costs, repair_costs, desired_profit):
+        self.buildings = buildings
+        self.base_setups = base_setups
+        self.full_costs = PopulationCostTable.from_dict({material: material_costs[material] + input_costs[material] + repair_costs[material] + desired_profit[material] for material in material_costs.keys()})
+        self.quantity_table = BuildQuantityTable(buildings, base_setups)
+        self.rates = {}
+
+    @classmethod
+    def from_total_costs(cls, buildings, base_setups, total_costs):
+        # pricer for total costs only, e.g. from solve_material_cost_components
+        zero = PopulationCost()
+        zero_costs = {material: zero for material in total_costs.keys()}
+        return cls(buildings, base_setups, total_costs, zero_costs, zero_costs, zero_costs)
+
+    def building_rates(self, building_ticker, planet_mats = ('MCG',)):
+        # repair cost and desired profit per ms of recipe time for an output of 1 unit per run
+        rate_key = (building_ticker, tuple(planet_mats))
+        if rate_key not in self.rates:
+            input_coefficients, repair_coefficients, profit_coefficients = calculate_material_cost_coefficients(1, [], self.quantity_table.get(building_ticker, planet_mats), 1)
+            rates = self.full_costs.combine({'repair': repair_coefficients, 'profit': profit_coefficients})
+            self.rates[rate_key] = (rates['repair'], rates['profit'])
+        return self.rates[rate_key]
+
+    def price_recipe_tables(self, recipe_list, recipes):
+        # input cost and base cost of each recipe for an output of 1 unit per run, as PopulationCostTables
+        recipe_list = [recipe_name for recipe_name in recipe_list if recipes[recipe_name]['Outputs']]
+        input_coefficients = {}
+        for recipe_name in recipe_list:
+            coefficients = {}
+            for input_mat in recipes[recipe_name]['Inputs']:
+                coefficients[input_mat['Ticker']] = coefficients.get(input_mat['Ticker'], 0) + input_mat['Amount']
+            input_coefficients[recipe_name] = coefficients
+        input_cost_table = self.full_costs.combine(input_coefficients, recipe_list)
+        base_cost_table = calculate_population_cost_table(recipe_list, [1]*len(recipe_list), [self.buildings[recipes[recipe_name]['BuildingTicker']] for recipe_name in recipe_list], [recipes[recipe_name]['TimeMs'] for recipe_name in recipe_list])
+        return recipe_list, input_cost_table, base_cost_table
+
+    def price_recipe_total_table(self, recipe_list, recipes, planet_mats = ('MCG',)):
+        # total cost of each recipe with outputs for an output of 1 unit per run, as one PopulationCostTable
+        recipe_list, input_cost_table, base_cost_table = self.price_recipe_tables(recipe_list, recipes)
+        rate_table = PopulationCostTable(recipe_list)
+        for n, recipe_name in enumerate(recipe_list):
+            repair_rate, profit_rate = self.building_rates(recipes[recipe_name]['BuildingTicker'], planet_mats)
+            rate_table.set_row(n, population_cost_to_list(repair_rate + profit_rate))
+        return base_cost_table + input_cost_table + rate_table.scale_rows([recipes[recipe_name]['TimeMs'] for recipe_name in recipe_list])
+
+    def price_recipes(self, recipe_list, recipes, planet_mats = ('MCG',)):
+        # total, repair, input, desired profit and base cost rows of recipes with outputs, keyed by recipe name
+        return dict(self.iterate_recipe_rows(recipe_list, recipes, [(None, planet_mats)]))
+
+    def price_recipes_on_planets(self, recipe_list, recipes, planets, planet_list = None):
+        # The same rows keyed by (planet, recipe), using the build requirements of every planet
+        if planet_list is None:
+            planet_list = planets.keys()
+        contexts = [(planet_id, tuple(get_planet_build_requirements(planets[planet_id]))) for planet_id in planet_list]
+        return dict(self.iterate_recipe_rows(recipe_list, recipes, contexts))
+
+    def iterate_recipe_rows(self, recipe_list, recipes, contexts):
+        # contexts: (planet id or None, planet materials) pairs.  Input and base costs do not depend on the planet.
+        recipe_list, input_cost_table, base_cost_table = self.price_recipe_tables(recipe_list, recipes)
+        for planet_id, planet_mats in contexts:
+            for n, recipe_name in enumerate(recipe_list):
+                recipe = recipes[recipe_name]
+                repair_rate, profit_rate = self.building_rates(recipe['BuildingTicker'], planet_mats)
+                input_cost = PopulationCost(*input_cost_table.row(n))
+                base_cost = PopulationCost(*base_cost_table.row(n))
+                repair_cost = repair_rate*recipe['TimeMs']
+                desired_profit = profit_rate*recipe['TimeMs']
+                row = [base_cost + input_cost + repair_cost + desired_profit, repair_cost, input_cost, desired_profit, base_cost]
+                if planet_id is None:
+                    yield recipe['StandardRecipeName'], row
+                else:
+                    yield (planet_id, recipe['StandardRecipeName']), row
+
+def calculate_recipe_cost_rows(recipes, buildings, base_setups, material_costs, input_costs, repair_costs, desired_profit, recipe_list = None):
+    # Cost all recipes based on the selected material recipes
+    if recipe_list is None:
+        recipe_list = recipes.keys()
+    pricer = RecipeBatchPricer(buildings, base_setups, material_costs, input_costs, repair_costs, desired_profit)
+    return pricer.price_recipes(recipe_list, recipes)
+
+def calculate_natural_resource_unit_cost(recipe_key, planet_mats, recipes, buildings, quantity_table, material_costs, input_costs, repair_costs, desired_profit):
+    # total, repair, input, desired profit and base cost of an extraction recipe for an output of 1 unit per run
+    recipe = recipes[recipe_key]
+    building = buildings[recipe['BuildingTicker']]
+    base_cost = calculate_population_cost(1, building, recipe['TimeMs'])
+    input_costs_temp, repair_costs_temp, desired_profit_temp, total_costs_temp = calculate_total_cost('', 1, recipe['Inputs'], quantity_table.get(recipe['BuildingTicker'], planet_mats), recipe['TimeMs'], material_costs, input_costs, repair_costs, desired_profit, base_cost, False)
+    return [total_costs_temp, repair_costs_temp, input_costs_temp, desired_profit_temp, base_cost]
+
+def calculate_natural_resource_cost_rows(planets, recipes, buildings, base_setups, materials_byID, material_costs, input_costs, repair_costs, desired_profit, planet_list = None, processes = None):
+    # Cost every natural resource of every planet, keyed by (planet, material).
+    # Every cost of an extraction scales with 1/output, so each (recipe, planet materials) combination is priced
+    # once per unit of output and then scaled for all planets sharing it.
+    if planet_list is None:
+        planet_list = list(planets.keys())
+    if processes is not None and processes > 1 and len(planet_list) > 1:
+        return calculate_natural_resource_cost_rows_parallel(planets, recipes, buildings, base_setups, materials_byID, material_costs, input_costs, repair_costs, desired_profit, planet_list, processes)
+    return dict(iterate_natural_resource_cost_rows(planets, recipes, buildings, base_setups, materials_byID, material_costs, input_costs, repair_costs, desired_profit, planet_list))
+
+def iterate_natural_resource_cost_rows(planets, recipes, buildings, base_setups, materials_byID, material_costs, input_costs, repair_costs, desired_profit, planet_list = None):
+    # Generator version of calculate_natural_resource_cost_rows yielding ((planet, material), row) one at a time
+    if planet_list is None:
+        planet_list = planets.keys()
+    quantity_table = BuildQuantityTable(buildings, base_setups)
+    unit_costs = {}
+    for planet_id in planet_list:
+        planet = planets[planet_id]
+        planet_specific_materials = tuple(get_planet_build_requirements(planet))
+        for item in planet['Resources']:
+            material_ticker = materials_byID[item['MaterialId']]
+            recipe_key, output = get_recipe_output_from_material_type(item['ResourceType'], item['Factor'])
+            combination = (recipe_key, planet_specific_materials)
+            if combination not in unit_costs:
+                unit_costs[combination] = calculate_natural_resource_unit_cost(recipe_key, planet_specific_materials, recipes, buildings, quantity_table, material_costs, input_costs, repair_costs, desired_profit)
+            scale = 1/output
+            yield (planet['PlanetNaturalId'], material_ticker), [unit_cost*scale for unit_cost in unit_costs[combination]]
+
+def run_natural_resource_chunk(planet_list):
+    return calculate_natural_resource_cost_rows(*worker_data, planet_list)
+
+def calculate_natural_resource_cost_rows_parallel(planets, recipes, buildings, base_setups, materials_byID, material_costs, input_costs, repair_costs, desired_profit, planet_list, processes):
+    # Split the planets into chunks priced on a process pool; rows keep the order of planet_list
+    data = (planets, recipes, buildings, base_setups, materials_byID, material_costs, input_costs, repair_costs, desired_profit)
+    chunk_size = max(1, math.ceil(len(planet_list)/(4*processes)))
+    chunks = [planet_list[n:n + chunk_size] for n in range(0, len(planet_list), chunk_size)]
+    rows = {}
+    with create_worker_pool(processes, data) as pool:
+        for chunk_rows in pool.map(run_natural_resource_chunk, chunks):
+            rows.update(chunk_rows)
+    return rows
+
+def load_building_mix(mix_file, buildings, recipes, planets, materials_byID):
+    # {"buildings": [{"building": ticker, "count": n, "recipe": name or "resource": ticker}], "planets": [planet ids]}.
+    # "recipe" or "resource" (for extractors) make a building produce; "planets" is optional.
+    with open(mix_file, 'r') as file:
+        mix = json.load(file)
+    # extractor buildings of every resource found on some planet
+    resource_buildings = {}
+    for planet in planets.values():
+        for item in planet['Resources']:
+            if item['MaterialId'] in materials_byID:
+                recipe_key, output = get_recipe_output_from_material_type(item['ResourceType'], item['Factor'])
+                resource_buildings.setdefault(materials_byID[item['MaterialId']], set()).add(recipes[recipe_key]['BuildingTicker'])
+    for entry in mix['buildings']:
+        if 'building' not in entry or entry.get('count', 1) <= 0:
+            raise Exception('Error in load_building_mix.  Every building needs a ticker and a positive count: {}'.format(entry))
+        if entry['building'] not in buildings:
+            raise Exception('Error in load_building_mix.  Unknown building: {}'.format(entry['building']))
+        if 'recipe' in entry:
+            if entry['recipe'] not in recipes:
+                raise Exception('Error in load_building_mix.  Unknown recipe: {}'.format(entry['recipe']))
+            if recipes[entry['recipe']]['BuildingTicker'] != entry['building']:
+                raise Exception('Error in load_building_mix.  Recipe {} does not run in {}'.format(entry['recipe'], entry['building']))
+        if 'resource' in entry:
+            if entry['resource'] not in resource_buildings:
+                raise Exception('Error in load_building_mix.  Unknown resource or one found on no planet: {}'.format(entry['resource']))
+            if entry['building'] not in resource_buildings[entry['resource']]:
+                raise Exception('Error in load_building_mix.  {} is extracted with {}, not {}'.format(entry['resource'], ', '.join(sorted(resource_buildings[entry['resource']])), entry['building']))
+    return mix['buildings'], mix.get('planets')
+
+class ExpansionPlanner:
+    # Prices complete bases of a building mix (with its habitation) on many planets at once, in currency at the
+    # solved material and workforce costs.  Everything that does not depend on the planet is worked out once per mix;
+    # per planet only the planet material vector of its build requirements and the extracted resource factors differ.
+    def __init__(self, buildings, recipes, planets, materials_byID, base_setups, total_costs, workforce_costs):
+        self.buildings = buildings
+        self.recipes = recipes
+        self.planets = planets
+        self.materials_byID = materials_byID
+        self.workforce_costs = workforce_costs
+        self.quantity_table = BuildQuantityTable(buildings, base_setups)
+        total_cost_table = PopulationCostTable.from_dict(total_costs)
+        self.prices = dict(zip(total_cost_table.keys(), total_cost_table.to_currency(workforce_costs)))
+        self.planet_mats = {planet_id: tuple(get_planet_build_requirements(planet)) for planet_id, planet in planets.items()}
+        # resource ticker -> {planet: resource}
+        self.resources = {}
+        for planet_id, planet in planets.items():
+            for item in planet['Resources']:
+                if item['MaterialId'] in materials_byID:
+                    self.resources.setdefault(materials_byID[item['MaterialId']], {})[planet_id] = item
+
+    def price_quantities(self, quantities):
+        # currency value of {material: quantity}, KeyError for materials without a cost
+        return sum(quantity*self.prices[mat_ticker] for mat_ticker, quantity in quantities.items())
+
+    def compile_mix(self, building_mix):
+        # Planet independent part of a base: its buildings with habitation, build and daily repair materials of the
+        # buildings themselves, daily workforce cost and daily value of the recipe production
+        building_counts = {}
+        population = [0, 0, 0, 0, 0]
+        for entry in building_mix:
+            building = self.buildings[entry['building']]
+            count = entry.get('count', 1)
+            building_counts[entry['building']] = building_counts.get(entry['building'], 0) + count
+            for n, population_type in enumerate(['Pioneers', 'Settlers', 'Technicians', 'Engineers', 'Scientists']):
+                population[n] = population[n] + building[population_type]*count
+        # storage and other buildings without workers need no habitation
+        habitation_list = calculate_habitation_needs(*population) if any(population) else []
+        for habitation in habitation_list:
+            building_counts[habitation['Ticker']] = building_counts.get(habitation['Ticker'], 0) + habitation['Count']
+
+        build_quantities = {}
+        repair_quantities = {}
+        area = 0
+        for building_ticker, count in building_counts.items():
+            building = self.buildings[building_ticker]
+            area = area + building['AreaCost']*count
+            for building_mat in building['BuildingCosts']:
+                build_quantities[building_mat['CommodityTicker']] = build_quantities.get(building_mat['CommodityTicker'], 0) + building_mat['Amount']*count
+            for mat_ticker, mat_repair_quantity in self.quantity_table.get(building_ticker, ())['repair']:
+                repair_quantities[mat_ticker] = repair_quantities.get(mat_ticker, 0) + mat_repair_quantity*count*DAY_TIME_MS/REPAIR_PERIOD_MS
+
+        # every material the base is valued with needs a cost
+        valued = set(build_quantities.keys()) | set(repair_quantities.keys())
+        for entry in building_mix:
+            if 'recipe' in entry:
+                valued.update(item['Ticker'] for item in self.recipes[entry['recipe']]['Inputs'] + self.recipes[entry['recipe']]['Outputs'])
+            elif 'resource' in entry:
+                valued.add(entry['resource'])
+        missing = sorted(valued.difference(self.prices.keys()))
+        if missing:
+            raise Exception('Error in compile_mix.  Materials of the base without a cost: {}'.format(', '.join(missing)))
+
+        daily_workforce = sum(building_count*workforce_cost*DAY_TIME_MS for building_count, workforce_cost in zip(population, self.workforce_costs))
+        daily_production = 0
+        extraction = []
+        for entry in building_mix:
+            count = entry.get('count', 1)
+            if 'recipe' in entry:
+                recipe = self.recipes[entry['recipe']]
+                run_value = sum(item['Amount']*self.prices[item['Ticker']] for item in recipe['Outputs']) - sum(item['Amount']*self.prices[item['Ticker']] for item in recipe['Inputs'])
+                daily_production = daily_production + run_value*count*DAY_TIME_MS/recipe['TimeMs']
+            elif 'resource' in entry:
+                extraction.append((entry['building'], entry['resource'], count))
+        return {
+            'buildings': building_counts,
+            'area': area,
+            'build_cost': self.price_quantities(build_quantities),
+            'daily_repair': self.price_quantities(repair_quantities),
+            'daily_workforce': daily_workforce,
+            'daily_production': daily_production,
+            'extraction': extraction,
+            'producing': daily_production != 0 or bool(extraction),
+            }
+
+    def compile_planet_materials(self, compiled_mix, planet_mats):
+        # build cost and daily repair cost of the planet materials a base needs for one set of build requirements
+        build_quantities = {}
+        repair_quantities = {}
+        for building_ticker, count in compiled_mix['buildings'].items():
+            for mat_ticker, mat_build_quantity, mat_repair_quantity in self.quantity_table.get_planet_quantities(self.buildings[building_ticker]['AreaCost'], planet_mats):
+                build_quantities[mat_ticker] = build_quantities.get(mat_ticker, 0) + mat_build_quantity*count
+                repair_quantities[mat_ticker] = repair_quantities.get(mat_ticker, 0) + mat_repair_quantity*count*DAY_TIME_MS/REPAIR_PERIOD_MS
+        return self.price_quantities(build_quantities), self.price_quantities(repair_quantities)
+
+    def plan(self, building_mix, planet_list = None):
+        # Build cost, daily upkeep (repairs and workforce), daily ROI share of the build cost and, for producing mixes,
+        # daily production value and payback days of the base on every planet, best planets first.  Planets lacking an
+        # extracted resource are left out.
+        if planet_list is None:
+            planet_list = self.planets.keys()
+        compiled_mix = self.compile_mix(building_mix)
+        planet_costs = {}
+        results = []
+        for planet_id in planet_list:
+            if planet_id not in self.planet_mats:
+                print('ERROR: unknown planet: {}'.format(planet_id))
+                continue
+            planet_mats = self.planet_mats[planet_id]
+            if planet_mats not in planet_costs:
+                try:
+                    planet_costs[planet_mats] = self.compile_planet_materials(compiled_mix, planet_mats)
+                except KeyError as error:
+                    print('ERROR: planet material {} of {} has no cost'.format(error, planet_id))
+                    planet_costs[planet_mats] = None
+            if planet_costs[planet_mats] is None:
+                continue
+            planet_build_cost, planet_daily_repair = planet_costs[planet_mats]
+
+            daily_production = compiled_mix['daily_production']
+            missing_resource = False
+            for building_ticker, resource, count in compiled_mix['extraction']:
+                item = self.resources.get(resource, {}).get(planet_id)
+                if item is None:
+                    missing_resource = True
+                    break
+                recipe_key, output = get_recipe_output_from_material_type(item['ResourceType'], item['Factor'])
+                recipe = self.recipes[recipe_key]
+                if recipe['BuildingTicker'] != building_ticker:
+                    missing_resource = True
+                    break
+                daily_production = daily_production + output*self.prices[resource]*count*DAY_TIME_MS/recipe['TimeMs']
+            if missing_resource:
+                continue
+
+            build_cost = compiled_mix['build_cost'] + planet_build_cost
+            daily_upkeep = compiled_mix['daily_repair'] + planet_daily_repair + compiled_mix['daily_workforce']
+            result = {
+                'planet': planet_id,
+                'planet_materials': planet_mats,
+                'area': compiled_mix['area'],
+                'build_cost': build_cost,
+                'daily_upkeep': daily_upkeep,
+                'daily_roi': build_cost*DAY_TIME_MS/ROI_PERIOD_MS,
+                'daily_production': daily_production,
+                'payback_days': None,
+                }
+            margin = daily_production - daily_upkeep
+            if margin > 0:
+                result['payback_days'] = build_cost/margin
+            results.append(result)
+
+        if compiled_mix['producing']:
+            results.sort(key=lambda result: (result['payback_days'] is None, result['payback_days'] or 0))
+        else:
+            results.sort(key=lambda result: result['build_cost'] + ROI_PERIOD_DAYS*result['daily_upkeep'])
+        return results
+
+def write_expansion_plan(filename, results):
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['rank', 'planet', 'planet materials', 'area', 'build cost', 'daily upkeep', 'daily ROI', 'daily production', 'payback days'])
+        for rank, result in enumerate(results, 1):
+            writer.writerow([rank, result['planet'], ' '.join(result['planet_materials']), result['area'], result['build_cost'], result['daily_upkeep'], result['daily_roi'], result['daily_production'], '' if result['payback_days'] is None else result['payback_days']])
+
+# Output tables: key columns and the cost columns following them in every row
+PRICE_TABLES = {
+    'material_costs': {'keys': ['material'], 'costs': ['total cost', 'repair cost', 'input cost', 'desired profit', 'base unit cost']},
+    'recipe_costs': {'keys': ['recipe'], 'costs': ['total cost', 'repair cost', 'input cost', 'desired profit', 'base recipe cost']},
+    'natural_resource_costs': {'keys': ['planet', 'material'], 'costs': ['total cost', 'repair cost', 'input cost', 'desired profit', 'base recipe cost']},
+    }
+
+def iterate_price_table_rows(rows, workforce_costs, chunk_size = 4096):
+    # Turn (key, population cost row) pairs into flat rows of key fields followed by currency costs.
+    # Rows are converted a chunk of tables at a time, so generators stay streamed.
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        keys, tables = population_rows_to_tables(chunk)
+        for key, costs in zip(keys, zip(*convert_population_tables(tables, workforce_costs))):
+            key_fields = list(key) if isinstance(key, tuple) else [key]
+            yield key_fields + list(costs)
+
+def price_table_columns(table):
+    return [column.replace(' ', '_') for column in PRICE_TABLES[table]['keys'] + PRICE_TABLES[table]['costs']]
+
+class PriceTableWriter:
+    # Base of the output writers, which add write_table(table, rows).  write_table() consumes the rows as they come,
+    # so generators can be passed in without holding a whole table in memory.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        pass
+
+class CSVPriceWriter(PriceTableWriter):
+    # <table>.csv files, quoted where needed
+    def __init__(self, directory = '.', buffer_size = 1 << 20):
+        self.directory = directory
+        self.buffer_size = buffer_size
+
+    def write_table(self, table, rows):
+        with open(os.path.join(self.directory, table + '.csv'), 'w', newline='', buffering=self.buffer_size) as file:
+            writer = csv.writer(file)
+            writer.writerow(PRICE_TABLES[table]['keys'] + PRICE_TABLES[table]['costs'])
+            writer.writerows(rows)
+
+class NDJSONPriceWriter(PriceTableWriter):
+    # <table>.ndjson files, one JSON object per row
+    def __init__(self, directory = '.', buffer_size = 1 << 20):
+        self.directory = directory
+        self.buffer_size = buffer_size
+
+    def write_table(self, table, rows):
+        columns = price_table_columns(table)
+        with open(os.path.join(self.directory, table + '.ndjson'), 'w', buffering=self.buffer_size) as file:
+            for row in rows:
+                file.write(json.dumps(dict(zip(columns, row))) + '\n')
+
+class ParquetPriceWriter(PriceTableWriter):
+    # <table>.parquet files written in record batches.  Needs pyarrow.
+    def __init__(self, directory = '.', batch_size = 65536):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception('Error in ParquetPriceWriter.  The parquet output format needs pyarrow (pip install pyarrow)')
+        self.pyarrow = pyarrow
+        self.parquet = pyarrow.parquet
+        self.directory = directory
+        self.batch_size = batch_size
+
+    def write_table(self, table, rows):
+        pa = self.pyarrow
+        key_count = len(PRICE_TABLES[table]['keys'])
+        columns = price_table_columns(table)
+        schema = pa.schema([(column, pa.string() if n < key_count else pa.float64()) for n, column in enumerate(columns)])
+        with self.parquet.ParquetWriter(os.path.join(self.directory, table + '.parquet'), schema) as writer:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    writer.write_batch(pa.RecordBatch.from_arrays([pa.array(column, type=field.type) for column, field in zip(zip(*batch), schema)], schema=schema))
+                    batch = []
+            if batch:
+                writer.write_batch(pa.RecordBatch.from_arrays([pa.array(column, type=field.type) for column, field in zip(zip(*batch), schema)], schema=schema))
+
+class SQLitePriceWriter(PriceTableWriter):
+    # All tables in one SQLite database, indexed on their material, recipe and planet columns.
+    # Each table is replaced as a whole when it is written again.
+    def __init__(self, path = 'price_tables.sqlite'):
+        self.connection = sqlite3.connect(path)
+
+    def write_table(self, table, rows):
+        key_columns = PRICE_TABLES[table]['keys']
+        columns = price_table_columns(table)
+        with self.connection:
+            self.connection.execute('DROP TABLE IF EXISTS {}'.format(table))
+            self.connection.execute('CREATE TABLE {} ({})'.format(table, ', '.join('{} {}'.format(column, 'TEXT' if n < len(key_columns) else 'REAL') for n, column in enumerate(columns))))
+            self.connection.executemany('INSERT INTO {} VALUES ({})'.format(table, ', '.join('?'*len(columns))), rows)
+            for column in key_columns:
+                self.connection.execute('CREATE INDEX {0}_{1} ON {0} ({1})'.format(table, column))
+
+    def close(self):
+        self.connection.close()
+
+OUTPUT_WRITERS = {
+    'csv': CSVPriceWriter,
+    'ndjson': NDJSONPriceWriter,
+    'parquet': ParquetPriceWriter,
+    'sqlite': SQLitePriceWriter,
+    }
+
+def create_price_writer(output_format, output_path = None):
+    # output_path is the directory of the file based formats and the database file of sqlite
+    if output_format not in OUTPUT_WRITERS:
+        raise Exception('Error in create_price_writer.  Unknown output format: {}'.format(output_format))
+    if output_path is None:
+        return OUTPUT_WRITERS[output_format]()
+    return OUTPUT_WRITERS[output_format](output_path)
+
+def write_price_tables(writer, workforce_costs, material_rows, recipe_rows, natural_resource_rows):
+    # The row arguments are iterables of (key, population cost row) pairs, e.g. dict.items() or a generator
+    for table, rows in [('material_costs', material_rows), ('recipe_costs', recipe_rows), ('natural_resource_costs', natural_resource_rows)]:
+        with instrumentation.stage('write ' + table):
+            writer.write_table(table, iterate_price_table_rows(rows, workforce_costs))
+
+def calculate_input_hash(*items):
+    # Stable hash of JSON serializable run inputs
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(json.dumps(item, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+def calculate_settings_hash(baskets, area_limit):
+    # Hash of the settings that change prices besides the data, selections, periods and pioneer cost: the
+    # consumption baskets, the planet material rules and the area limit of the base setups
+    return calculate_input_hash(baskets, PLANET_MATERIAL_QUANTITIES, area_limit)
+
+PRICE_HISTORY_VERSION = 1
+PRICE_HISTORY_COLUMNS = ['total_cost', 'repair_cost', 'input_cost', 'desired_profit', 'base_cost']
+
+class PriceHistoryStore:
+    # Local SQLite history of solved runs.  Each run stores its inputs (data, selections and settings hashes, periods,
+    # pioneer cost, workforce costs) and only the price rows that changed since the run before it, so the store grows with
+    # the changes.  The latest value of every row is kept in a head table to find those changes.
+    def __init__(self, path = 'price_history.sqlite'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)')
+        row = self.connection.execute("SELECT value FROM metadata WHERE key = 'schema_version'").fetchone()
+        if row is not None and int(row[0]) != PRICE_HISTORY_VERSION:
+            raise Exception('Error in PriceHistoryStore.  {} has schema version {}, expected {}.'.format(path, row[0], PRICE_HISTORY_VERSION))
+        value_columns = ', '.join('{} REAL'.format(column) for column in PRICE_HISTORY_COLUMNS)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, created_at REAL, data_hash TEXT, selections_hash TEXT, settings_hash TEXT, roi_period_days REAL, repair_period_days REAL, pioneer_cost REAL, workforce_costs TEXT, changed INTEGER)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at)')
+        # a row with NULL values marks a price that disappeared in that run
+        self.connection.execute('CREATE TABLE IF NOT EXISTS prices (price_table TEXT, key TEXT, run_id INTEGER, {}, PRIMARY KEY (price_table, key, run_id)) WITHOUT ROWID'.format(value_columns))
+        self.connection.execute('CREATE INDEX IF NOT EXISTS prices_run ON prices (run_id)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS head (price_table TEXT, key TEXT, {}, PRIMARY KEY (price_table, key)) WITHOUT ROWID'.format(value_columns))
+        self.connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('schema_version', ?)", (str(PRICE_HISTORY_VERSION),))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def format_key(key_fields):
+        return '/'.join(key_fields)
+
+    def record_run(self, inputs, tables, tolerance = 1e-12):
+        # inputs: {"data_hash", "selections_hash", "settings_hash", "roi_period_days", "repair_period_days", "pioneer_cost", "workforce_costs"}
+        # tables: {price table: flat rows of key fields and currency costs}, e.g. from iterate_price_table_rows.
+        # Returns the new run id and the number of stored changes.
+        changed = 0
+        with self.connection:
+            cursor = self.connection.execute('INSERT INTO runs (created_at, data_hash, selections_hash, settings_hash, roi_period_days, repair_period_days, pioneer_cost, workforce_costs, changed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)', (time.time(), inputs.get('data_hash'), inputs.get('selections_hash'), inputs.get('settings_hash'), inputs.get('roi_period_days'), inputs.get('repair_period_days'), inputs.get('pioneer_cost'), json.dumps(inputs.get('workforce_costs'))))
+            run_id = cursor.lastrowid
+            for table, rows in tables.items():
+                key_count = len(PRICE_TABLES[table]['keys'])
+                head = {row[0]: row[1:] for row in self.connection.execute('SELECT key, {} FROM head WHERE price_table = ?'.format(', '.join(PRICE_HISTORY_COLUMNS)), (table,))}
+                updates = []
+                for row in rows:
+                    key = self.format_key(row[:key_count])
+                    values = tuple(row[key_count:])
+                    previous = head.pop(key, None)
+                    if previous is None or any(abs(a - b) > tolerance*max(abs(a), abs(b)) for a, b in zip(values, previous)):
+                        updates.append((key, values))
+                removed = list(head.keys())
+                self.connection.executemany('INSERT INTO prices VALUES (?, ?, ?, {})'.format(', '.join('?'*len(PRICE_HISTORY_COLUMNS))), ((table, key, run_id) + values for key, values in updates))
+                self.connection.executemany('INSERT OR REPLACE INTO head VALUES (?, ?, {})'.format(', '.join('?'*len(PRICE_HISTORY_COLUMNS))), ((table, key) + values for key, values in updates))
+                self.connection.executemany('INSERT INTO prices (price_table, key, run_id) VALUES (?, ?, ?)', ((table, key, run_id) for key in removed))
+                self.connection.executemany('DELETE FROM head WHERE price_table = ? AND key = ?', ((table, key) for key in removed))
+                changed += len(updates) + len(removed)
+            self.connection.execute('UPDATE runs SET changed = ? WHERE run_id = ?', (changed, run_id))
+        return run_id, changed
+
+    def list_runs(self, days = None):
+        query = 'SELECT run_id, created_at, data_hash, selections_hash, settings_hash, roi_period_days, repair_period_days, pioneer_cost, workforce_costs, changed FROM runs'
+        parameters = []
+        if days is not None:
+            query = query + ' WHERE created_at >= ?'
+            parameters.append(time.time() - days*24*60*60)
+        runs = []
+        for row in self.connection.execute(query + ' ORDER BY run_id', parameters):
+            run = dict(zip(['run_id', 'created_at', 'data_hash', 'selections_hash', 'settings_hash', 'roi_period_days', 'repair_period_days', 'pioneer_cost', 'workforce_costs', 'changed'], row))
+            run['workforce_costs'] = json.loads(run['workforce_costs']) if run['workforce_costs'] else None
+            runs.append(run)
+        return runs
+
+    def get_price(self, table, key, run_id):
+        # Value of one row as of a run, None if it did not exist then
+        row = self.connection.execute('SELECT {} FROM prices WHERE price_table = ? AND key = ? AND run_id <= ? ORDER BY run_id DESC LIMIT 1'.format(', '.join(PRICE_HISTORY_COLUMNS)), (table, key, run_id)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return dict(zip(PRICE_HISTORY_COLUMNS, row))
+
+    def price_series(self, table, key, days = None):
+        # Every change of one row, e.g. price_series('material_costs', 'BCO', 90).  Starts with the value at the
+        # beginning of the period; a None price means the row did not exist from that run on.
+        start_run = 0
+        if days is not None:
+            row = self.connection.execute('SELECT max(run_id) FROM runs WHERE created_at < ?', (time.time() - days*24*60*60,)).fetchone()
+            start_run = row[0] or 0
+        series = []
+        if start_run:
+            price = self.get_price(table, key, start_run)
+            if price is not None:
+                created_at = self.connection.execute('SELECT created_at FROM runs WHERE run_id = ?', (start_run,)).fetchone()[0]
+                series.append({'run_id': start_run, 'created_at': created_at, 'price': price})
+        query = 'SELECT prices.run_id, runs.created_at, {} FROM prices JOIN runs ON runs.run_id = prices.run_id WHERE price_table = ? AND key = ? AND prices.run_id > ? ORDER BY prices.run_id'.format(', '.join('prices.' + column for column in PRICE_HISTORY_COLUMNS))
+        for row in self.connection.execute(query, (table, key, start_run)):
+            series.append({'run_id': row[0], 'created_at': row[1], 'price': None if row[2] is None else dict(zip(PRICE_HISTORY_COLUMNS, row[2:]))})
+        return series
+
+    def diff_runs(self, run_a, run_b):
+        # Rows whose price differs between two runs, with the price of each (None where a row did not exist)
+        if run_a > run_b:
+            run_a, run_b = run_b, run_a
+        changes = []
+        for table, key in self.connection.execute('SELECT DISTINCT price_table, key FROM prices WHERE run_id > ? AND run_id <= ? ORDER BY price_table, key', (run_a, run_b)).fetchall():
+            before = self.get_price(table, key, run_a)
+            after = self.get_price(table, key, run_b)
+            if before != after:
+                changes.append({'table': table, 'key': key, 'before': before, 'after': after})
+        return changes
+
+def record_price_history(history, data_hash, settings_hash, recipe_selections, pioneer_cost, workforce_costs, material_rows, recipe_rows, natural_resource_rows):
+    # Append a solved run to the history.  settings_hash covers the settings other than the selections, periods and
+    # pioneer cost (see calculate_settings_hash).  The row arguments are (key, population cost row) pairs like for
+    # write_price_tables.
+    inputs = {
+        'data_hash': data_hash,
+        'selections_hash': calculate_input_hash(recipe_selections),
+        'settings_hash': settings_hash,
+        'roi_period_days': ROI_PERIOD_DAYS,
+        'repair_period_days': REPAIR_PERIOD_DAYS,
+        'pioneer_cost': pioneer_cost,
+        'workforce_costs': list(workforce_costs),
+        }
+    tables = {
+        'material_costs': iterate_price_table_rows(material_rows, workforce_costs),
+        'recipe_costs': iterate_price_table_rows(recipe_rows, workforce_costs),
+        'natural_resource_costs': iterate_price_table_rows(natural_resource_rows, workforce_costs),
+        }
+    return history.record_run(inputs, tables)
+
+def write_history_diff(filename, changes):
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['table', 'key'] + ['old ' + column for column in PRICE_HISTORY_COLUMNS] + ['new ' + column for column in PRICE_HISTORY_COLUMNS])
+        for change in changes:
+            before = change['before'] or {}
+            after = change['after'] or {}
+            writer.writerow([change['table'], change['key']] + [before.get(column, '') for column in PRICE_HISTORY_COLUMNS] + [after.get(column, '') for column in PRICE_HISTORY_COLUMNS])
+
+class IncrementalPricer:
+    # Keeps the solved state of a full run and reprices only what a change of material_selections.json affects
+    def __init__(self, buildings, recipes, materials, planets, materials_byID, base_setups, recipe_selections, pioneer_cost = PIONEER_COST, baskets = WORKFORCE_BASKETS):
+        self.buildings = buildings
+        self.recipes = recipes
+        self.materials = materials
+        self.planets = planets
+        self.materials_byID = materials_byID
+        self.base_setups = base_setups
+        self.recipe_selections = dict(recipe_selections)
+        self.pioneer_cost = pioneer_cost
+        self.baskets = baskets
+        self.quantity_table = BuildQuantityTable(buildings, base_setups)
+
+        self.material_costs, self.material_info = initialize_material_costs(materials, recipes, planets, buildings, materials_byID, self.recipe_selections)
+        self.system = build_material_cost_system(self.material_info, buildings, base_setups, quantity_table=self.quantity_table)
+        self.graph = build_material_dependency_graph(self.material_info, buildings, base_setups)
+        input_cost_table, repair_cost_table, desired_profit_table, total_cost_table, self.solver_stats = solve_material_costs_scc(self.material_costs, self.material_info, buildings, base_setups)
+        self.input_costs = input_cost_table.to_dict()
+        self.repair_costs = repair_cost_table.to_dict()
+        self.desired_profit = desired_profit_table.to_dict()
+        self.total_costs = total_cost_table.to_dict()
+        self.workforce_costs = calculate_workforce_costs(self.total_costs, self.pioneer_cost, self.baskets)
+
+        # which recipe and natural resource rows read which materials
+        self.recipe_dependents = {}
+        for recipe in recipes.values():
+            if recipe['Outputs']:
+                for mat_ticker in get_recipe_dependencies(recipe, ['MCG'], buildings, base_setups):
+                    self.recipe_dependents.setdefault(mat_ticker, set()).add(recipe['StandardRecipeName'])
+        natural_resource_dependencies = {}
+        for building_ticker in ['COL', 'EXT', 'RIG']:
+            natural_resource_dependencies[building_ticker] = get_recipe_dependencies(recipes['{}:=>'.format(building_ticker)], [], buildings, base_setups)
+        self.planet_dependents = {}
+        for planet in planets.values():
+            dependencies = set(get_planet_build_requirements(planet))
+            for item in planet['Resources']:
+                recipe_key, output = get_recipe_output_from_material_type(item['ResourceType'], item['Factor'])
+                dependencies.update(natural_resource_dependencies[recipes[recipe_key]['BuildingTicker']])
+            for mat_ticker in dependencies:
+                self.planet_dependents.setdefault(mat_ticker, set()).add(planet['PlanetNaturalId'])
+
+        self.material_rows = calculate_material_cost_rows(self.material_costs, self.input_costs, self.repair_costs, self.desired_profit, self.total_costs)
+        self.recipe_rows = calculate_recipe_cost_rows(recipes, buildings, base_setups, self.material_costs, self.input_costs, self.repair_costs, self.desired_profit)
+        self.natural_resource_rows = calculate_natural_resource_cost_rows(planets, recipes, buildings, base_setups, materials_byID, self.material_costs, self.input_costs, self.repair_costs, self.desired_profit)
+
+    def update_selections(self, recipe_selections):
+        # Reprice the materials downstream of every changed selection and patch the affected output rows
+        changed = [material for material in self.materials.keys() if recipe_selections.get(material) != self.recipe_selections.get(material)]
+        stats = {'changed': changed, 'materials': 0, 'recipes': 0, 'planets': 0}
+        if not changed:
+            return stats
+        self.recipe_selections = dict(recipe_selections)
+
+        material_costs, material_info = initialize_material_costs(self.materials, self.recipes, self.planets, self.buildings, self.materials_byID, self.recipe_selections, changed)
+        for material in changed:
+            for table in [self.material_costs, self.material_info, self.system, self.graph, self.input_costs, self.repair_costs, self.desired_profit, self.total_costs, self.material_rows]:
+                table.pop(material, None)
+        self.material_costs.update(material_costs)
+        self.material_info.update(material_info)
+        self.system.update(build_material_cost_system(self.material_info, self.buildings, self.base_setups, material_info.keys(), self.quantity_table))
+        self.graph.update(build_material_dependency_graph(material_info, self.buildings, self.base_setups))
+
+        # everything downstream of a changed material, found through the reversed dependency graph
+        dependents = reverse_material_dependency_graph(self.graph)
+        affected = set()
+        pending = list(changed)
+        while pending:
+            material = pending.pop()
+            if material in affected:
+                continue
+            affected.add(material)
+            pending.extend(dependents.get(material, ()))
+        affected_materials = [material for material in self.material_info.keys() if material in affected]
+
+        subgraph = {material: self.graph[material] & affected for material in affected_materials}
+        components = calculate_strongly_connected_components(subgraph)
+        solve_material_cost_components(self.system, components, self.material_costs, self.total_costs)
+        base_cost_table = PopulationCostTable.from_dict(self.material_costs, affected_materials)
+        total_cost_table = PopulationCostTable.from_dict(self.total_costs)
+        input_cost_table, repair_cost_table, desired_profit_table, total_cost_table = calculate_total_cost_table(self.system, base_cost_table, total_cost_table)
+        for material in affected_materials:
+            self.input_costs[material] = input_cost_table[material]
+            self.repair_costs[material] = repair_cost_table[material]
+            self.desired_profit[material] = desired_profit_table[material]
+            self.total_costs[material] = total_cost_table[material]
+        self.restore_material_order()
+        self.workforce_costs = calculate_workforce_costs(self.total_costs, self.pioneer_cost, self.baskets)
+
+        # patch the output rows that read an affected material
+        affected_recipes = set()
+        affected_planets = set()
+        for material in affected:
+            affected_recipes.update(self.recipe_dependents.get(material, ()))
+            affected_planets.update(self.planet_dependents.get(material, ()))
+        self.material_rows.update(calculate_material_cost_rows(self.material_costs, self.input_costs, self.repair_costs, self.desired_profit, self.total_costs, affected_materials))
+        self.recipe_rows.update(calculate_recipe_cost_rows(self.recipes, self.buildings, self.base_setups, self.material_costs, self.input_costs, self.repair_costs, self.desired_profit, [name for name in self.recipes.keys() if name in affected_recipes]))
+        self.natural_resource_rows.update(calculate_natural_resource_cost_rows(self.planets, self.recipes, self.buildings, self.base_setups, self.materials_byID, self.material_costs, self.input_costs, self.repair_costs, self.desired_profit, [planet_id for planet_id in self.planets.keys() if planet_id in affected_planets]))
+        self.restore_material_order()
+        stats['materials'] = len(affected_materials)
+        stats['recipes'] = len(affected_recipes)
+        stats['planets'] = len(affected_planets)
+        return stats
+
+    def restore_material_order(self):
+        # Repriced materials are removed and added again at the end of every table.  Put the tables back in the
+        # material order of a full run, so that rows and sums come out in the same order.
+        for name in ['material_costs', 'material_info', 'system', 'graph', 'input_costs', 'repair_costs', 'desired_profit', 'total_costs', 'material_rows']:
+            table = getattr(self, name)
+            setattr(self, name, {material: table[material] for material in self.materials.keys() if material in table})
+
+    def write_outputs(self, writer):
+        write_price_tables(writer, self.workforce_costs, self.material_rows.items(), self.recipe_rows.items(), self.natural_resource_rows.items())
+
+def parse_selection_options(options):
+    # "<material>_options" entries list recipes and planets as "recipe,recipe| planet,planet" or a plain comma list
+    candidates = []
+    for part in options.split('|'):
+        candidates.extend(candidate.strip() for candidate in part.split(',') if candidate.strip())
+    return candidates
+
+def get_selection_candidates(recipe_selections, materials, all_options = False):
+    # Allowed selections per material: its *_options entry, or every recipe and planet producing it with all_options.
+    # Materials with a single option are left out.
+    candidates = {}
+    for material in materials.keys():
+        if material not in recipe_selections or not recipe_selections[material]:
+            continue
+        if all_options:
+            options = list(materials[material].get('RecipeList', [])) + list(materials[material].get('PlanetList', []))
+        else:
+            options = parse_selection_options(recipe_selections.get(material + '_options', ''))
+        if recipe_selections[material] not in options:
+            options.append(recipe_selections[material])
+        if len(options) > 1:
+            candidates[material] = options
+    return candidates
+
+def prune_selection_candidates(material, options, recipes, planets, materials_byID):
+    # All costs of an extraction scale with 1/output, so of the planets sharing an extraction recipe and planet
+    # materials only the one with the highest output can be the cheapest.  Unknown recipes and planets are dropped.
+    recipe_options = []
+    best_planets = {}
+    for option in options:
+        if '=>' in option:
+            if option in recipes:
+                recipe_options.append(option)
+            continue
+        if option not in planets:
+            continue
+        planet = planets[option]
+        for resource in planet['Resources']:
+            if materials_byID.get(resource['MaterialId']) == material:
+                recipe_key, output = get_recipe_output_from_material_type(resource['ResourceType'], resource['Factor'])
+                group = (recipe_key, tuple(get_planet_build_requirements(planet)))
+                if group not in best_planets or output > best_planets[group][1]:
+                    best_planets[group] = (option, output)
+                break
+    return recipe_options + [planet_id for planet_id, output in best_planets.values()]
+
+def evaluate_selection_candidate(pricer, material, selection):
+    # Total cost of a material if it used this selection, with every other material at its current solved cost.
+    # None if the selection needs a material that has no cost.
+    recipe, output, planet_mats = get_selection_recipe(material, selection, pricer.recipes, pricer.planets, pricer.materials_byID)
+    if output <= 0:
+        return None
+    building = pricer.buildings[recipe['BuildingTicker']]
+    base_cost = calculate_population_cost(output, building, recipe['TimeMs'])
+    try:
+        input_costs, repair_costs, desired_profit, total_costs = calculate_total_cost(material, output, recipe['Inputs'], pricer.quantity_table.get(recipe['BuildingTicker'], planet_mats), recipe['TimeMs'], pricer.material_costs, pricer.input_costs, pricer.repair_costs, pricer.desired_profit, base_cost, False)
+    except KeyError:
+        return None
+    return total_costs
+
+def optimize_recipe_selections(pricer, candidates, max_rounds = 20, tolerance = 1e-9):
+    # Policy iteration over the selections: price every candidate against the current solution, switch each material
+    # to its cheapest candidate, re-solve incrementally and repeat until no selection changes.  Candidates are compared
+    # in currency at the current workforce costs.  Returns the statistics of each round.
+    pruned = {material: prune_selection_candidates(material, options, pricer.recipes, pricer.planets, pricer.materials_byID) for material, options in candidates.items()}
+    rounds = []
+    for n in range(max_rounds):
+        start_time = time.perf_counter()
+        selections = dict(pricer.recipe_selections)
+        evaluated = 0
+        for material, options in pruned.items():
+            current = population_cost_to_currency(pricer.total_costs[material], pricer.workforce_costs)
+            best_selection = selections[material]
+            best_cost = current
+            for option in options:
+                if option == selections[material]:
+                    continue
+                total_costs = evaluate_selection_candidate(pricer, material, option)
+                evaluated += 1
+                if total_costs is None:
+                    continue
+                cost = population_cost_to_currency(total_costs, pricer.workforce_costs)
+                if cost < best_cost*(1 - tolerance):
+                    best_selection = option
+                    best_cost = cost
+            selections[material] = best_selection
+        stats = pricer.update_selections(selections)
+        rounds.append({'round': n + 1, 'evaluated': evaluated, 'changed': stats['changed'], 'repriced': stats['materials'], 'time': time.perf_counter() - start_time})
+        print('Optimization round {}: {} candidates, {} selections changed, {} materials repriced in {} s'.format(n + 1, evaluated, len(stats['changed']), stats['materials'], rounds[-1]['time']))
+        if not stats['changed']:
+            break
+    return rounds
+
+def write_selection_report(filename, original_selections, original_costs, pricer):
+    # One row per material whose selection or cost changed, largest relative improvement first
+    rows = []
+    for material, row in pricer.material_rows.items():
+        new_cost = population_cost_to_currency(row[0], pricer.workforce_costs)
+        old_cost = original_costs.get(material)
+        if old_cost is None or (original_selections.get(material) == pricer.recipe_selections.get(material) and old_cost == new_cost):
+            continue
+        improvement = (old_cost - new_cost)/old_cost if old_cost else 0
+        rows.append([material, original_selections.get(material), pricer.recipe_selections.get(material), old_cost, new_cost, improvement])
+    rows.sort(key=lambda row: row[5], reverse=True)
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['material', 'old selection', 'new selection', 'old total cost', 'new total cost', 'improvement'])
+        writer.writerows(rows)
+
+def configure_periods(roi_period_days, repair_period_days):
+    # Change the ROI and repair periods used by all cost calculations in this process
+    global ROI_PERIOD_DAYS, ROI_PERIOD_MS, REPAIR_PERIOD_DAYS, REPAIR_PERIOD_MS
+    ROI_PERIOD_DAYS = roi_period_days
+    ROI_PERIOD_MS = ROI_PERIOD_DAYS*DAY_TIME_MS
+    REPAIR_PERIOD_DAYS = repair_period_days
+    REPAIR_PERIOD_MS = REPAIR_PERIOD_DAYS*DAY_TIME_MS
+
+def price_scenario(scenario, buildings, recipes, materials, planets, materials_byID, base_setups):
+    # Price one what-if scenario: selections, ROI and repair periods and the pioneer cost anchor.
+    # Returns the currency costs (total, repair, input, desired profit, base) of every material, recipe and natural resource.
+    periods = [ROI_PERIOD_DAYS, REPAIR_PERIOD_DAYS]
+    configure_periods(scenario.get('roi_period_days', ROI_PERIOD_DAYS), scenario.get('repair_period_days', REPAIR_PERIOD_DAYS))
+    try:
+        material_costs, material_info = initialize_material_costs(materials, recipes, planets, buildings, materials_byID, scenario['selections'])
+        input_costs, repair_costs, desired_profit, total_costs, solver_stats = solve_material_costs_scc(material_costs, material_info, buildings, base_setups)
+        workforce_costs = calculate_workforce_costs(total_costs, scenario.get('pioneer_cost', PIONEER_COST), dict(WORKFORCE_BASKETS, **scenario.get('baskets', {})))
+        result = {'name': scenario['name'], 'workforce_costs': workforce_costs, 'residual': solver_stats['residual']}
+        rows = {
+            'materials': calculate_material_cost_rows(material_costs, input_costs, repair_costs, desired_profit, total_costs),
+            'recipes': calculate_recipe_cost_rows(recipes, buildings, base_setups, material_costs, input_costs, repair_costs, desired_profit),
+        }
+        if scenario.get('natural_resources', True):
+            rows['natural_resources'] = calculate_natural_resource_cost_rows(planets, recipes, buildings, base_setups, materials_byID, material_costs, input_costs, repair_costs, desired_profit)
+        for stage, stage_rows in rows.items():
+            result[stage] = convert_population_rows(stage_rows, workforce_costs)
+    finally:
+        configure_periods(*periods)
+    return result
+
+def run_batch_scenario(scenario):
+    # The prints of a scenario are returned with its result rather than interleaved with other workers.  A failing
+    # scenario returns its error, the rest of the batch is still priced.
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            result = price_scenario(scenario, *worker_data)
+        except Exception as error:
+            result = {'name': scenario['name'], 'error': '{}: {}'.format(type(error).__name__, error)}
+    result['output'] = output.getvalue()
+    return result
+
+def price_scenarios(scenarios, buildings, recipes, materials, planets, materials_byID, base_setups, processes = None):
+    # Price many scenarios on a process pool.  The FNAR data is handed to each worker once when it starts
+    # (inherited without pickling where processes are forked), only the scenarios travel with the tasks.
+    data = (buildings, recipes, materials, planets, materials_byID, base_setups)
+    if processes == 1:
+        init_worker(data)
+        return [run_batch_scenario(scenario) for scenario in scenarios]
+    with create_worker_pool(processes, data) as pool:
+        return pool.map(run_batch_scenario, scenarios, chunksize=1)
+
+def load_scenarios(scenario_file, recipe_selections, pioneer_cost = PIONEER_COST, baskets = WORKFORCE_BASKETS):
+    # Scenario file: a JSON list of {"name", "roi_period_days", "repair_period_days", "pioneer_cost",
+    # "selections_file", "selections"}.  "selections" overrides single entries of the selections file
+    # (material_selections.json unless "selections_file" is given).
+    with open(scenario_file, 'rt') as file:
+        scenario_list = json.load(file)
+    scenarios = []
+    for n, scenario in enumerate(scenario_list):
+        scenario = dict(scenario)
+        scenario.setdefault('name', 'scenario {}'.format(n + 1))
+        scenario.setdefault('pioneer_cost', pioneer_cost)
+        scenario['baskets'] = dict(baskets, **scenario.get('baskets', {}))
+        if 'selections_file' in scenario:
+            selections = load_recipe_selections(scenario.pop('selections_file'))
+        else:
+            selections = dict(recipe_selections)
+        selections.update(scenario.get('selections', {}))
+        scenario['selections'] = selections
+        scenarios.append(scenario)
+    return scenarios
+
+def write_scenario_comparison(filename, key_headers, results, stage):
+    # One row per material/recipe/resource with the total cost of each scenario side by side
+    keys = []
+    seen = set()
+    for result in results:
+        for key in result.get(stage, {}).keys():
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+    with open(filename, 'w') as file:
+        file.write(', '.join(key_headers + [result['name'] for result in results]) + '\n')
+        for key in keys:
+            key_fields = list(key) if isinstance(key, tuple) else [key]
+            costs = [str(result[stage][key][0]) if key in result.get(stage, {}) else '' for result in results]
+            file.write(', '.join(key_fields + costs) + '\n')
+
+MONTE_CARLO_PERCENTILES = [5, 25, 50, 75, 95]
+
+def load_monte_carlo_settings(settings_file):
+    # {"samples": 10000, "seed": 1, "percentiles": [5, 50, 95], "factor": distribution, "time": distribution,
+    #  "roi_period_days": distribution, "repair_period_days": distribution, "pioneer_cost": distribution}
+    # "factor" multiplies the Factor of every extracted resource and "time" the TimeMs of every recipe, each drawn
+    # independently.  A distribution is a number or {"distribution": "normal", "mean", "sd"}, {"distribution":
+    # "lognormal", "mu", "sigma"}, {"distribution": "uniform", "low", "high"} or {"distribution": "triangular",
+    # "low", "mode", "high"}.
+    with open(settings_file, 'r') as file:
+        settings = json.load(file)
+    for name in ['factor', 'time', 'roi_period_days', 'repair_period_days', 'pioneer_cost']:
+        spec = settings.get(name)
+        if isinstance(spec, dict) and spec.get('distribution') not in ['normal', 'lognormal', 'uniform', 'triangular']:
+            raise Exception('Error in load_monte_carlo_settings.  Unknown distribution of {}: {}'.format(name, spec.get('distribution')))
+    return settings
+
+def sample_distribution(rng, spec, default):
+    # One positive draw of a distribution; normal draws below zero are drawn again
+    if spec is None:
+        return default
+    if isinstance(spec, (int, float)):
+        return spec
+    for n in range(100):
+        if spec['distribution'] == 'normal':
+            value = rng.gauss(spec['mean'], spec['sd'])
+        elif spec['distribution'] == 'lognormal':
+            value = rng.lognormvariate(spec['mu'], spec['sigma'])
+        elif spec['distribution'] == 'uniform':
+            value = rng.uniform(spec['low'], spec['high'])
+        else:
+            value = rng.triangular(spec['low'], spec['high'], spec['mode'])
+        if value > 0:
+            return value
+    raise Exception('Error in sample_distribution.  No positive value drawn from {}.'.format(spec))
+
+def price_monte_carlo_sample(index, settings, buildings, recipes, material_info, extracted_materials, base_setups, components, material_order, recipe_order, baskets):
+    # Currency total cost of every material and recipe for one sample, None if its workforce costs have no solution.
+    # Every sample draws from its own seeded generator, so results do not depend on how samples are split up.
+    rng = random.Random('{}-{}'.format(settings.get('seed', 1), index))
+    periods = [ROI_PERIOD_DAYS, REPAIR_PERIOD_DAYS]
+    configure_periods(sample_distribution(rng, settings.get('roi_period_days'), ROI_PERIOD_DAYS), sample_distribution(rng, settings.get('repair_period_days'), REPAIR_PERIOD_DAYS))
+    try:
+        pioneer_cost = sample_distribution(rng, settings.get('pioneer_cost'), PIONEER_COST)
+        sample_recipes = {recipe_name: dict(recipe, TimeMs=recipe['TimeMs']*sample_distribution(rng, settings.get('time'), 1)) for recipe_name, recipe in recipes.items()}
+        sample_info = {}
+        material_costs = {}
+        for material in material_order:
+            info = material_info[material]
+            recipe = sample_recipes[info['recipe']['StandardRecipeName']]
+            output = info['output']
+            if material in extracted_materials:
+                output = output*sample_distribution(rng, settings.get('factor'), 1)
+            sample_info[material] = {'recipe': recipe, 'output': output, 'planet_mats': info['planet_mats']}
+            material_costs[material] = calculate_population_cost(output, buildings[recipe['BuildingTicker']], recipe['TimeMs'])
+
+        # the components of the dependency graph do not change with the sampled values and are reused
+        system = build_material_cost_system(sample_info, buildings, base_setups)
+        total_costs = {}
+        solve_material_cost_components(system, components, material_costs, total_costs)
+        try:
+            workforce_costs = calculate_workforce_costs(total_costs, pioneer_cost, baskets)
+        except Exception:
+            return None
+        recipe_total_table = RecipeBatchPricer.from_total_costs(buildings, base_setups, total_costs).price_recipe_total_table(recipe_order, sample_recipes)
+    finally:
+        configure_periods(*periods)
+    return PopulationCostTable.from_dict(total_costs, material_order).to_currency(workforce_costs) + recipe_total_table.to_currency(workforce_costs)
+
+def run_monte_carlo_chunk(chunk):
+    # samples of a chunk as one flat array of (materials + recipes) values per successful sample
+    values = array.array('d')
+    failed = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index in chunk:
+            sample_values = price_monte_carlo_sample(index, *worker_data)
+            if sample_values is None:
+                failed = failed + 1
+            else:
+                values.extend(sample_values)
+    return values, failed
+
+def calculate_percentile(sorted_values, percentile):
+    # linear interpolation between the closest ranks
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1)*percentile/100
+    low = math.floor(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low])*(position - low)
+
+def run_monte_carlo(settings, buildings, recipes, materials, planets, materials_byID, base_setups, recipe_selections, processes = None, chunk_size = 50, baskets = WORKFORCE_BASKETS):
+    # Price settings['samples'] samples in chunks, on a process pool when processes > 1.  Returns the mean and the
+    # percentiles of the currency total cost of every material and recipe, and the number of failed samples.
+    material_costs, material_info = initialize_material_costs(materials, recipes, planets, buildings, materials_byID, recipe_selections)
+    material_order = list(material_info.keys())
+    recipe_order = [recipe_name for recipe_name in recipes.keys() if recipes[recipe_name]['Outputs']]
+    extracted_materials = {material for material in material_order if '=>' not in recipe_selections[material]}
+    components = calculate_strongly_connected_components(build_material_dependency_graph(material_info, buildings, base_setups))
+    data = (settings, buildings, recipes, material_info, extracted_materials, base_setups, components, material_order, recipe_order, baskets)
+
+    sample_count = settings.get('samples', 1000)
+    chunks = [list(range(n, min(n + chunk_size, sample_count))) for n in range(0, sample_count, chunk_size)]
+    if processes is None or processes <= 1:
+        init_worker(data)
+        chunk_results = map(run_monte_carlo_chunk, chunks)
+        pool = None
+    else:
+        pool = create_worker_pool(processes, data)
+        chunk_results = pool.imap(run_monte_carlo_chunk, chunks)
+
+    # one column of sample values per material and recipe
+    keys = material_order + recipe_order
+    columns = [array.array('d') for key in keys]
+    failed = 0
+    try:
+        for values, chunk_failed in chunk_results:
+            failed = failed + chunk_failed
+            for n, column in enumerate(columns):
+                column.extend(values[n::len(keys)])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    percentiles = settings.get('percentiles', MONTE_CARLO_PERCENTILES)
+    statistics = {}
+    for key, column in zip(keys, columns):
+        sorted_values = sorted(column)
+        statistics[key] = {'mean': math.fsum(sorted_values)/len(sorted_values) if sorted_values else None, 'percentiles': [calculate_percentile(sorted_values, percentile) for percentile in percentiles]}
+    return {'materials': {material: statistics[material] for material in material_order}, 'recipes': {recipe_name: statistics[recipe_name] for recipe_name in recipe_order}, 'percentiles': percentiles, 'samples': sample_count - failed, 'failed': failed}
+
+def write_monte_carlo_statistics(filename, key_header, statistics, percentiles):
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow([key_header, 'mean'] + ['p{}'.format(percentile) for percentile in percentiles])
+        for key, key_statistics in statistics.items():
+            writer.writerow([key, key_statistics['mean']] + key_statistics['percentiles'])
+
+def load_recipe_selections(selections_file):
+    with open(selections_file, 'rt') as file:
+        return json.load(file)
+
+def watch_selections(pricer, selections_file, writer, poll_seconds = 1.0, history = None, data_hash = None, settings_hash = None):
+    # Reprice incrementally every time the selections file changes
+    last_modified = os.path.getmtime(selections_file)
+    while True:
+        time.sleep(poll_seconds)
+        modified = os.path.getmtime(selections_file)
+        if modified == last_modified:
+            continue
+        last_modified = modified
+        start_time = time.perf_counter()
+        try:
+            recipe_selections = load_recipe_selections(selections_file)
+        except ValueError as error:
+            print('ERROR: could not read {}: {}'.format(selections_file, error))
+            continue
+        stats = pricer.update_selections(recipe_selections)
+        pricer.write_outputs(writer)
+        if history is not None and stats['changed']:
+            record_price_history(history, data_hash, settings_hash, recipe_selections, pricer.pioneer_cost, pricer.workforce_costs, pricer.material_rows.items(), pricer.recipe_rows.items(), pricer.natural_resource_rows.items())
+        print('Repriced {} changed selections ({}): {} materials, {} recipes, {} planets in {} s'.format(len(stats['changed']), ','.join(stats['changed']), stats['materials'], stats['recipes'], stats['planets'], time.perf_counter() - start_time))
+
+
+class PriceSnapshot:
+    # Read-only query tables of one solved state, all costs already converted to currency.  A new snapshot is
+    # built for every re-solve and replaces the old one as a whole, so a query never sees a half updated state.
+    def __init__(self, pricer, version, solve_seconds):
+        self.version = version
+        self.solved_at = time.time()
+        self.solve_seconds = solve_seconds
+        self.workforce_costs = dict(zip(POPULATION_TYPES, pricer.workforce_costs))
+        self.materials = self.build_entries('material_costs', pricer.material_rows, pricer.workforce_costs)
+        for material, entry in self.materials.items():
+            info = pricer.material_info.get(material, {})
+            entry['recipe'] = info.get('recipe')
+            entry['output'] = info.get('output')
+        self.recipes = self.build_entries('recipe_costs', pricer.recipe_rows, pricer.workforce_costs)
+        self.natural_resources = self.build_entries('natural_resource_costs', pricer.natural_resource_rows, pricer.workforce_costs)
+        # the sensitivity engine is only built on the first query; the pricer replaces entries of these tables
+        # instead of changing them, so shallow copies keep this solved state
+        self.sensitivity_inputs = (dict(pricer.system), dict(pricer.material_costs), dict(pricer.total_costs), list(pricer.workforce_costs))
+        self.sensitivity = None
+        self.sensitivity_lock = threading.Lock()
+        # recipes priced with the build requirements of a planet, also only set up on the first query
+        self.planet_recipe_inputs = (pricer.buildings, pricer.base_setups, dict(pricer.material_costs), dict(pricer.input_costs), dict(pricer.repair_costs), dict(pricer.desired_profit))
+        self.recipe_data = pricer.recipes
+        self.planet_data = pricer.planets
+        self.recipe_pricer = None
+        self.recipe_pricer_lock = threading.Lock()
+
+    def get_sensitivity(self):
+        with self.sensitivity_lock:
+            if self.sensitivity is None:
+                self.sensitivity = MaterialCostSensitivity(*self.sensitivity_inputs)
+            return self.sensitivity
+
+    def get_planet_recipe(self, recipe_name, planet_id):
+        if recipe_name not in self.recipes or planet_id not in self.planet_data:
+            return None
+        with self.recipe_pricer_lock:
+            if self.recipe_pricer is None:
+                self.recipe_pricer = RecipeBatchPricer(*self.planet_recipe_inputs)
+            rows = self.recipe_pricer.price_recipes_on_planets([recipe_name], self.recipe_data, self.planet_data, [planet_id])
+        entry = self.build_entries('recipe_costs', {recipe_name: rows[(planet_id, recipe_name)]}, [self.workforce_costs[population] for population in POPULATION_TYPES])[recipe_name]
+        entry['planet'] = planet_id
+        return entry
+
+    @staticmethod
+    def build_entries(table, rows, workforce_costs):
+        key_columns = PRICE_TABLES[table]['keys']
+        cost_columns = PRICE_TABLES[table]['costs']
+        currency_rows = convert_population_rows(rows, workforce_costs)
+        entries = {}
+        for key, row in rows.items():
+            key_fields = list(key) if isinstance(key, tuple) else [key]
+            entry = dict(zip(key_columns, key_fields))
+            entry.update(zip(cost_columns, currency_rows[key]))
+            entry['population'] = {column: dict(zip(POPULATION_TYPES, population_cost_to_list(cost))) for column, cost in zip(cost_columns, row)}
+            entries[key] = entry
+        return entries
+
+    def status(self):
+        return {'version': self.version, 'solved_at': self.solved_at, 'solve_seconds': self.solve_seconds, 'materials': len(self.materials), 'recipes': len(self.recipes), 'natural_resources': len(self.natural_resources)}
+
+class PricingService:
+    # Resident pricing state for the HTTP API.  A background thread re-solves when the selections file changes
+    # (incrementally) or when the FNAR datasets are refreshed (from scratch) and swaps in a new PriceSnapshot.
+    def __init__(self, data_store_path, selections_file, buildings, recipes, materials, planets, materials_byID, base_setups, max_age_seconds = None, base_url = FNAR_BASE_URL, area_limit = BASE_AREA_LIMIT, poll_seconds = 1.0, pioneer_cost = PIONEER_COST, baskets = WORKFORCE_BASKETS):
+        self.data_store_path = data_store_path
+        self.selections_file = selections_file
+        self.max_age_seconds = max_age_seconds
+        self.base_url = base_url
+        self.area_limit = area_limit
+        self.poll_seconds = poll_seconds
+        self.pioneer_cost = pioneer_cost
+        self.baskets = baskets
+        self.refresh_requested = threading.Event()
+        self.stop_requested = threading.Event()
+        self.thread = None
+
+        self.selections_modified = os.path.getmtime(selections_file)
+        start_time = time.perf_counter()
+        self.pricer = IncrementalPricer(buildings, recipes, materials, planets, materials_byID, base_setups, load_recipe_selections(selections_file), self.pioneer_cost, self.baskets)
+        self.snapshot = PriceSnapshot(self.pricer, 1, time.perf_counter() - start_time)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='pricing-service', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_requested.set()
+        self.refresh_requested.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def request_refresh(self):
+        # Ask the server for all datasets again and re-solve if any of them changed
+        self.refresh_requested.set()
+
+    def run(self):
+        # the store is opened here because SQLite connections stay on the thread that opened them
+        store = FIODataStore(self.data_store_path)
+        try:
+            while not self.stop_requested.is_set():
+                refresh = self.refresh_requested.wait(self.poll_seconds)
+                if self.stop_requested.is_set():
+                    break
+                self.refresh_requested.clear()
+                try:
+                    if not self.check_data(store, refresh):
+                        self.check_selections()
+                except Exception as error:
+                    print('ERROR: re-solve failed, still serving version {}: {}'.format(self.snapshot.version, error))
+        finally:
+            store.close()
+
+    def check_data(self, store, refresh):
+        # Fetch stale datasets (all of them, conditionally, on a refresh request) and rebuild the whole solved
+        # state when one of them changed
+        stale = [dataset for dataset in FNAR_DATASETS.keys() if refresh or store.is_stale(dataset, self.max_age_seconds)]
+        if not stale or not fetch_FNAR_data(store, stale, self.base_url):
+            return False
+        start_time = time.perf_counter()
+        buildings, recipes, materials, planets = [store.load_dataset(dataset, PRICING_FIELDS[dataset]) for dataset in FNAR_DATASETS.keys()]
+        materials_byID = index_materials(recipes, materials, planets)
+        layout_cache = store.load_base_layouts()
+        base_setups = calculate_base_setups(buildings, self.area_limit, layout_cache)
+        store.store_base_layouts(layout_cache)
+        self.selections_modified = os.path.getmtime(self.selections_file)
+        pricer = IncrementalPricer(buildings, recipes, materials, planets, materials_byID, base_setups, load_recipe_selections(self.selections_file), self.pioneer_cost, self.baskets)
+        self.publish(pricer, time.perf_counter() - start_time)
+        return True
+
+    def check_selections(self):
+        modified = os.path.getmtime(self.selections_file)
+        if modified == self.selections_modified:
+            return
+        self.selections_modified = modified
+        start_time = time.perf_counter()
+        try:
+            recipe_selections = load_recipe_selections(self.selections_file)
+        except ValueError as error:
+            print('ERROR: could not read {}: {}'.format(self.selections_file, error))
+            return
+        stats = self.pricer.update_selections(recipe_selections)
+        if stats['changed']:
+            self.publish(self.pricer, time.perf_counter() - start_time)
+
+    def publish(self, pricer, solve_seconds):
+        # swapping the reference is atomic, queries hold on to whichever snapshot they started with
+        self.pricer = pricer
+        self.snapshot = PriceSnapshot(pricer, self.snapshot.version + 1, solve_seconds)
+        print('Serving price version {} (solved in {} s)'.format(self.snapshot.version, solve_seconds))
+
+class PricingRequestHandler(http.server.BaseHTTPRequestHandler):
+    # GET /materials/<ticker>, /recipes/<recipe name>[/<planet>], /resources/<planet>/<material>, /workforce, /status
+    # (?pioneer_cost=<anchor> reprices under another PIOc), /sensitivity/<ticker>, POST /refresh
+    service = None
+    currency_fields = set(POPULATION_TYPES).union(*[PRICE_TABLES[table]['costs'] for table in PRICE_TABLES.keys()])
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        snapshot = self.service.snapshot
+        url = urllib.parse.urlsplit(self.path)
+        parts = [urllib.parse.unquote(part) for part in url.path.strip('/').split('/')]
+        query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        if parts[0] == 'materials' and len(parts) == 2:
+            entry = snapshot.materials.get(parts[1])
+        elif parts[0] == 'recipes' and len(parts) == 2:
+            entry = snapshot.recipes.get(parts[1])
+        elif parts[0] == 'recipes' and len(parts) == 3:
+            entry = snapshot.get_planet_recipe(parts[1], parts[2])
+        elif parts[0] == 'resources' and len(parts) == 3:
+            entry = snapshot.natural_resources.get((parts[1], parts[2]))
+        elif parts[0] == 'sensitivity' and len(parts) == 2:
+            entry = snapshot.get_sensitivity().report(parts[1]) if parts[1] in snapshot.materials else None
+        elif parts == ['workforce']:
+            entry = snapshot.workforce_costs
+        elif parts == ['status']:
+            entry = snapshot.status()
+        else:
+            self.send_json(404, {'error': 'unknown path {}'.format(self.path)})
+            return
+        if entry is None:
+            self.send_json(404, {'error': 'not found: {}'.format('/'.join(parts[1:]))})
+            return
+        body = dict(entry, version=snapshot.version)
+        if 'pioneer_cost' in query and parts[0] not in ['status', 'sensitivity']:
+            try:
+                pioneer_cost = float(query['pioneer_cost'][0])
+            except ValueError:
+                pioneer_cost = math.nan
+            # nan and infinities would not even give valid JSON
+            if not math.isfinite(pioneer_cost) or pioneer_cost <= 0:
+                self.send_json(400, {'error': 'invalid pioneer_cost: {}'.format(query['pioneer_cost'][0])})
+                return
+            factor = pioneer_cost/snapshot.workforce_costs['Pioneer']
+            # another anchor is a linear rescale of the currency costs, the population costs stay the same
+            for field in self.currency_fields.intersection(body.keys()):
+                body[field] = body[field]*factor
+        self.send_json(200, body)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/refresh':
+            self.send_json(404, {'error': 'unknown path {}'.format(self.path)})
+            return
+        self.service.request_refresh()
+        self.send_json(202, {'refresh': 'requested', 'version': self.service.snapshot.version})
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_prices(service, host = '127.0.0.1', port = 8080):
+    handler = type('BoundPricingRequestHandler', (PricingRequestHandler,), {'service': service})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    service.start()
+    print('Serving prices on http://{}:{}/'.format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+if __name__ == '__main__':
+    # test = PopulationCost(1,0,0,0,0)
+    # print(test*1)
+    # sys.exit()
+    parser = argparse.ArgumentParser(description='KAWA ROI price calculator')
+    parser.add_argument('--solver', choices=['iterative', 'direct', 'scc', 'jacobi', 'colored'], default='iterative', help='material cost solver: the material by material iteration, a direct sparse LU solve, a component by component solve in topological order, or a Jacobi or color by color iteration evaluated in parallel chunks with --processes')
+    parser.add_argument('--acceleration', choices=['none', 'aitken', 'anderson'], default='anderson', help='convergence acceleration of the jacobi and colored solvers')
+    parser.add_argument('--compare-iterative', action='store_true', help='also run the material by material iteration and print its iterations and time')
+    parser.add_argument('--watch', action='store_true', help='keep running and reprice incrementally whenever material_selections.json changes')
+    parser.add_argument('--data-store', default='fio_data.sqlite', help='local FNAR data store (an existing cache.pickle is imported on first use)')
+    parser.add_argument('--max-age-days', type=float, default=None, help='download datasets again once they are older than this')
+    parser.add_argument('--refresh', action='store_true', help='download all datasets again')
+    parser.add_argument('--base-url', default=FNAR_BASE_URL, help='FNAR REST API to download from')
+    parser.add_argument('--scenarios', help='JSON list of what-if scenarios to price side by side instead of a single run')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes for --scenarios (default: one per CPU) and for the natural resource costs (default: none)')
+    parser.add_argument('--output-format', choices=sorted(OUTPUT_WRITERS.keys()), default='csv', help='format of the material, recipe and natural resource cost tables')
+    parser.add_argument('--output-path', default=None, help='directory of the output files, or the database file for --output-format sqlite (default: current directory / price_tables.sqlite)')
+    parser.add_argument('--serve', type=int, metavar='PORT', default=None, help='keep the solved prices in memory and answer queries over HTTP on this port')
+    parser.add_argument('--host', default='127.0.0.1', help='address to serve on with --serve')
+    parser.add_argument('--pioneer-cost', type=float, default=PIONEER_COST, help='currency cost of one pioneer per ms, the anchor of all workforce costs')
+    parser.add_argument('--baskets', default=None, help='JSON {population type: [{"mat", "amount"}, ...]} replacing the default daily consumption baskets per 100 workers')
+    parser.add_argument('--workforce-sweep', default=None, help='JSON list of {"name", "baskets", "pioneer_cost"} variants whose workforce costs are written to workforce_sweep.csv')
+    parser.add_argument('--instrument', default=None, metavar='FILE', help='write stage timers, call counts and convergence traces of the run to this JSON file')
+    parser.add_argument('--profile', default=None, metavar='FILE', help='profile the run with cProfile and dump the pstats data to this file')
+    parser.add_argument('--trace', action='store_true', help='print the convergence of every iteration')
+    parser.add_argument('--optimize', action='store_true', help='search the allowed recipes and planets for the cheapest selections, write material_selections_optimized.json and selection_report.csv')
+    parser.add_argument('--all-options', action='store_true', help='with --optimize, consider every recipe and planet producing a material instead of its *_options entry')
+    parser.add_argument('--sensitivity', default=None, metavar='TICKERS', help='comma separated materials to write cost shares and downstream sensitivities for (sensitivity_<ticker>.csv)')
+    parser.add_argument('--history', nargs='?', const='price_history.sqlite', default=None, metavar='FILE', help='append the solved prices to a price history store (default file: price_history.sqlite)')
+    parser.add_argument('--history-runs', action='store_true', help='list the runs in the price history store and exit')
+    parser.add_argument('--history-series', default=None, metavar='KEY', help='print the price changes of a material, recipe or planet/material and exit')
+    parser.add_argument('--history-table', choices=sorted(PRICE_TABLES.keys()), default='material_costs', help='table of --history-series')
+    parser.add_argument('--history-days', type=float, default=None, help='limit --history-runs and --history-series to the last days')
+    parser.add_argument('--history-diff', type=int, nargs=2, default=None, metavar=('RUN_A', 'RUN_B'), help='write the prices that differ between two runs to history_diff.csv and exit')
+    parser.add_argument('--monte-carlo', default=None, metavar='FILE', help='JSON sample count and distributions of resource factors, recipe times, ROI and repair periods and the pioneer cost; writes percentiles of every material and recipe cost (uses --processes)')
+    parser.add_argument('--plan-base', default=None, metavar='FILE', help='JSON building mix to price as a complete base on every planet (or the listed ones), ranked in expansion_plan.csv')
+    parser.add_argument('--planet-materials', default=None, metavar='FILE', help='JSON file with build and repair quantity rules of planet materials, replacing or adding to the default rules')
+    parser.add_argument('--area-limit', type=float, default=BASE_AREA_LIMIT, help='plot area available to each single building base')
+    args = parser.parse_args()
+    # username = input('username:')
+    # password = getpass.getpass('password:')
+    if args.history_runs or args.history_series or args.history_diff:
+        history = PriceHistoryStore(args.history or 'price_history.sqlite')
+        if args.history_runs:
+            for run in history.list_runs(args.history_days):
+                print('run {}: {}, {} changes, data {}, selections {}, settings {}, ROI {} days, repair {} days, pioneer cost {}'.format(run['run_id'], time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['created_at'])), run['changed'], run['data_hash'][:12] if run['data_hash'] else None, run['selections_hash'][:12], run['settings_hash'][:12] if run['settings_hash'] else None, run['roi_period_days'], run['repair_period_days'], run['pioneer_cost']))
+        if args.history_series:
+            for point in history.price_series(args.history_table, args.history_series, args.history_days):
+                print('run {} ({}): {}'.format(point['run_id'], time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(point['created_at'])), 'removed' if point['price'] is None else point['price']['total_cost']))
+        if args.history_diff:
+            changes = history.diff_runs(*args.history_diff)
+            write_history_diff('history_diff.csv', changes)
+            print('{} prices changed between run {} and run {}, written to history_diff.csv'.format(len(changes), *args.history_diff))
+        history.close()
+        sys.exit()
+
+    if args.planet_materials is not None:
+        configure_planet_material_quantities(load_planet_material_quantities(args.planet_materials))
+
+    instrumentation.configure(args.instrument is not None, args.trace, args.instrument is not None)
+    if args.instrument is not None:
+        atexit.register(instrumentation.write_json, args.instrument)
+    if args.profile is not None:
+        profiler = cProfile.Profile()
+        atexit.register(lambda: (profiler.disable(), profiler.dump_stats(args.profile), pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)))
+        profiler.enable()
+
+    store = FIODataStore(args.data_store)
+    if args.refresh:
+        store.invalidate()
+    with instrumentation.stage('load data'):
+        buildings, recipes, materials, planets = load_FNAR_data(store, None if args.max_age_days is None else args.max_age_days*24*60*60, base_url=args.base_url)
+        # hash the data before it is indexed and annotated with the selections
+        data_hash = None if args.history is None else calculate_input_hash(buildings, recipes, materials, planets)
+        materials_byID = index_materials(recipes, materials, planets)
+
+    with instrumentation.stage('base setups'):
+        layout_cache = store.load_base_layouts()
+        base_setups = calculate_base_setups(buildings, args.area_limit, layout_cache)
+        store.store_base_layouts(layout_cache)
     
     # printAllMaterialOptions = True
     # with open('material_options.txt', 'wt') as file:
@@ -387,206 +2991,154 @@ if __name__ == '__main__':
     #         if printAllMaterialOptions or optionsGT1:
     #             print('{}: {}| {}.'.format(material['Ticker'], recipe_list, planet_list),file=file)
     
-    with open('material_selections.json', 'rt') as file:
-        recipe_selections = json.load(file)
+    recipe_selections = load_recipe_selections('material_selections.json')
+    baskets = WORKFORCE_BASKETS if args.baskets is None else load_workforce_baskets(args.baskets)
+    settings_hash = None if args.history is None else calculate_settings_hash(baskets, args.area_limit)
+    if args.plan_base:
+        # check the mix before pricing anything
+        building_mix, planet_list = load_building_mix(args.plan_base, buildings, recipes, planets, materials_byID)
+
+    if args.scenarios:
+        scenarios = load_scenarios(args.scenarios, recipe_selections, args.pioneer_cost, baskets)
+        start_time = time.perf_counter()
+        results = price_scenarios(scenarios, buildings, recipes, materials, planets, materials_byID, base_setups, args.processes)
+        print('Priced {} scenarios in {} s'.format(len(results), time.perf_counter() - start_time))
+        for result in results:
+            for line in result['output'].splitlines():
+                if line.startswith('ERROR'):
+                    print('{}: {}'.format(result['name'], line))
+            if 'error' in result:
+                print('ERROR: scenario {} failed: {}'.format(result['name'], result['error']))
+        results = [result for result in results if 'error' not in result]
+        write_scenario_comparison('scenario_material_costs.csv', ['material'], results, 'materials')
+        write_scenario_comparison('scenario_recipe_costs.csv', ['recipe'], results, 'recipes')
+        write_scenario_comparison('scenario_natural_resource_costs.csv', ['planet', 'material'], results, 'natural_resources')
+        sys.exit()
+
+    if args.monte_carlo:
+        settings = load_monte_carlo_settings(args.monte_carlo)
+        settings.setdefault('pioneer_cost', args.pioneer_cost)
+        start_time = time.perf_counter()
+        with instrumentation.stage('monte carlo'):
+            results = run_monte_carlo(settings, buildings, recipes, materials, planets, materials_byID, base_setups, recipe_selections, args.processes, baskets=baskets)
+        print('Priced {} Monte Carlo samples in {} s ({} failed)'.format(results['samples'], time.perf_counter() - start_time, results['failed']))
+        write_monte_carlo_statistics('monte_carlo_material_costs.csv', 'material', results['materials'], results['percentiles'])
+        write_monte_carlo_statistics('monte_carlo_recipe_costs.csv', 'recipe', results['recipes'], results['percentiles'])
+        sys.exit()
+
+    if args.optimize:
+        pricer = IncrementalPricer(buildings, recipes, materials, planets, materials_byID, base_setups, recipe_selections, args.pioneer_cost, baskets)
+        original_costs = {material: population_cost_to_currency(row[0], pricer.workforce_costs) for material, row in pricer.material_rows.items()}
+        candidates = get_selection_candidates(recipe_selections, materials, args.all_options)
+        print('Optimizing the selections of {} materials over {} candidates'.format(len(candidates), sum(len(options) for options in candidates.values())))
+        optimize_recipe_selections(pricer, candidates)
+        with open('material_selections_optimized.json', 'w') as file:
+            json.dump(dict(recipe_selections, **{material: pricer.recipe_selections[material] for material in candidates.keys()}), file, indent=4)
+        write_selection_report('selection_report.csv', recipe_selections, original_costs, pricer)
+        sys.exit()
+
+    if args.serve is not None:
+        store.close()
+        service = PricingService(args.data_store, 'material_selections.json', buildings, recipes, materials, planets, materials_byID, base_setups, None if args.max_age_days is None else args.max_age_days*24*60*60, args.base_url, args.area_limit, pioneer_cost=args.pioneer_cost, baskets=baskets)
+        serve_prices(service, args.host, args.serve)
+        sys.exit()
+
+    if args.watch:
+        pricer = IncrementalPricer(buildings, recipes, materials, planets, materials_byID, base_setups, recipe_selections, args.pioneer_cost, baskets)
+        history = None if args.history is None else PriceHistoryStore(args.history)
+        with create_price_writer(args.output_format, args.output_path) as writer:
+            pricer.write_outputs(writer)
+            if history is not None:
+                record_price_history(history, data_hash, settings_hash, recipe_selections, pricer.pioneer_cost, pricer.workforce_costs, pricer.material_rows.items(), pricer.recipe_rows.items(), pricer.natural_resource_rows.items())
+            print('Watching material_selections.json for changes')
+            watch_selections(pricer, 'material_selections.json', writer, history=history, data_hash=data_hash, settings_hash=settings_hash)
 
     # initialize costs
-    material_costs = {}
+    with instrumentation.stage('initialize material costs'):
+        material_costs, material_info = initialize_material_costs(materials, recipes, planets, buildings, materials_byID, recipe_selections)
     input_costs = {}
     repair_costs = {}
     desired_profit = {}
     total_costs = {}
-    input_costs_new = {}
-    repair_costs_new = {}
-    total_costs_new = {}
-    for material in materials.keys():
-        planet_specific_materials = ['MCG']
-        if not recipe_selections[material]:
-            continue
-        elif '=>' in recipe_selections[material]:
-            recipe = recipes[recipe_selections[material]]
-            output = 0
-            for cur in recipe['Outputs']:
-                if cur['Ticker'] == material:
-                    output = cur['Amount']
-        else:
-            planet = planets[recipe_selections[material]]
-            planet_specific_materials = get_planet_build_requirements(planet)
-            materialinfo = {}
-            for resource in planet['Resources']:
-                if materials_byID[resource['MaterialId']] == material:
-                    materialinfo = resource
-                    materialinfo['Ticker'] = material
-                    break
-            if 'ResourceType' not in materialinfo:
-                print('ERROR: {} not found.'.format(material))
-            
-            recipe_key, output = get_recipe_output_from_material_type(materialinfo['ResourceType'], materialinfo['Factor'])
-            recipe = recipes[recipe_key]
-
-        # print('{},{},{}'.format(material, recipe['StandardRecipeName'], output))
-        material_costs[material] = calculate_population_cost(output, buildings[recipe['BuildingTicker']], recipe['TimeMs'])
-        material_costs[material].Extras['recipe'] = recipe
-        material_costs[material].Extras['output'] = output
-        material_costs[material].Extras['planet_mats'] = planet_specific_materials
+    for material in material_costs.keys():
         input_costs[material] = PopulationCost()
         repair_costs[material] = PopulationCost()
         desired_profit[material] = PopulationCost()
         total_costs[material] = PopulationCost()
 
-    # iterate over materials to find final cost
-    for n in range(100):
-        max_diff_elem = {'diff':-1, 'mat':''}
-        for material in material_costs.keys():
-            
-            input_costs_temp, repair_costs_temp, desired_profit_temp, total_costs_temp = calculate_total_cost(material, material_costs[material].Extras['output'], material_costs[material].Extras['recipe']['Inputs'], buildings[material_costs[material].Extras['recipe']['BuildingTicker']]['BuildingCosts'], material_costs[material].Extras['recipe']['TimeMs'], buildings[material_costs[material].Extras['recipe']['BuildingTicker']]['AreaCost'], material_costs[material].Extras['planet_mats'], material_costs, input_costs, repair_costs, desired_profit, material_costs[material], base_setups[material_costs[material].Extras['recipe']['BuildingTicker']])
-            population_diff = total_costs_temp - total_costs[material]
-            diff_sum = population_diff.Pioneer+population_diff.Settler+population_diff.Technician+population_diff.Engineer+population_diff.Scientist
-            if diff_sum > max_diff_elem['diff']:
-                max_diff_elem['diff'] = diff_sum
-                max_diff_elem['mat'] = material
-            input_costs[material] = input_costs_temp
-            repair_costs[material] = repair_costs_temp
-            desired_profit[material] = desired_profit_temp
-            total_costs[material] = total_costs_temp
-            # if input_costs_temp != input_costs[material]:
-            #     print("input_costs_temp ({}) does not equal input_costs[{}] ({})".format(input_costs_temp, material, input_costs[material]))
-            # if repair_costs_temp != repair_costs[material]:
-            #     print("repair_costs_temp ({}) does not equal repair_costs[{}] ({})".format(repair_costs_temp, material, repair_costs[material]))
-            # if total_costs_temp != total_costs[material]:
-            #     print("total_costs_temp ({}) does not equal total_costs[{}] ({})".format(total_costs_temp, material, total_costs[material]))
-        print('Largest difference: {} {} ({}, {}, {}, {}, {})'.format(max_diff_elem['mat'], max_diff_elem['diff'], total_costs[max_diff_elem['mat']].Pioneer, total_costs[max_diff_elem['mat']].Settler, total_costs[max_diff_elem['mat']].Technician, total_costs[max_diff_elem['mat']].Engineer, total_costs[max_diff_elem['mat']].Scientist))
-        if max_diff_elem['diff'] < 0.001:
-            print('Iterations completed at n={}'.format(n))
-            break
+    solve_start_time = time.perf_counter()
+    with instrumentation.stage('material solve'):
+        if args.solver in ['jacobi', 'colored']:
+            input_costs, repair_costs, desired_profit, total_costs, solver_stats = solve_material_costs_jacobi(material_costs, material_info, buildings, base_setups, args.solver, args.acceleration, args.processes)
+        elif args.solver == 'direct':
+            input_costs, repair_costs, desired_profit, total_costs, solver_stats = solve_material_costs_direct(material_costs, material_info, buildings, base_setups)
+        elif args.solver == 'scc':
+            input_costs, repair_costs, desired_profit, total_costs, solver_stats = solve_material_costs_scc(material_costs, material_info, buildings, base_setups)
+        else:
+            input_costs, repair_costs, desired_profit, total_costs, solver_stats = solve_material_costs_iterative(material_costs, material_info, buildings, base_setups, input_costs, repair_costs, desired_profit, total_costs)
+    instrumentation.record('material solve', solver_stats)
+    if args.solver == 'scc':
+        print('{} components, {} cycles'.format(solver_stats['components'], len(solver_stats['cycles'])))
+        for cycle in solver_stats['cycles'][:5]:
+            print('Cycle of {} materials solved in {} s: {}'.format(cycle['size'], cycle['time'], ','.join(cycle['materials'])))
+    print('Material solve ({}): {} iterations, residual {}, {} s'.format(solver_stats['solver'] if 'acceleration' not in solver_stats else '{}, {}'.format(solver_stats['solver'], solver_stats['acceleration']), solver_stats['iterations'], solver_stats['residual'], time.perf_counter() - solve_start_time))
+    if args.compare_iterative and args.solver != 'iterative':
+        # the material by material loop from zero costs, on its own copies
+        compare_start_time = time.perf_counter()
+        zero_costs = lambda: {material: PopulationCost() for material in material_costs.keys()}
+        compare_stats = solve_material_costs_iterative(material_costs, material_info, buildings, base_setups, zero_costs(), zero_costs(), zero_costs(), zero_costs())[4]
+        print('Material solve (iterative): {} iterations, residual {}, {} s'.format(compare_stats['iterations'], compare_stats['residual'], time.perf_counter() - compare_start_time))
 
-    # Cost all recipes based on the selected material recipes
-    
+    with instrumentation.stage('workforce costs'):
+        workforce_costs = calculate_workforce_costs(total_costs, args.pioneer_cost, baskets)
+    instrumentation.record('workforce costs', dict(zip(POPULATION_TYPES, workforce_costs)))
+    print('Workforce costs: PIO: {}, SET: {}, TEC: {}, ENG: {}, SCI: {}'.format(*workforce_costs))
+    if args.workforce_sweep:
+        with open(args.workforce_sweep, 'rt') as file:
+            sweep = calculate_workforce_cost_sweep(total_costs, json.load(file), baskets, args.pioneer_cost)
+        with open('workforce_sweep.csv', 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['name', 'pioneer cost', 'PIO', 'SET', 'TEC', 'ENG', 'SCI', 'error'])
+            for result in sweep:
+                writer.writerow([result['name'], result['pioneer_cost']] + result.get('workforce_costs', ['']*5) + [result.get('error', '')])
 
-    # calculate costs for workers
-    PIO = PopulationCost()
-    SET = PopulationCost()
-    TEC = PopulationCost()
-    ENG = PopulationCost()
-    SCI = PopulationCost()
-    # consumable costs per day per 100 units of population
-    for item in [{'mat':'COF','amount':0.5},{'mat':'DW','amount':4},{'mat':'RAT','amount':4},{'mat':'OVE','amount':0.5},{'mat':'PWO','amount':0.2}]:
-        PIO = PIO + total_costs[item['mat']]*item['amount']
-    for item in [{'mat':'DW','amount':5},{'mat':'RAT','amount':6},{'mat':'KOM','amount':1},{'mat':'EXO','amount':0.5},{'mat':'REP','amount':0.2},{'mat':'PT','amount':0.5}]:
-        SET = SET + total_costs[item['mat']]*item['amount']
-    for item in [{'mat':'DW','amount':7.5},{'mat':'RAT','amount':7},{'mat':'ALE','amount':1},{'mat':'MED','amount':0.5},{'mat':'SC','amount':0.1},{'mat':'HMS','amount':0.5},{'mat':'SCN','amount':0.1}]:
-        TEC = TEC + total_costs[item['mat']]*item['amount']
-    for item in [{'mat':'DW','amount':10},{'mat':'MED','amount':0.5},{'mat':'GIN','amount':1},{'mat':'FIM','amount':7},{'mat':'VG','amount':0.2},{'mat':'HSS','amount':0.2},{'mat':'PDA','amount':0.1}]:
-        ENG = ENG + total_costs[item['mat']]*item['amount']
-    for item in [{'mat':'DW','amount':10},{'mat':'MED','amount':0.5},{'mat':'WIN','amount':1},{'mat':'MEA','amount':7},{'mat':'NST','amount':0.1},{'mat':'LC','amount':0.2},{'mat':'WS','amount':0.1}]:
-        SCI = SCI + total_costs[item['mat']]*item['amount']
-    
-    # scale to 1 unit of population per ms.
-    Apio = PIO.Pioneer/100/DAY_TIME_MS
-    Bpio = PIO.Settler/100/DAY_TIME_MS
-    Cpio = PIO.Technician/100/DAY_TIME_MS
-    Dpio = PIO.Engineer/100/DAY_TIME_MS
-    Epio = PIO.Scientist/100/DAY_TIME_MS
-    
-    Aset = SET.Pioneer/100/DAY_TIME_MS
-    Bset = SET.Settler/100/DAY_TIME_MS
-    Cset = SET.Technician/100/DAY_TIME_MS
-    Dset = SET.Engineer/100/DAY_TIME_MS
-    Eset = SET.Scientist/100/DAY_TIME_MS
-    
-    Atec = TEC.Pioneer/100/DAY_TIME_MS
-    Btec = TEC.Settler/100/DAY_TIME_MS
-    Ctec = TEC.Technician/100/DAY_TIME_MS
-    Dtec = TEC.Engineer/100/DAY_TIME_MS
-    Etec = TEC.Scientist/100/DAY_TIME_MS
-    
-    Aeng = ENG.Pioneer/100/DAY_TIME_MS
-    Beng = ENG.Settler/100/DAY_TIME_MS
-    Ceng = ENG.Technician/100/DAY_TIME_MS
-    Deng = ENG.Engineer/100/DAY_TIME_MS
-    Eeng = ENG.Scientist/100/DAY_TIME_MS
-    
-    Asci = SCI.Pioneer/100/DAY_TIME_MS
-    Bsci = SCI.Settler/100/DAY_TIME_MS
-    Csci = SCI.Technician/100/DAY_TIME_MS
-    Dsci = SCI.Engineer/100/DAY_TIME_MS
-    Esci = SCI.Scientist/100/DAY_TIME_MS
-
-    PIOc = SETc = TECc = ENGc = SCIc = 500
-    PIOc = 2.0e-7
-    previous = [PIOc, SETc, TECc, ENGc, SCIc]
-    for n in range(100):
-        # PIOc = (            SETc*Bpio + TECc*Cpio + ENGc*Dpio + SCIc*Epio)/(1 - Apio)
-        SETc = (PIOc*Aset +             TECc*Cset + ENGc*Dset + SCIc*Eset)/(1 - Bset)
-        TECc = (PIOc*Atec + SETc*Btec +             ENGc*Dtec + SCIc*Etec)/(1 - Ctec)
-        ENGc = (PIOc*Aeng + SETc*Beng + TECc*Ceng +             SCIc*Eeng)/(1 - Deng)
-        SCIc = (PIOc*Asci + SETc*Bsci + TECc*Csci + ENGc*Dsci            )/(1 - Esci)
-        print('PIO: {}, SET: {}, TEC: {}, ENG: {}, SCI: {}'.format(PIOc, SETc, TECc, ENGc, SCIc))
-        current = [PIOc, SETc, TECc, ENGc, SCIc]
-        test = map(lambda a,b: abs(a-b), current, previous)
-        if max(map(lambda a,b: abs(a-b), current, previous)) < 1e-16:
-            print('iteration finished at n = {}'.format(n))
-            break
-        previous = current
-
-
-    total_costs_ts = {}
-    repair_costs_ts = {}
-    input_costs_ts = {}
-    desired_profit_ts = {}
-    material_costs_ts = {}
-    with open('material_costs.csv', 'w') as file:
-        file.write('{}, {}, {}, {}, {}, {}\n'.format('material', 'total cost', 'repair cost', 'input cost', 'desired profit', 'base unit cost'))
-        for material in total_costs.keys():
-            total_costs_ts[material] = total_costs[material].Pioneer*PIOc + total_costs[material].Settler*SETc + total_costs[material].Technician*TECc + total_costs[material].Engineer*ENGc + total_costs[material].Scientist*SCIc
-            repair_costs_ts[material] = repair_costs[material].Pioneer*PIOc + repair_costs[material].Settler*SETc + repair_costs[material].Technician*TECc + repair_costs[material].Engineer*ENGc + repair_costs[material].Scientist*SCIc
-            input_costs_ts[material] = input_costs[material].Pioneer*PIOc + input_costs[material].Settler*SETc + input_costs[material].Technician*TECc + input_costs[material].Engineer*ENGc + input_costs[material].Scientist*SCIc
-            desired_profit_ts[material] = desired_profit[material].Pioneer*PIOc + desired_profit[material].Settler*SETc + desired_profit[material].Technician*TECc + desired_profit[material].Engineer*ENGc + desired_profit[material].Scientist*SCIc
-            material_costs_ts[material] = material_costs[material].Pioneer*PIOc + material_costs[material].Settler*SETc + material_costs[material].Technician*TECc + material_costs[material].Engineer*ENGc + material_costs[material].Scientist*SCIc
-            file.write('{}, {}, {}, {}, {}, {}\n'.format(material, total_costs_ts[material], repair_costs_ts[material], input_costs_ts[material], desired_profit_ts[material], material_costs_ts[material]))
-    
-    with open('recipe_costs.csv', 'w') as file:
-        file.write('{}, {}, {}, {}, {}, {}\n'.format('recipe', 'total cost', 'repair cost', 'input cost', 'desired profit', 'base recipe cost'))
-        planet_mats = ['MCG']
-        for recipe in recipes.values():
-            if not recipe['Outputs']:
+    if args.sensitivity:
+        with instrumentation.stage('sensitivity'):
+            sensitivity = MaterialCostSensitivity(build_material_cost_system(material_info, buildings, base_setups), material_costs, total_costs, workforce_costs)
+        for material in args.sensitivity.split(','):
+            if material not in sensitivity.position:
+                print('ERROR: {} has no cost'.format(material))
                 continue
-            recipe_time = recipe['TimeMs']
-            building = buildings[recipe['BuildingTicker']]
-            recipe_cost = calculate_population_cost(1, building, recipe_time)
-            input_costs_temp, repair_costs_temp, desired_profit_temp, total_costs_temp = calculate_total_cost('', 1, recipe['Inputs'], building['BuildingCosts'], recipe['TimeMs'], building['AreaCost'], planet_mats, material_costs, input_costs, repair_costs, desired_profit, recipe_cost, base_setups[recipe['BuildingTicker']], False)
-
-            total_costs_temp_ts = total_costs_temp.Pioneer*PIOc + total_costs_temp.Settler*SETc + total_costs_temp.Technician*TECc + total_costs_temp.Engineer*ENGc + total_costs_temp.Scientist*SCIc
-            repair_costs_temp_ts = repair_costs_temp.Pioneer*PIOc + repair_costs_temp.Settler*SETc + repair_costs_temp.Technician*TECc + repair_costs_temp.Engineer*ENGc + repair_costs_temp.Scientist*SCIc
-            input_costs_temp_ts = input_costs_temp.Pioneer*PIOc + input_costs_temp.Settler*SETc + input_costs_temp.Technician*TECc + input_costs_temp.Engineer*ENGc + input_costs_temp.Scientist*SCIc
-            desired_profit_ts = desired_profit_temp.Pioneer*PIOc + desired_profit_temp.Settler*SETc + desired_profit_temp.Technician*TECc + desired_profit_temp.Engineer*ENGc + desired_profit_temp.Scientist*SCIc
-            recipe_cost_ts = recipe_cost.Pioneer*PIOc + recipe_cost.Settler*SETc + recipe_cost.Technician*TECc + recipe_cost.Engineer*ENGc + recipe_cost.Scientist*SCIc
-            file.write('{}, {}, {}, {}, {}, {}\n'.format(recipe['StandardRecipeName'], total_costs_temp_ts, repair_costs_temp_ts, input_costs_temp_ts, desired_profit_ts, recipe_cost_ts))
-    
-    with open('natural_resource_costs.csv','w') as file:
-        file.write('{}, {}, {}, {}, {}, {}, {}\n'.format('planet', 'material', 'total cost', 'repair cost', 'input cost', 'desired profit', 'base recipe cost'))
-        natural_resource_building_cost = {}
-        for building_ticker in ['COL', 'EXT', 'RIG']:
-            recipe_key = '{}:=>'.format(building_ticker)
-            recipe_time = recipes[recipe_key]['TimeMs']
-            building = buildings[building_ticker]
-            natural_resource_building_cost[recipe_key] = calculate_population_cost(1, building, recipe_time)
-        
-        for planet in planets.values():
-            planet_specific_materials = get_planet_build_requirements(planet)
-            for item in planet['Resources']:
-                material_ticker = materials_byID[item['MaterialId']]
-                recipe_key, output = get_recipe_output_from_material_type(item['ResourceType'], item['Factor'])
-                recipe = recipes[recipe_key]
-                building = buildings[recipe['BuildingTicker']]
-                base_cost = {}
-                base_cost = natural_resource_building_cost[recipe_key]/output
-                
-                input_costs_temp, repair_costs_temp, desired_profit_temp, total_costs_temp = calculate_total_cost('', output, recipe['Inputs'], building['BuildingCosts'], recipe['TimeMs'], building['AreaCost'], planet_specific_materials, material_costs, input_costs, repair_costs, desired_profit, base_cost, base_setups[recipe['BuildingTicker']], False)
-
-                total_costs_temp_ts = total_costs_temp.Pioneer*PIOc + total_costs_temp.Settler*SETc + total_costs_temp.Technician*TECc + total_costs_temp.Engineer*ENGc + total_costs_temp.Scientist*SCIc
-                repair_costs_temp_ts = repair_costs_temp.Pioneer*PIOc + repair_costs_temp.Settler*SETc + repair_costs_temp.Technician*TECc + repair_costs_temp.Engineer*ENGc + repair_costs_temp.Scientist*SCIc
-                input_costs_temp_ts = input_costs_temp.Pioneer*PIOc + input_costs_temp.Settler*SETc + input_costs_temp.Technician*TECc + input_costs_temp.Engineer*ENGc + input_costs_temp.Scientist*SCIc
-                desired_profit_temp_ts = desired_profit_temp.Pioneer*PIOc + desired_profit_temp.Settler*SETc + desired_profit_temp.Technician*TECc + desired_profit_temp.Engineer*ENGc + desired_profit_temp.Scientist*SCIc
-                base_cost_ts = base_cost.Pioneer*PIOc + base_cost.Settler*SETc + base_cost.Technician*TECc + base_cost.Engineer*ENGc + base_cost.Scientist*SCIc
-                file.write('{}, {}, {}, {}, {}, {}, {}\n'.format(planet['PlanetNaturalId'], material_ticker, total_costs_temp_ts, repair_costs_temp_ts, input_costs_temp_ts, desired_profit_ts, base_cost_ts))
\ No newline at end of file
+            write_sensitivity_report('sensitivity_{}.csv'.format(material), sensitivity, material)
+            print('{} cost drivers: {}'.format(material, ', '.join('{} {} {}'.format(part['material'], part['channel'], part['cost']) for part in sensitivity.attribution(material)[:5])))
+
+    if args.plan_base:
+        with instrumentation.stage('expansion plan'):
+            planner = ExpansionPlanner(buildings, recipes, planets, materials_byID, base_setups, total_costs, workforce_costs)
+            plan = planner.plan(building_mix, planet_list)
+        write_expansion_plan('expansion_plan.csv', plan)
+        print('Planned the base on {} planets, written to expansion_plan.csv'.format(len(plan)))
+        for result in plan[:5]:
+            print('{}: build cost {}, daily upkeep {}, payback days {}'.format(result['planet'], result['build_cost'], result['daily_upkeep'], result['payback_days']))
+
+    with instrumentation.stage('material rows'):
+        material_rows = calculate_material_cost_rows(material_costs, input_costs, repair_costs, desired_profit, total_costs)
+    with instrumentation.stage('recipe rows'):
+        recipe_rows = calculate_recipe_cost_rows(recipes, buildings, base_setups, material_costs, input_costs, repair_costs, desired_profit)
+    if args.processes is not None and args.processes > 1:
+        with instrumentation.stage('natural resource rows'):
+            natural_resource_rows = calculate_natural_resource_cost_rows(planets, recipes, buildings, base_setups, materials_byID, material_costs, input_costs, repair_costs, desired_profit, processes=args.processes).items()
+    else:
+        # streamed, so the natural resource rows are timed as part of their writer
+        natural_resource_rows = iterate_natural_resource_cost_rows(planets, recipes, buildings, base_setups, materials_byID, material_costs, input_costs, repair_costs, desired_profit)
+    if args.history is not None:
+        # the rows are needed twice, so they are not streamed
+        natural_resource_rows = list(natural_resource_rows)
+    with create_price_writer(args.output_format, args.output_path) as writer:
+        write_price_tables(writer, workforce_costs, material_rows.items(), recipe_rows.items(), natural_resource_rows)
+    if args.history is not None:
+        with instrumentation.stage('price history'):
+            history = PriceHistoryStore(args.history)
+            run_id, changed = record_price_history(history, data_hash, settings_hash, recipe_selections, args.pioneer_cost, workforce_costs, material_rows.items(), recipe_rows.items(), natural_resource_rows)
+            history.close()
+        print('Recorded run {} in {} ({} changed prices)'.format(run_id, args.history, changed))
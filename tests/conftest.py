@@ -0,0 +1,49 @@
+import os
+import sys
+
+# the calculator is a single script in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import hashlib
+import threading
+import http.server
+
+import pytest
+
+class FNARStandInHandler(http.server.BaseHTTPRequestHandler):
+    # Answers GET <path> with the JSON array in datasets[path], with an ETag of its content
+    datasets = {}
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path not in self.datasets:
+            self.send_error(404)
+            return
+        data = json.dumps(self.datasets[self.path]).encode('utf-8')
+        etag = '"{}"'.format(hashlib.sha1(data).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def fnar_server():
+    # Local stand-in of the FNAR REST API.  Yields the base url and the handler class, whose datasets
+    # ({path: list of items}) the test fills in and whose requests it can inspect.
+    handler = type('FNARStandIn', (FNARStandInHandler,), {'datasets': {}, 'requests': []})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1]), handler
+    server.shutdown()
+    server.server_close()
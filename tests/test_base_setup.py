@@ -0,0 +1,45 @@
+import random
+
+import KAWAROIPriceCalculator as calc
+
+HABITATION_AREAS = {'HB1': 10, 'HB2': 12, 'HB3': 14, 'HB4': 16, 'HB5': 18, 'HBB': 14, 'HBC': 17, 'HBM': 20, 'HBL': 22}
+
+def make_buildings(population, area_cost):
+    buildings = {ticker: {'Ticker': ticker, 'Pioneers': 0, 'Settlers': 0, 'Technicians': 0, 'Engineers': 0, 'Scientists': 0, 'AreaCost': area, 'BuildingCosts': []} for ticker, area in HABITATION_AREAS.items()}
+    pioneers, settlers, technicians, engineers, scientists = population
+    buildings['TST'] = {'Ticker': 'TST', 'Pioneers': pioneers, 'Settlers': settlers, 'Technicians': technicians, 'Engineers': engineers, 'Scientists': scientists, 'AreaCost': area_cost, 'BuildingCosts': []}
+    return buildings
+
+def stepping_building_count(buildings, area_limit):
+    # the original search: add buildings one at a time until the base exceeds the area limit
+    building_count = 1
+    while calculate_area(buildings, building_count) <= area_limit:
+        building_count = building_count + 1
+    return building_count - 1
+
+def calculate_area(buildings, building_count):
+    building = buildings['TST']
+    building_list = calc.calculate_habitation_needs(building['Pioneers']*building_count, building['Settlers']*building_count, building['Technicians']*building_count, building['Engineers']*building_count, building['Scientists']*building_count)
+    building_list.append({'Ticker': 'TST', 'Count': building_count})
+    return sum(buildings[entry['Ticker']]['AreaCost']*entry['Count'] for entry in building_list)
+
+def test_area_not_growing_with_count():
+    # the area is 472, 504 and 498 for 60, 61 and 62 buildings: the base stops at 60
+    buildings = make_buildings([10, 11, 0, 0, 0], 6)
+    assert [calculate_area(buildings, count) for count in [60, 61, 62]] == [472, 504, 498]
+    building_list, building_count = calc.calculate_single_building_base_setup('TST', buildings, 500, {})
+    assert building_count == 60
+
+def test_matches_stepping_search():
+    rng = random.Random(1)
+    for n in range(300):
+        population = [0, 0, 0, 0, 0]
+        first = rng.randrange(4)
+        population[first] = rng.randint(1, 60)
+        population[first + 1] = rng.choice([0, rng.randint(1, 60)])
+        buildings = make_buildings(population, rng.randint(5, 40))
+        area_limit = rng.choice([250, 500, 1000])
+        if calculate_area(buildings, 1) > area_limit:
+            continue
+        building_list, building_count = calc.calculate_single_building_base_setup('TST', buildings, area_limit, {})
+        assert building_count == stepping_building_count(buildings, area_limit), (population, buildings['TST']['AreaCost'], area_limit)
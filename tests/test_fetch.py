@@ -0,0 +1,113 @@
+import gzip
+import io
+import json
+import threading
+import http.server
+import urllib.error
+
+import pytest
+
+import KAWAROIPriceCalculator as calc
+
+ITEMS = [
+    {'Ticker': 'FE', 'Name': 'iron, "refined"', 'Amount': 12345.678e-3},
+    {'Ticker': 'H2O', 'Name': 'wäter ✓', 'Nested': [1, [2, 3], {'a': ']'}], 'Amount': -7},
+    {'Ticker': 'LST', 'Name': '', 'Amount': 0, 'Flag': None},
+    ]
+
+def read_items(text, chunk_size):
+    return list(calc.iterate_json_array(io.BytesIO(text.encode('utf-8')), chunk_size))
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 64, 1 << 16])
+def test_items_across_chunk_boundaries(chunk_size):
+    assert read_items(json.dumps(ITEMS, ensure_ascii=False), chunk_size) == ITEMS
+    assert read_items(json.dumps(ITEMS, indent=2), chunk_size) == ITEMS
+    assert read_items('[1, 23, 456.5, -7e2]', chunk_size) == [1, 23, 456.5, -700.0]
+
+@pytest.mark.parametrize('text', ['[]', ' [ ] ', '\n[\n]\n'])
+def test_empty_array(text):
+    assert read_items(text, 1) == []
+    assert read_items(text, 1 << 16) == []
+
+@pytest.mark.parametrize('text', ['', '{"a": 1}', '[1, 2', '[{"a": 1}'])
+def test_invalid_array(text):
+    with pytest.raises(ValueError):
+        read_items(text, 3)
+
+class FNARHandler(http.server.BaseHTTPRequestHandler):
+    # /items answers with ETag "v1" (gzipped when asked for) and 304 to a matching If-None-Match, /flaky fails
+    # with 503 until it was asked failures times, /missing is a 404
+    failures = 0
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, dict(self.headers)))
+        if self.path == '/flaky' and len([path for path, headers in self.requests if path == '/flaky']) <= self.failures:
+            self.send_error(503)
+            return
+        if self.path not in ['/items', '/flaky']:
+            self.send_error(404)
+            return
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        data = json.dumps(ITEMS).encode('utf-8')
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            data = gzip.compress(data)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', '"v1"')
+        self.send_header('Last-Modified', 'Sun, 18 Oct 2026 10:00:00 GMT')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    handler = type('TestFNARHandler', (FNARHandler,), {'failures': 0, 'requests': []})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server, handler, 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+def test_gzip_download(server):
+    server, handler, base_url = server
+    items, etag, last_modified = calc.fetch_FNAR_dataset(base_url, '/items', 'Ticker', backoff_seconds=0)
+    assert items == {item['Ticker']: item for item in ITEMS}
+    assert etag == '"v1"'
+    assert last_modified == 'Sun, 18 Oct 2026 10:00:00 GMT'
+    assert handler.requests[0][1]['Accept-Encoding'] == 'gzip'
+
+def test_not_modified(server):
+    server, handler, base_url = server
+    validators = {'etag': '"v1"', 'last_modified': 'Sun, 18 Oct 2026 10:00:00 GMT'}
+    items, etag, last_modified = calc.fetch_FNAR_dataset(base_url, '/items', 'Ticker', validators, backoff_seconds=0)
+    assert items is None
+    assert (etag, last_modified) == ('"v1"', 'Sun, 18 Oct 2026 10:00:00 GMT')
+    assert handler.requests[0][1]['If-None-Match'] == '"v1"'
+
+def test_retry_after_server_errors(server):
+    server, handler, base_url = server
+    handler.failures = 2
+    items, etag, last_modified = calc.fetch_FNAR_dataset(base_url, '/flaky', 'Ticker', retries=2, backoff_seconds=0)
+    assert len(items) == len(ITEMS)
+    assert len(handler.requests) == 3
+
+def test_retries_run_out(server):
+    server, handler, base_url = server
+    handler.failures = 5
+    with pytest.raises(urllib.error.HTTPError):
+        calc.fetch_FNAR_dataset(base_url, '/flaky', 'Ticker', retries=2, backoff_seconds=0)
+    assert len(handler.requests) == 3
+
+def test_client_errors_not_retried(server):
+    server, handler, base_url = server
+    with pytest.raises(urllib.error.HTTPError):
+        calc.fetch_FNAR_dataset(base_url, '/missing', 'Ticker', backoff_seconds=0)
+    assert len(handler.requests) == 1
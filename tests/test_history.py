@@ -0,0 +1,75 @@
+import pytest
+
+import KAWAROIPriceCalculator as calc
+
+def record(history, materials, resources = (), settings_hash = 'settings'):
+    inputs = {'data_hash': 'data', 'selections_hash': 'selections', 'settings_hash': settings_hash, 'roi_period_days': 30, 'repair_period_days': 60, 'pioneer_cost': 2e-7, 'workforce_costs': [2e-7, 3e-8, 4e-8, 5e-8, 6e-8]}
+    tables = {
+        'material_costs': [[key] + values for key, values in materials.items()],
+        'natural_resource_costs': [list(key) + values for key, values in resources],
+        }
+    return history.record_run(inputs, tables)
+
+@pytest.fixture
+def history(tmp_path):
+    history = calc.PriceHistoryStore(str(tmp_path / 'price_history.sqlite'))
+    yield history
+    history.close()
+
+def test_record_run_stores_changes_only(history):
+    assert record(history, {'A': [1, 2, 3, 4, 5], 'B': [6, 7, 8, 9, 10]}, [(('P1', 'FE'), [1, 1, 1, 1, 1])]) == (1, 3)
+    # unchanged prices, also within the relative tolerance, store nothing
+    assert record(history, {'A': [1, 2, 3, 4, 5*(1 + 1e-14)], 'B': [6, 7, 8, 9, 10]}, [(('P1', 'FE'), [1, 1, 1, 1, 1])]) == (2, 0)
+    # A changed, B removed, C added, the resource removed
+    assert record(history, {'A': [1.5, 2, 3, 4, 5], 'C': [1, 1, 1, 1, 1]}, settings_hash='other') == (3, 4)
+
+    assert history.get_price('material_costs', 'A', 2) == dict(zip(calc.PRICE_HISTORY_COLUMNS, [1, 2, 3, 4, 5]))
+    assert history.get_price('material_costs', 'A', 3)['total_cost'] == 1.5
+    assert history.get_price('material_costs', 'B', 2)['total_cost'] == 6
+    assert history.get_price('material_costs', 'B', 3) is None
+    assert history.get_price('material_costs', 'C', 2) is None
+    assert history.get_price('natural_resource_costs', 'P1/FE', 1)['total_cost'] == 1
+    assert history.get_price('natural_resource_costs', 'P1/FE', 3) is None
+    # the run after a removal only stores what changed again
+    assert record(history, {'A': [1.5, 2, 3, 4, 5], 'B': [6, 7, 8, 9, 10], 'C': [1, 1, 1, 1, 1]}) == (4, 1)
+    assert history.get_price('material_costs', 'B', 4)['total_cost'] == 6
+
+    runs = history.list_runs()
+    assert [run['changed'] for run in runs] == [3, 0, 4, 1]
+    assert [run['settings_hash'] for run in runs] == ['settings', 'settings', 'other', 'settings']
+    assert runs[0]['workforce_costs'] == [2e-7, 3e-8, 4e-8, 5e-8, 6e-8]
+
+def test_price_series(history):
+    record(history, {'A': [1, 0, 0, 0, 0], 'B': [2, 0, 0, 0, 0]})
+    record(history, {'A': [1, 0, 0, 0, 0], 'B': [3, 0, 0, 0, 0]})
+    record(history, {'A': [4, 0, 0, 0, 0]})
+    assert [(point['run_id'], point['price']['total_cost']) for point in history.price_series('material_costs', 'A')] == [(1, 1), (3, 4)]
+    assert [(point['run_id'], point['price'] and point['price']['total_cost']) for point in history.price_series('material_costs', 'B')] == [(1, 2), (2, 3), (3, None)]
+    assert history.price_series('material_costs', 'X') == []
+    # all runs are younger than a day
+    assert [point['run_id'] for point in history.price_series('material_costs', 'A', 1)] == [1, 3]
+
+def test_diff_runs(history):
+    record(history, {'A': [1, 0, 0, 0, 0], 'B': [2, 0, 0, 0, 0]})
+    record(history, {'A': [1, 0, 0, 0, 0], 'B': [3, 0, 0, 0, 0], 'C': [5, 0, 0, 0, 0]})
+    record(history, {'A': [1, 0, 0, 0, 0], 'B': [2, 0, 0, 0, 0], 'C': [5, 0, 0, 0, 0]})
+    record(history, {'B': [2, 0, 0, 0, 0], 'C': [5, 0, 0, 0, 0]})
+    changes = {change['key']: change for change in history.diff_runs(1, 2)}
+    assert sorted(changes.keys()) == ['B', 'C']
+    assert (changes['B']['before']['total_cost'], changes['B']['after']['total_cost']) == (2, 3)
+    assert changes['C']['before'] is None and changes['C']['after']['total_cost'] == 5
+    # B changed and changed back
+    assert [change['key'] for change in history.diff_runs(1, 3)] == ['C']
+    assert history.diff_runs(3, 1) == history.diff_runs(1, 3)
+    changes = history.diff_runs(3, 4)
+    assert [(change['key'], change['after']) for change in changes] == [('A', None)]
+    assert history.diff_runs(2, 2) == []
+
+def test_schema_version_checked(tmp_path):
+    path = str(tmp_path / 'price_history.sqlite')
+    history = calc.PriceHistoryStore(path)
+    with history.connection:
+        history.connection.execute("UPDATE metadata SET value = '99' WHERE key = 'schema_version'")
+    history.close()
+    with pytest.raises(Exception, match='schema version 99'):
+        calc.PriceHistoryStore(path)
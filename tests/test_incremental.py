@@ -0,0 +1,32 @@
+import KAWAROIPriceCalculator as calc
+import KAWAROIPriceBenchmark as benchmark
+
+def make_pricer(recipe_selections):
+    buildings, recipes, materials, planets, selections = benchmark.generate_universe(0.1, 3)
+    materials_byID = calc.index_materials(recipes, materials, planets)
+    base_setups = calc.calculate_base_setups(buildings, calc.BASE_AREA_LIMIT, {})
+    return calc.IncrementalPricer(buildings, recipes, materials, planets, materials_byID, base_setups, dict(selections, **recipe_selections))
+
+def test_update_keeps_full_run_order():
+    pricer = make_pricer({})
+    selections = dict(pricer.recipe_selections)
+    changed = {}
+    for material in pricer.materials.keys():
+        options = selections.get(material + '_options', '').split(',')
+        if len(options) > 1:
+            changed[material] = options[1]
+        if len(changed) == 3:
+            break
+    assert len(changed) == 3
+    stats = pricer.update_selections(dict(selections, **changed))
+    assert sorted(stats['changed']) == sorted(changed.keys())
+
+    full = make_pricer(changed)
+    assert list(pricer.material_rows.keys()) == list(full.material_rows.keys())
+    assert list(pricer.recipe_rows.keys()) == list(full.recipe_rows.keys())
+    assert list(pricer.material_info.keys()) == list(full.material_info.keys())
+    for material, row in full.material_rows.items():
+        for population in calc.POPULATION_TYPES:
+            value = getattr(pricer.material_rows[material][0], population)
+            expected = getattr(row[0], population)
+            assert abs(value - expected) <= 1e-9*max(1, abs(expected))
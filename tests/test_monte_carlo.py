@@ -0,0 +1,72 @@
+import json
+import math
+
+import pytest
+
+import KAWAROIPriceCalculator as calc
+import KAWAROIPriceBenchmark as benchmark
+
+@pytest.fixture(scope='module')
+def universe():
+    buildings, recipes, materials, planets, selections = benchmark.generate_universe(0.1, 3)
+    materials_byID = calc.index_materials(recipes, materials, planets)
+    base_setups = calc.calculate_base_setups(buildings, calc.BASE_AREA_LIMIT, {})
+    return buildings, recipes, materials, planets, materials_byID, base_setups, selections
+
+SPREAD_SETTINGS = {
+    'samples': 40,
+    'seed': 7,
+    'percentiles': [0, 5, 25, 50, 75, 95, 100],
+    'factor': {'distribution': 'lognormal', 'mu': 0, 'sigma': 0.2},
+    'time': {'distribution': 'triangular', 'low': 0.8, 'mode': 1, 'high': 1.3},
+    'roi_period_days': {'distribution': 'uniform', 'low': 20, 'high': 60},
+    'pioneer_cost': {'distribution': 'normal', 'mean': calc.PIONEER_COST, 'sd': 0.1*calc.PIONEER_COST},
+    }
+
+def test_zero_width_reproduces_nominal_costs(universe):
+    buildings, recipes, materials, planets, materials_byID, base_setups, selections = universe
+    settings = {
+        'samples': 6,
+        'factor': {'distribution': 'uniform', 'low': 1, 'high': 1},
+        'time': {'distribution': 'triangular', 'low': 1, 'mode': 1, 'high': 1},
+        'roi_period_days': {'distribution': 'normal', 'mean': calc.ROI_PERIOD_DAYS, 'sd': 0},
+        'repair_period_days': calc.REPAIR_PERIOD_DAYS,
+        'pioneer_cost': {'distribution': 'lognormal', 'mu': math.log(calc.PIONEER_COST), 'sigma': 0},
+        }
+    result = calc.run_monte_carlo(settings, buildings, recipes, materials, planets, materials_byID, base_setups, selections)
+    assert (result['samples'], result['failed']) == (6, 0)
+    assert result['percentiles'] == calc.MONTE_CARLO_PERCENTILES
+
+    pricer = calc.IncrementalPricer(buildings, recipes, materials, planets, materials_byID, base_setups, selections)
+    for statistics, rows in [(result['materials'], pricer.material_rows), (result['recipes'], pricer.recipe_rows)]:
+        assert sorted(statistics.keys()) == sorted(rows.keys())
+        for key, row in rows.items():
+            nominal = calc.population_cost_to_currency(row[0], pricer.workforce_costs)
+            assert statistics[key]['mean'] == pytest.approx(nominal, rel=1e-9)
+            assert statistics[key]['percentiles'] == pytest.approx([nominal]*len(calc.MONTE_CARLO_PERCENTILES), rel=1e-9)
+
+def test_bands_ordered(universe):
+    buildings, recipes, materials, planets, materials_byID, base_setups, selections = universe
+    result = calc.run_monte_carlo(SPREAD_SETTINGS, buildings, recipes, materials, planets, materials_byID, base_setups, selections)
+    assert result['samples'] + result['failed'] == 40 and result['samples'] > 0
+    widths = []
+    for statistics in list(result['materials'].values()) + list(result['recipes'].values()):
+        percentiles = statistics['percentiles']
+        assert percentiles == sorted(percentiles)
+        # percentiles 0 and 100 are the smallest and largest sample
+        assert percentiles[0] <= statistics['mean'] <= percentiles[-1]
+        widths.append(percentiles[-2] - percentiles[1])
+    assert min(widths) > 0
+
+def test_processes_do_not_change_results(universe):
+    buildings, recipes, materials, planets, materials_byID, base_setups, selections = universe
+    settings = dict(SPREAD_SETTINGS, samples=12)
+    serial = calc.run_monte_carlo(settings, buildings, recipes, materials, planets, materials_byID, base_setups, selections, chunk_size=5)
+    parallel = calc.run_monte_carlo(settings, buildings, recipes, materials, planets, materials_byID, base_setups, selections, processes=2, chunk_size=3)
+    assert parallel == serial
+
+def test_unknown_distribution(tmp_path):
+    settings_file = tmp_path / 'monte_carlo.json'
+    settings_file.write_text(json.dumps({'samples': 10, 'time': {'distribution': 'cauchy'}}))
+    with pytest.raises(Exception, match='Unknown distribution of time: cauchy'):
+        calc.load_monte_carlo_settings(str(settings_file))
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+import KAWAROIPriceCalculator as calc
+import KAWAROIPriceBenchmark as benchmark
+
+@pytest.fixture(scope='module')
+def pricer():
+    buildings, recipes, materials, planets, selections = benchmark.generate_universe(0.1, 3)
+    materials_byID = calc.index_materials(recipes, materials, planets)
+    base_setups = calc.calculate_base_setups(buildings, calc.BASE_AREA_LIMIT, {})
+    return calc.IncrementalPricer(buildings, recipes, materials, planets, materials_byID, base_setups, selections)
+
+def load_mix(pricer, tmp_path, mix):
+    mix_file = tmp_path / 'mix.json'
+    mix_file.write_text(json.dumps(mix))
+    return calc.load_building_mix(str(mix_file), pricer.buildings, pricer.recipes, pricer.planets, pricer.materials_byID)
+
+def make_planner(pricer, total_costs = None):
+    return calc.ExpansionPlanner(pricer.buildings, pricer.recipes, pricer.planets, pricer.materials_byID, pricer.base_setups, pricer.total_costs if total_costs is None else total_costs, pricer.workforce_costs)
+
+def find_resource(pricer, resource_type):
+    for planet in pricer.planets.values():
+        for item in planet['Resources']:
+            if item['ResourceType'] == resource_type:
+                return pricer.materials_byID[item['MaterialId']]
+
+def test_mix_without_workers(pricer, tmp_path):
+    building_mix, planet_list = load_mix(pricer, tmp_path, {'buildings': [{'building': 'HB1', 'count': 2}]})
+    planner = make_planner(pricer)
+    compiled_mix = planner.compile_mix(building_mix)
+    assert compiled_mix['buildings'] == {'HB1': 2}
+    assert compiled_mix['daily_workforce'] == 0
+    assert planner.plan(building_mix)
+
+def test_unknown_tickers_rejected(pricer, tmp_path):
+    with pytest.raises(Exception, match='Unknown building'):
+        load_mix(pricer, tmp_path, {'buildings': [{'building': 'XXX'}]})
+    with pytest.raises(Exception, match='Unknown recipe'):
+        load_mix(pricer, tmp_path, {'buildings': [{'building': 'P1', 'recipe': 'P1:=>'}]})
+    with pytest.raises(Exception, match='Unknown resource'):
+        load_mix(pricer, tmp_path, {'buildings': [{'building': 'EXT', 'resource': 'XXX'}]})
+    with pytest.raises(Exception, match='is extracted with RIG, not EXT'):
+        load_mix(pricer, tmp_path, {'buildings': [{'building': 'EXT', 'resource': find_resource(pricer, 'LIQUID')}]})
+
+def test_extraction_planned(pricer, tmp_path):
+    resource = find_resource(pricer, 'MINERAL')
+    building_mix, planet_list = load_mix(pricer, tmp_path, {'buildings': [{'building': 'EXT', 'count': 3, 'resource': resource}]})
+    plan = make_planner(pricer).plan(building_mix)
+    assert plan
+    assert all(result['daily_production'] > 0 for result in plan)
+    assert len(plan) == len([planet for planet in pricer.planets.values() if any(pricer.materials_byID[item['MaterialId']] == resource for item in planet['Resources'])])
+
+def test_material_without_cost(pricer, tmp_path):
+    recipe = next(recipe for recipe in pricer.recipes.values() if recipe['Inputs'] and recipe['BuildingTicker'].startswith('P'))
+    building_mix, planet_list = load_mix(pricer, tmp_path, {'buildings': [{'building': recipe['BuildingTicker'], 'recipe': recipe['StandardRecipeName']}]})
+    missing = recipe['Inputs'][0]['Ticker']
+    planner = make_planner(pricer, {material: cost for material, cost in pricer.total_costs.items() if material != missing})
+    with pytest.raises(Exception, match='Error in compile_mix.  Materials of the base without a cost: .*{}'.format(missing)):
+        planner.plan(building_mix)
@@ -0,0 +1,43 @@
+import pytest
+
+import KAWAROIPriceCalculator as calc
+import KAWAROIPriceBenchmark as benchmark
+
+@pytest.fixture(scope='module')
+def pricer():
+    buildings, recipes, materials, planets, selections = benchmark.generate_universe(0.1, 3)
+    materials_byID = calc.index_materials(recipes, materials, planets)
+    base_setups = calc.calculate_base_setups(buildings, calc.BASE_AREA_LIMIT, {})
+    return calc.IncrementalPricer(buildings, recipes, materials, planets, materials_byID, base_setups, selections)
+
+def assert_costs_close(value, expected):
+    for population in calc.POPULATION_TYPES:
+        assert getattr(value, population) == pytest.approx(getattr(expected, population), rel=1e-12, abs=1e-300)
+
+def test_recipes_on_planets_match_calculate_total_cost(pricer):
+    # one planet for every distinct set of build requirements
+    planet_list = list({tuple(calc.get_planet_build_requirements(planet)): planet_id for planet_id, planet in pricer.planets.items()}.values())
+    assert len(planet_list) > 1
+    batch_pricer = calc.RecipeBatchPricer(pricer.buildings, pricer.base_setups, pricer.material_costs, pricer.input_costs, pricer.repair_costs, pricer.desired_profit)
+    rows = batch_pricer.price_recipes_on_planets(pricer.recipes.keys(), pricer.recipes, pricer.planets, planet_list)
+    recipe_list = [recipe_name for recipe_name, recipe in pricer.recipes.items() if recipe['Outputs']]
+    assert list(rows.keys()) == [(planet_id, recipe_name) for planet_id in planet_list for recipe_name in recipe_list]
+
+    quantity_table = calc.BuildQuantityTable(pricer.buildings, pricer.base_setups)
+    for planet_id in planet_list:
+        planet_mats = calc.get_planet_build_requirements(pricer.planets[planet_id])
+        for recipe_name in recipe_list:
+            recipe = pricer.recipes[recipe_name]
+            base_cost = calc.calculate_population_cost(1, pricer.buildings[recipe['BuildingTicker']], recipe['TimeMs'])
+            input_costs, repair_costs, desired_profit, total_costs = calc.calculate_total_cost('', 1, recipe['Inputs'], quantity_table.get(recipe['BuildingTicker'], planet_mats), recipe['TimeMs'], pricer.material_costs, pricer.input_costs, pricer.repair_costs, pricer.desired_profit, base_cost, False)
+            for value, expected in zip(rows[(planet_id, recipe_name)], [total_costs, repair_costs, input_costs, desired_profit, base_cost]):
+                assert_costs_close(value, expected)
+
+def test_default_planet_matches_price_recipes(pricer):
+    # a planet with MCG as its only build requirement prices like the planet independent recipe rows
+    planet_id = next(planet_id for planet_id, planet in pricer.planets.items() if calc.get_planet_build_requirements(planet) == ['MCG'])
+    batch_pricer = calc.RecipeBatchPricer(pricer.buildings, pricer.base_setups, pricer.material_costs, pricer.input_costs, pricer.repair_costs, pricer.desired_profit)
+    rows = batch_pricer.price_recipes_on_planets(pricer.recipes.keys(), pricer.recipes, pricer.planets, [planet_id])
+    for recipe_name, row in pricer.recipe_rows.items():
+        for value, expected in zip(rows[(planet_id, recipe_name)], row):
+            assert_costs_close(value, expected)
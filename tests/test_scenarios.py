@@ -0,0 +1,20 @@
+import KAWAROIPriceCalculator as calc
+import KAWAROIPriceBenchmark as benchmark
+
+def test_failing_scenario_keeps_batch():
+    buildings, recipes, materials, planets, selections = benchmark.generate_universe(0.1, 3)
+    materials_byID = calc.index_materials(recipes, materials, planets)
+    base_setups = calc.calculate_base_setups(buildings, calc.BASE_AREA_LIMIT, {})
+    material = next(material for material in materials.keys() if '=>' in selections[material])
+    scenarios = [
+        {'name': 'base', 'selections': selections},
+        {'name': 'broken', 'selections': dict(selections, **{material: 'P0:=>1x' + material})},
+        {'name': 'roi60', 'selections': selections, 'roi_period_days': 60},
+        ]
+    for processes in [1, 2]:
+        results = calc.price_scenarios(scenarios, buildings, recipes, materials, planets, materials_byID, base_setups, processes)
+        assert [result['name'] for result in results] == ['base', 'broken', 'roi60']
+        assert 'error' in results[1] and 'materials' not in results[1]
+        assert 'error' not in results[0] and 'error' not in results[2]
+        assert results[0]['materials'][material][0] != results[2]['materials'][material][0]
+        assert all('output' in result for result in results)
@@ -0,0 +1,74 @@
+import pytest
+
+import KAWAROIPriceCalculator as calc
+import KAWAROIPriceBenchmark as benchmark
+
+STEP = 1e-4
+
+@pytest.fixture(scope='module')
+def universe():
+    buildings, recipes, materials, planets, selections = benchmark.generate_universe(0.1, 3)
+    materials_byID = calc.index_materials(recipes, materials, planets)
+    base_setups = calc.calculate_base_setups(buildings, calc.BASE_AREA_LIMIT, {})
+    material_costs, material_info = calc.initialize_material_costs(materials, recipes, planets, buildings, materials_byID, selections)
+    system = calc.build_material_cost_system(material_info, buildings, base_setups)
+    total_costs = solve_total_costs(material_costs, material_info, buildings, base_setups)
+    workforce_costs = calc.calculate_workforce_costs(total_costs)
+    sensitivity = calc.MaterialCostSensitivity(system, material_costs, total_costs, workforce_costs)
+    # the materials depending on most others
+    materials = sorted(material_info.keys(), key=lambda material: len(sensitivity.inverse[material]))[-5:]
+    return material_costs, material_info, buildings, base_setups, workforce_costs, sensitivity, materials
+
+def solve_total_costs(material_costs, material_info, buildings, base_setups):
+    return calc.solve_material_costs_direct(material_costs, material_info, buildings, base_setups)[3].to_dict()
+
+def currency_costs(total_costs, workforce_costs):
+    return {material: calc.population_cost_to_currency(cost, workforce_costs) for material, cost in total_costs.items()}
+
+def perturbed_costs(universe, material):
+    # currency total costs of all materials with the base cost of one material STEP higher
+    material_costs, material_info, buildings, base_setups, workforce_costs, sensitivity, materials = universe
+    perturbed = dict(material_costs, **{material: material_costs[material]*(1 + STEP)})
+    return currency_costs(solve_total_costs(perturbed, material_info, buildings, base_setups), workforce_costs)
+
+def test_base_cost_elasticities_match_finite_differences(universe):
+    material_costs, material_info, buildings, base_setups, workforce_costs, sensitivity, materials = universe
+    for material in materials:
+        elasticities = sensitivity.base_cost_elasticities(material)
+        assert len(elasticities) > 1
+        for mat_ticker, elasticity in elasticities.items():
+            costs = perturbed_costs(universe, mat_ticker)
+            difference = (costs[material]/sensitivity.total_currency[material] - 1)/STEP
+            assert difference == pytest.approx(elasticity, rel=1e-6, abs=1e-9)
+
+def test_downstream_elasticities_match_finite_differences(universe):
+    material_costs, material_info, buildings, base_setups, workforce_costs, sensitivity, materials = universe
+    for material in materials[:2] + [min(sensitivity.inverse_columns.keys(), key=lambda mat_ticker: len(sensitivity.inverse[mat_ticker]))]:
+        costs = perturbed_costs(universe, material)
+        change = costs[material]/sensitivity.total_currency[material] - 1
+        elasticities = sensitivity.downstream_elasticities(material)
+        assert elasticities[material] == pytest.approx(1)
+        for mat_ticker, elasticity in elasticities.items():
+            assert (costs[mat_ticker]/sensitivity.total_currency[mat_ticker] - 1)/change == pytest.approx(elasticity, rel=1e-6, abs=1e-9)
+
+def test_workforce_elasticities_match_finite_differences(universe):
+    material_costs, material_info, buildings, base_setups, workforce_costs, sensitivity, materials = universe
+    for material in materials:
+        elasticities = sensitivity.workforce_elasticities(material)
+        for n, population in enumerate(calc.POPULATION_TYPES):
+            perturbed = list(workforce_costs)
+            perturbed[n] = perturbed[n]*(1 + STEP)
+            cost = calc.population_cost_to_currency(sensitivity.total_costs[material], perturbed)
+            assert (cost/sensitivity.total_currency[material] - 1)/STEP == pytest.approx(elasticities[population], rel=1e-6, abs=1e-9)
+
+def test_shares_sum_to_one(universe):
+    material_costs, material_info, buildings, base_setups, workforce_costs, sensitivity, materials = universe
+    for material in sensitivity.order:
+        if not sensitivity.total_currency[material]:
+            continue
+        assert sum(sensitivity.base_cost_elasticities(material).values()) == pytest.approx(1, rel=1e-9)
+        assert sum(sensitivity.workforce_elasticities(material).values()) == pytest.approx(1, rel=1e-9)
+        # the one level attribution adds up to the total cost
+        parts = sensitivity.attribution(material)
+        assert sum(part['cost'] for part in parts) == pytest.approx(sensitivity.total_currency[material], rel=1e-9)
+        assert [part['cost'] for part in parts] == sorted((part['cost'] for part in parts), reverse=True)
@@ -0,0 +1,128 @@
+import os
+import time
+import json
+import threading
+import http.server
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import pytest
+
+import KAWAROIPriceCalculator as calc
+import KAWAROIPriceBenchmark as benchmark
+
+@pytest.fixture
+def service(tmp_path):
+    buildings, recipes, materials, planets, selections = benchmark.generate_universe(0.1, 3)
+    materials_byID = calc.index_materials(recipes, materials, planets)
+    base_setups = calc.calculate_base_setups(buildings, calc.BASE_AREA_LIMIT, {})
+    selections_file = tmp_path / 'material_selections.json'
+    selections_file.write_text(json.dumps(selections))
+    service = calc.PricingService(str(tmp_path / 'fio_data.sqlite'), str(selections_file), buildings, recipes, materials, planets, materials_byID, base_setups)
+    handler = type('TestPricingRequestHandler', (calc.PricingRequestHandler,), {'service': service})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    service.test_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    yield service
+    server.shutdown()
+    server.server_close()
+
+def request(service, path, method = 'GET'):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(service.test_url + path, method=method)) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+def test_queries(service):
+    material = next(iter(service.pricer.material_rows.keys()))
+    status, body = request(service, '/materials/{}'.format(material))
+    assert status == 200
+    assert body['material'] == material and body['version'] == 1
+    assert body['total cost'] == pytest.approx(service.snapshot.materials[material]['total cost'])
+
+    recipe = next(iter(service.pricer.recipe_rows.keys()))
+    status, body = request(service, '/recipes/{}'.format(urllib.parse.quote(recipe)))
+    assert status == 200 and body['recipe'] == recipe
+
+    planet, resource = next(iter(service.pricer.natural_resource_rows.keys()))
+    status, body = request(service, '/resources/{}/{}'.format(planet, resource))
+    assert status == 200 and (body['planet'], body['material']) == (planet, resource)
+
+    status, body = request(service, '/status')
+    assert status == 200 and body['materials'] == len(service.pricer.material_rows)
+
+    assert request(service, '/materials/NOPE')[0] == 404
+    assert request(service, '/nothing')[0] == 404
+
+def test_recipe_on_planet(service):
+    recipe = next(iter(service.pricer.recipe_rows.keys()))
+    planet_id = next(planet_id for planet_id, planet in service.pricer.planets.items() if calc.get_planet_build_requirements(planet) != ['MCG'])
+    status, body = request(service, '/recipes/{}/{}'.format(urllib.parse.quote(recipe), planet_id))
+    assert status == 200
+    assert (body['recipe'], body['planet']) == (recipe, planet_id)
+    status, plain = request(service, '/recipes/{}'.format(urllib.parse.quote(recipe)))
+    assert body['input cost'] == pytest.approx(plain['input cost'])
+    assert body['total cost'] != pytest.approx(plain['total cost'])
+    assert request(service, '/recipes/{}/NOPE'.format(urllib.parse.quote(recipe)))[0] == 404
+    assert request(service, '/recipes/NOPE/{}'.format(planet_id))[0] == 404
+
+def test_pioneer_cost_rescales(service):
+    status, workforce = request(service, '/workforce')
+    status, body = request(service, '/workforce?pioneer_cost={}'.format(2*workforce['Pioneer']))
+    assert status == 200
+    for population in calc.POPULATION_TYPES:
+        assert body[population] == pytest.approx(2*workforce[population])
+    material = next(iter(service.pricer.material_rows.keys()))
+    status, plain = request(service, '/materials/{}'.format(material))
+    status, body = request(service, '/materials/{}?pioneer_cost={}'.format(material, 3*workforce['Pioneer']))
+    assert body['total cost'] == pytest.approx(3*plain['total cost'])
+    assert body['population'] == plain['population']
+    for pioneer_cost in ['abc', '0', '-1', 'nan', 'inf', '-inf', '']:
+        assert request(service, '/workforce?pioneer_cost={}'.format(pioneer_cost))[0] == 400
+
+def test_refresh_request(service):
+    status, body = request(service, '/refresh', 'POST')
+    assert status == 202 and body['version'] == 1
+    assert service.refresh_requested.is_set()
+    assert request(service, '/other', 'POST')[0] == 404
+
+def test_selection_change_publishes_version(service):
+    selections = calc.load_recipe_selections(service.selections_file)
+    material = next(material for material in service.pricer.materials.keys() if len(selections.get(material + '_options', '').split(',')) > 1)
+    old_status, old_body = request(service, '/materials/{}'.format(material))
+    selections[material] = selections[material + '_options'].split(',')[1]
+    with open(service.selections_file, 'w') as file:
+        json.dump(selections, file)
+    os.utime(service.selections_file, (service.selections_modified + 10, service.selections_modified + 10))
+    service.check_selections()
+    status, body = request(service, '/materials/{}'.format(material))
+    assert body['version'] == 2
+    assert body['recipe']['StandardRecipeName'] == selections[material]
+    assert old_body['recipe']['StandardRecipeName'] != selections[material]
+
+def test_refresh_resolves_changed_data(service, fnar_server):
+    base_url, handler = fnar_server
+    buildings, recipes, materials, planets, selections = benchmark.generate_universe(0.1, 3)
+    recipe = next(iter(service.pricer.recipe_rows.keys()))
+    recipes[recipe]['TimeMs'] = 2*recipes[recipe]['TimeMs']
+    for dataset, items in zip(calc.FNAR_DATASETS.keys(), [buildings, recipes, materials, planets]):
+        handler.datasets[calc.FNAR_DATASETS[dataset]['path']] = list(items.values())
+    status, old_body = request(service, '/recipes/{}'.format(urllib.parse.quote(recipe)))
+
+    service.base_url = base_url
+    service.poll_seconds = 0.01
+    service.start()
+    try:
+        assert request(service, '/refresh', 'POST')[0] == 202
+        deadline = time.time() + 30
+        while service.snapshot.version < 2 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        service.stop()
+    assert sorted(handler.requests) == sorted(source['path'] for source in calc.FNAR_DATASETS.values())
+    status, body = request(service, '/recipes/{}'.format(urllib.parse.quote(recipe)))
+    assert body['version'] == 2
+    assert body['total cost'] != pytest.approx(old_body['total cost'])
@@ -0,0 +1,58 @@
+import pytest
+
+import KAWAROIPriceCalculator as calc
+import KAWAROIPriceBenchmark as benchmark
+
+@pytest.fixture(scope='module')
+def universe():
+    buildings, recipes, materials, planets, selections = benchmark.generate_universe(0.2, 5)
+    materials_byID = calc.index_materials(recipes, materials, planets)
+    base_setups = calc.calculate_base_setups(buildings, calc.BASE_AREA_LIMIT, {})
+    material_costs, material_info = calc.initialize_material_costs(materials, recipes, planets, buildings, materials_byID, selections)
+    return material_costs, material_info, buildings, base_setups
+
+def assert_tables_close(table, expected, tolerance):
+    assert list(table.keys()) == list(expected.keys())
+    scale = max(expected.max_abs(), 1e-300)
+    assert max(abs(a - b) for a, b in zip(table.values, expected.values)) <= tolerance*scale
+
+def test_solvers_agree(universe):
+    material_costs, material_info, buildings, base_setups = universe
+    solutions = {
+        'direct': calc.solve_material_costs_direct(material_costs, material_info, buildings, base_setups),
+        'scc': calc.solve_material_costs_scc(material_costs, material_info, buildings, base_setups),
+        'jacobi': calc.solve_material_costs_jacobi(material_costs, material_info, buildings, base_setups, 'jacobi'),
+        'colored': calc.solve_material_costs_jacobi(material_costs, material_info, buildings, base_setups, 'colored'),
+        }
+    direct = solutions.pop('direct')
+    assert list(direct[3].keys()) == list(material_info.keys())
+    for solver, solution in solutions.items():
+        for table, expected in zip(solution[:4], direct[:4]):
+            assert_tables_close(table, expected, 1e-8)
+
+@pytest.mark.parametrize('mode', ['jacobi', 'colored'])
+@pytest.mark.parametrize('acceleration', ['none', 'anderson', 'aitken'])
+def test_iterations_converge_to_direct(universe, mode, acceleration, capsys):
+    material_costs, material_info, buildings, base_setups = universe
+    direct = calc.solve_material_costs_direct(material_costs, material_info, buildings, base_setups)
+    solution = calc.solve_material_costs_jacobi(material_costs, material_info, buildings, base_setups, mode, acceleration)
+    stats = solution[4]
+    assert (stats['solver'], stats['acceleration']) == (mode, acceleration)
+    assert stats['iterations'] < 1000
+    assert 'did not converge' not in capsys.readouterr().out
+    for table, expected in zip(solution[:4], direct[:4]):
+        assert_tables_close(table, expected, 1e-8)
+
+def test_parallel_chunks_match_serial(universe):
+    material_costs, material_info, buildings, base_setups = universe
+    serial = calc.solve_material_costs_jacobi(material_costs, material_info, buildings, base_setups, 'colored')
+    parallel = calc.solve_material_costs_jacobi(material_costs, material_info, buildings, base_setups, 'colored', processes=2)
+    assert parallel[4]['iterations'] == serial[4]['iterations']
+    for table, expected in zip(parallel[:4], serial[:4]):
+        assert_tables_close(table, expected, 0)
+
+def test_iteration_limit_warns(universe, capsys):
+    material_costs, material_info, buildings, base_setups = universe
+    solution = calc.solve_material_costs_jacobi(material_costs, material_info, buildings, base_setups, 'jacobi', 'none', max_iterations=2)
+    assert solution[4]['iterations'] == 2
+    assert 'ERROR: the jacobi solve did not converge in 2 iterations' in capsys.readouterr().out
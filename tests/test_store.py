@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import subprocess
+
+import KAWAROIPriceCalculator as calc
+import KAWAROIPriceBenchmark as benchmark
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'KAWAROIPriceCalculator.py')
+
+def serve_universe(handler):
+    buildings, recipes, materials, planets, selections = benchmark.generate_universe(0.1, 3)
+    for dataset, items in zip(calc.FNAR_DATASETS.keys(), [buildings, recipes, materials, planets]):
+        handler.datasets[calc.FNAR_DATASETS[dataset]['path']] = list(items.values())
+    return selections
+
+def run_calculator(directory, *arguments):
+    return subprocess.run([sys.executable, SCRIPT] + list(arguments), cwd=str(directory), capture_output=True, text=True, timeout=300)
+
+def test_refresh_reaches_server(tmp_path, fnar_server):
+    base_url, handler = fnar_server
+    selections = serve_universe(handler)
+    (tmp_path / 'material_selections.json').write_text(json.dumps(selections))
+    paths = sorted(source['path'] for source in calc.FNAR_DATASETS.values())
+
+    result = run_calculator(tmp_path, '--base-url', base_url)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert sorted(handler.requests) == paths
+    # stored datasets without a max age are used as they are
+    result = run_calculator(tmp_path, '--base-url', base_url)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert sorted(handler.requests) == paths
+    result = run_calculator(tmp_path, '--base-url', base_url, '--refresh')
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert sorted(handler.requests) == sorted(paths*2)
+
+def test_invalidated_dataset_is_stale(tmp_path):
+    store = calc.FIODataStore(str(tmp_path / 'fio_data.sqlite'))
+    assert store.is_stale('materials')
+    store.store_dataset('materials', {'FE': {'Ticker': 'FE'}}, 'Ticker')
+    assert not store.is_stale('materials')
+    assert not store.is_stale('materials', 60)
+    store.invalidate('materials')
+    assert store.is_stale('materials')
+    store.close()
+
+def test_schema_version_rebuild(tmp_path, capsys):
+    path = str(tmp_path / 'fio_data.sqlite')
+    store = calc.FIODataStore(path)
+    store.store_dataset('materials', {'FE': {'Ticker': 'FE'}}, 'Ticker', '"v1"')
+    store.store_base_layouts({'key': [1, 2]})
+    store.close()
+    # reopening with the same version keeps the data
+    store = calc.FIODataStore(path)
+    assert store.has_dataset('materials')
+    with store.connection:
+        store.connection.execute("UPDATE metadata SET value = '0' WHERE key = 'schema_version'")
+    store.close()
+    store = calc.FIODataStore(path)
+    assert 'rebuilding' in capsys.readouterr().out
+    assert not store.has_dataset('materials')
+    assert store.load_dataset('materials') == {}
+    assert store.load_base_layouts() == {}
+    assert store.connection.execute("SELECT value FROM metadata WHERE key = 'schema_version'").fetchone()[0] == str(calc.FIO_DATA_STORE_VERSION)
+    store.close()
+
+def test_field_limited_loading(tmp_path):
+    store = calc.FIODataStore(str(tmp_path / 'fio_data.sqlite'))
+    items = {
+        'FE': {'Ticker': 'FE', 'Name': 'iron', 'Weight': 7.8, 'Tags': ['metal']},
+        'AL': {'Ticker': 'AL', 'Name': 'aluminium', 'Weight': 2.7},
+        'H2O': {'Ticker': 'H2O', 'Name': 'water', 'Weight': 0.2, 'Nested': {'a': [1, None]}},
+        }
+    store.store_dataset('materials', items, 'Ticker')
+    assert store.load_dataset('materials') == items
+    assert list(store.load_dataset('materials').keys()) == ['FE', 'AL', 'H2O']
+    assert store.load_dataset('materials', ['Ticker', 'Weight']) == {key: {'Ticker': item['Ticker'], 'Weight': item['Weight']} for key, item in items.items()}
+    assert store.load_dataset('materials', ['Tags']) == {'FE': {'Tags': ['metal']}}
+    # a new download replaces the old entities
+    store.store_dataset('materials', {'AL': {'Ticker': 'AL'}}, 'Ticker')
+    assert store.load_dataset('materials') == {'AL': {'Ticker': 'AL'}}
+    store.close()
+
+def test_validators(tmp_path, fnar_server):
+    base_url, handler = fnar_server
+    handler.datasets['/material/allmaterials'] = [{'Ticker': 'FE', 'Name': 'iron'}]
+    store = calc.FIODataStore(str(tmp_path / 'fio_data.sqlite'))
+    assert store.get_validators('materials') == {'etag': None, 'last_modified': None}
+    assert calc.fetch_FNAR_data(store, ['materials'], base_url) == ['materials']
+    etag = store.get_validators('materials')['etag']
+    assert etag
+    fetched_at = store.connection.execute("SELECT fetched_at FROM datasets WHERE dataset = 'materials'").fetchone()[0]
+
+    # the stored copy is current: nothing changes but the fetch time
+    assert calc.fetch_FNAR_data(store, ['materials'], base_url) == []
+    assert store.get_validators('materials')['etag'] == etag
+    assert store.connection.execute("SELECT fetched_at FROM datasets WHERE dataset = 'materials'").fetchone()[0] >= fetched_at
+
+    handler.datasets['/material/allmaterials'] = [{'Ticker': 'FE', 'Name': 'iron'}, {'Ticker': 'AL', 'Name': 'aluminium'}]
+    assert calc.fetch_FNAR_data(store, ['materials'], base_url) == ['materials']
+    assert store.get_validators('materials')['etag'] != etag
+    assert sorted(store.load_dataset('materials').keys()) == ['AL', 'FE']
+
+    store.invalidate()
+    assert store.get_validators('materials') == {'etag': None, 'last_modified': None}
+    store.close()
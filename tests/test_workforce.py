@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+import KAWAROIPriceCalculator as calc
+import KAWAROIPriceBenchmark as benchmark
+
+def iterate_workforce_costs(coefficients, pioneer_cost, iterations = 1000):
+    # the Gauss-Seidel iteration calculate_workforce_costs used before the linear solve
+    costs = [pioneer_cost, 500, 500, 500, 500]
+    for n in range(iterations):
+        previous = list(costs)
+        for i in range(1, 5):
+            costs[i] = sum(coefficients[i][j]*costs[j] for j in range(5) if j != i)/(1 - coefficients[i][i])
+        if all(abs(cost - old) <= 1e-16*abs(cost) for cost, old in zip(costs, previous)):
+            break
+    return costs
+
+@pytest.fixture(scope='module')
+def total_costs():
+    buildings, recipes, materials, planets, selections = benchmark.generate_universe(0.1, 3)
+    materials_byID = calc.index_materials(recipes, materials, planets)
+    base_setups = calc.calculate_base_setups(buildings, calc.BASE_AREA_LIMIT, {})
+    return calc.IncrementalPricer(buildings, recipes, materials, planets, materials_byID, base_setups, selections).total_costs
+
+def test_solve_matches_iteration(total_costs):
+    coefficients = calc.calculate_workforce_coefficients(total_costs)
+    workforce_costs = calc.calculate_workforce_costs(total_costs)
+    assert workforce_costs[0] == calc.PIONEER_COST
+    assert workforce_costs == pytest.approx(iterate_workforce_costs(coefficients, calc.PIONEER_COST), rel=1e-10)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_solve_matches_iteration_random(seed):
+    # random baskets costing less workforce than they support, so the iteration converges
+    generator = random.Random(seed)
+    coefficients = [[generator.uniform(0, 0.2) for j in range(5)] for i in range(5)]
+    workforce_costs = calc.solve_workforce_costs(coefficients, 3.5)
+    assert workforce_costs == pytest.approx(iterate_workforce_costs(coefficients, 3.5), rel=1e-10)
+    assert calc.solve_workforce_costs(coefficients, 7.0) == pytest.approx([2*cost for cost in workforce_costs], rel=1e-12)
+
+def test_singular_system():
+    # a settler basket costing exactly one settler leaves the settler cost undetermined
+    coefficients = [[0.0]*5 for i in range(5)]
+    coefficients[1][1] = 1.0
+    with pytest.raises(Exception, match='Error in solve_workforce_costs.  The workforce cost system is singular'):
+        calc.solve_workforce_costs(coefficients)
+
+@pytest.mark.parametrize('own_cost, other_cost', [(0.5, 0.5), (1.5, 0.1)])
+def test_negative_solution(own_cost, other_cost):
+    # baskets costing more workforce than they support: the old iteration diverges or ends at negative costs
+    coefficients = [[own_cost if i == j else other_cost for j in range(5)] for i in range(5)]
+    with pytest.raises(Exception, match='Error in solve_workforce_costs.  No non-negative solution'):
+        calc.solve_workforce_costs(coefficients)
+    costs = iterate_workforce_costs(coefficients, calc.PIONEER_COST, 50)
+    assert min(costs) < 0 or max(costs) > 1e6
+
+def test_sweep_reports_failing_variants(total_costs):
+    default_costs = calc.calculate_workforce_costs(total_costs)
+    results = calc.calculate_workforce_cost_sweep(total_costs, [
+        {'name': 'default'},
+        {'name': 'anchor', 'pioneer_cost': 2*calc.PIONEER_COST},
+        {'name': 'missing', 'baskets': {'Settler': [{'mat': 'NOPE', 'amount': 1}]}},
+        ])
+    assert results[0]['workforce_costs'] == pytest.approx(default_costs, rel=1e-12)
+    assert results[1]['workforce_costs'] == pytest.approx([2*cost for cost in default_costs], rel=1e-12)
+    assert 'NOPE' in results[2]['error'] and 'workforce_costs' not in results[2]
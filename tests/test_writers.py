@@ -0,0 +1,84 @@
+import csv
+import sys
+import json
+import sqlite3
+
+import pytest
+
+import KAWAROIPriceCalculator as calc
+
+WORKFORCE_COSTS = [2e-7, 3e-8, 4e-8, 5e-8, 6e-8]
+
+def population_row(seed):
+    return [calc.PopulationCost(seed + n, 2*seed, 0.5*n, seed/3, 1e-5*n) for n in range(5)]
+
+MATERIAL_ROWS = {'FE': population_row(1), 'H2O': population_row(2)}
+RECIPE_ROWS = {'PP1:1xFE-2xLST=>1xBSE': population_row(3), 'odd, "quoted" name': population_row(4), 'line\nbreak': population_row(5)}
+NATURAL_RESOURCE_ROWS = {('PB-000a', 'FEO'): population_row(6), ('PB-001b', 'H2O'): population_row(7)}
+
+def expected_rows(rows):
+    return [key_fields + costs for key_fields, costs in [(list(key) if isinstance(key, tuple) else [key], [calc.population_cost_to_currency(cost, WORKFORCE_COSTS) for cost in row]) for key, row in rows.items()]]
+
+def write(writer):
+    with writer:
+        calc.write_price_tables(writer, WORKFORCE_COSTS, MATERIAL_ROWS.items(), RECIPE_ROWS.items(), NATURAL_RESOURCE_ROWS.items())
+
+def read_back(table, rows):
+    key_count = len(calc.PRICE_TABLES[table]['keys'])
+    return [row[:key_count] + [float(value) for value in row[key_count:]] for row in rows]
+
+def test_csv_round_trip(tmp_path):
+    write(calc.create_price_writer('csv', str(tmp_path)))
+    for table, rows in [('material_costs', MATERIAL_ROWS), ('recipe_costs', RECIPE_ROWS), ('natural_resource_costs', NATURAL_RESOURCE_ROWS)]:
+        with open(tmp_path / (table + '.csv'), newline='') as file:
+            content = list(csv.reader(file))
+        assert content[0] == calc.PRICE_TABLES[table]['keys'] + calc.PRICE_TABLES[table]['costs']
+        assert read_back(table, content[1:]) == expected_rows(rows)
+
+def test_ndjson_round_trip(tmp_path):
+    write(calc.create_price_writer('ndjson', str(tmp_path)))
+    for table, rows in [('material_costs', MATERIAL_ROWS), ('recipe_costs', RECIPE_ROWS), ('natural_resource_costs', NATURAL_RESOURCE_ROWS)]:
+        with open(tmp_path / (table + '.ndjson')) as file:
+            objects = [json.loads(line) for line in file]
+        columns = calc.price_table_columns(table)
+        assert all(list(item.keys()) == columns for item in objects)
+        assert [[item[column] for column in columns] for item in objects] == expected_rows(rows)
+
+def test_sqlite_tables_and_indexes(tmp_path):
+    path = str(tmp_path / 'price_tables.sqlite')
+    # writing twice replaces the tables
+    write(calc.create_price_writer('sqlite', path))
+    write(calc.create_price_writer('sqlite', path))
+    connection = sqlite3.connect(path)
+    try:
+        for table, rows in [('material_costs', MATERIAL_ROWS), ('recipe_costs', RECIPE_ROWS), ('natural_resource_costs', NATURAL_RESOURCE_ROWS)]:
+            columns = [(column[1], column[2]) for column in connection.execute('PRAGMA table_info({})'.format(table))]
+            key_count = len(calc.PRICE_TABLES[table]['keys'])
+            assert columns == [(column, 'TEXT' if n < key_count else 'REAL') for n, column in enumerate(calc.price_table_columns(table))]
+            assert [list(row) for row in connection.execute('SELECT * FROM {} ORDER BY rowid'.format(table))] == expected_rows(rows)
+            indexes = {row[0]: row[1] for row in connection.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'") if row[1] == table}
+            assert sorted(indexes.keys()) == sorted('{}_{}'.format(table, column) for column in calc.PRICE_TABLES[table]['keys'])
+            for column in calc.PRICE_TABLES[table]['keys']:
+                plan = ' '.join(row[-1] for row in connection.execute('EXPLAIN QUERY PLAN SELECT * FROM {} WHERE {} = ?'.format(table, column), ('FE',)))
+                assert '{}_{}'.format(table, column) in plan
+    finally:
+        connection.close()
+
+def test_parquet_round_trip(tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    write(calc.create_price_writer('parquet', str(tmp_path)))
+    for table, rows in [('material_costs', MATERIAL_ROWS), ('recipe_costs', RECIPE_ROWS), ('natural_resource_costs', NATURAL_RESOURCE_ROWS)]:
+        content = pyarrow.parquet.read_table(str(tmp_path / (table + '.parquet'))).to_pydict()
+        columns = calc.price_table_columns(table)
+        assert list(content.keys()) == columns
+        assert [list(row) for row in zip(*[content[column] for column in columns])] == expected_rows(rows)
+
+def test_parquet_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    with pytest.raises(Exception, match='needs pyarrow'):
+        calc.create_price_writer('parquet', str(tmp_path))
+
+def test_unknown_format():
+    with pytest.raises(Exception, match='Unknown output format'):
+        calc.create_price_writer('xml')